@@ -0,0 +1,333 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import ADMISSION_QUEUE_SECONDS, ADMISSION_REJECTED, ADMISSION_WAITING
+
+# Priorities: interactive requests (a client is waiting on the HTTP response)
+# are always served before background work (PDF jobs, ingestion, batches)
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# Per-model slots; ADMISSION_INTERACTIVE_RESERVED of them are never given to
+# background work, so a backlog of PDF jobs cannot hold every slot
+ADMISSION_SLOTS_PER_MODEL = int(os.environ.get(
+    "ADMISSION_SLOTS_PER_MODEL", os.environ.get("OLLAMA_MAX_CONCURRENCY_PER_MODEL", 4)))
+ADMISSION_INTERACTIVE_RESERVED = int(os.environ.get("ADMISSION_INTERACTIVE_RESERVED", 1))
+
+# Interactive requests whose estimated queue wait exceeds the SLO are turned
+# away at once with 503 + Retry-After instead of queueing until they time out
+ADMISSION_QUEUE_SLO_SECONDS = float(os.environ.get("ADMISSION_QUEUE_SLO_SECONDS", 30))
+
+# Token bucket per client: sustained requests per second and burst size.
+# Off by default (0): behind a proxy every request has the proxy's address, so
+# enable it together with ADMISSION_CLIENT_HEADER unless clients connect directly
+ADMISSION_CLIENT_RATE = float(os.environ.get("ADMISSION_CLIENT_RATE", 0))
+ADMISSION_CLIENT_BURST = float(os.environ.get("ADMISSION_CLIENT_BURST", 20))
+# Header identifying the client behind a proxy (e.g. X-Forwarded-For); peer address otherwise
+ADMISSION_CLIENT_HEADER = os.environ.get("ADMISSION_CLIENT_HEADER")
+
+# Weight of the latest slot hold time in the moving average used for the wait estimate
+SERVICE_TIME_SMOOTHING = 0.2
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimited(AdmissionRejected):
+    def __init__(self, retry_after):
+        super().__init__("Too many requests from this client", 429, retry_after)
+
+
+class Overloaded(AdmissionRejected):
+    def __init__(self, model, retry_after):
+        super().__init__(f"Model {model} is overloaded, estimated queue wait {retry_after:.0f}s", 503, retry_after)
+
+
+class _Waiter:
+    def __init__(self, notify):
+        self.notify = notify
+        self.granted = False
+
+
+class ModelSlots:
+    """
+    Concurrency slots of one model with two priority queues.
+
+    A released slot goes to the oldest interactive waiter, then to the oldest
+    background waiter. Waiters are notified through a callback, so threads
+    and asyncio tasks share the same slots.
+    """
+
+    def __init__(self, model, capacity=ADMISSION_SLOTS_PER_MODEL, reserved=ADMISSION_INTERACTIVE_RESERVED,
+                 slo_seconds=ADMISSION_QUEUE_SLO_SECONDS):
+        self.model = model
+        self.capacity = max(1, capacity)
+        # A single slot cannot be reserved without starving background work
+        self.background_capacity = max(1, self.capacity - reserved)
+        self.slo_seconds = slo_seconds
+        self.service_seconds = None
+        self.in_use = {priority: 0 for priority in PRIORITIES}
+        self.waiters = {priority: deque() for priority in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def _has_room(self, priority):
+        if sum(self.in_use.values()) >= self.capacity:
+            return False
+        return priority == PRIORITY_INTERACTIVE or self.in_use[PRIORITY_BACKGROUND] < self.background_capacity
+
+    def estimated_wait(self, priority):
+        """Seconds a new request of this priority would wait for a slot"""
+        with self._lock:
+            return self._estimated_wait(priority)
+
+    def _estimated_wait(self, priority):
+        if self._has_room(priority) and not self.waiters[priority]:
+            return 0.0
+        # Slots free up at capacity / service time; interactive requests only
+        # queue behind interactive ones
+        ahead = len(self.waiters[PRIORITY_INTERACTIVE])
+        capacity = self.capacity
+        if priority == PRIORITY_BACKGROUND:
+            ahead += len(self.waiters[PRIORITY_BACKGROUND])
+            capacity = self.background_capacity
+        return (ahead + 1) * (self.service_seconds or 0.0) / capacity
+
+    def _enqueue(self, priority, notify):
+        """Take a free slot (returns None) or queue a waiter; raises Overloaded past the SLO"""
+        if priority not in self.waiters:
+            raise ValueError(f"Unknown priority {priority!r}")
+        with self._lock:
+            if self._has_room(priority) and not self.waiters[PRIORITY_INTERACTIVE] and not (
+                    priority == PRIORITY_BACKGROUND and self.waiters[PRIORITY_BACKGROUND]):
+                self.in_use[priority] += 1
+                return None
+            if priority == PRIORITY_INTERACTIVE and self.slo_seconds:
+                wait = self._estimated_wait(priority)
+                if wait > self.slo_seconds:
+                    ADMISSION_REJECTED.inc(model=self.model, reason="overloaded")
+                    raise Overloaded(self.model, wait)
+            waiter = _Waiter(notify)
+            self.waiters[priority].append(waiter)
+            return waiter
+
+    def _dispatch(self):
+        # Called with the lock held: hand free slots to waiters, interactive first
+        for priority in PRIORITIES:
+            queue = self.waiters[priority]
+            while queue and self._has_room(priority):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self.in_use[priority] += 1
+                waiter.notify()
+
+    def _cancel(self, priority, waiter):
+        """Give up waiting; returns True if the slot was granted meanwhile (caller must release)"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self.waiters[priority].remove(waiter)
+            return False
+
+    def release(self, priority, held_seconds=None):
+        with self._lock:
+            self.in_use[priority] -= 1
+            if held_seconds is not None:
+                if self.service_seconds is None:
+                    self.service_seconds = held_seconds
+                else:
+                    self.service_seconds += SERVICE_TIME_SMOOTHING * (held_seconds - self.service_seconds)
+            self._dispatch()
+
+    def acquire(self, priority=PRIORITY_BACKGROUND):
+        """Block until a slot is free, returns the seconds waited"""
+        started = time.perf_counter()
+        granted = threading.Event()
+        waiter = self._enqueue(priority, granted.set)
+        if waiter is not None:
+            try:
+                granted.wait()
+            except BaseException:
+                if self._cancel(priority, waiter):
+                    self.release(priority)
+                raise
+        return self._observe_wait(priority, started)
+
+    async def acquire_async(self, priority=PRIORITY_BACKGROUND):
+        """acquire() for asyncio tasks: waits without blocking the event loop"""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(priority, notify)
+        if waiter is not None:
+            try:
+                await granted
+            except BaseException:
+                if self._cancel(priority, waiter):
+                    self.release(priority)
+                raise
+        return self._observe_wait(priority, started)
+
+    def _observe_wait(self, priority, started):
+        waited = time.perf_counter() - started
+        ADMISSION_QUEUE_SECONDS.observe(waited, model=self.model, priority=priority)
+        return waited
+
+    def waiting(self):
+        with self._lock:
+            return {priority: len(queue) for priority, queue in self.waiters.items()}
+
+    def outstanding(self):
+        """Requests holding or waiting for a slot"""
+        with self._lock:
+            return sum(self.in_use.values()) + sum(len(queue) for queue in self.waiters.values())
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to burst; each request takes one"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take a token, returns 0 or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ClientRateLimiter:
+    """
+    Token bucket per client, in front of the whole app rather than of one
+    Ollama server: a client has one budget whichever backend serves it
+    (limits are per worker process).
+    """
+
+    def __init__(self, rate=ADMISSION_CLIENT_RATE, burst=ADMISSION_CLIENT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def check(self, client):
+        """Count a request of a client; raises RateLimited when its bucket is empty"""
+        if not self.rate:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                    self._forget_idle_clients()
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            retry_after = bucket.take()
+        if retry_after:
+            ADMISSION_REJECTED.inc(model="", reason="rate_limited")
+            raise RateLimited(retry_after)
+
+    def _forget_idle_clients(self):
+        # A bucket that has refilled completely holds no state worth keeping
+        now = time.monotonic()
+        for client, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[client]
+
+
+class AdmissionController:
+    """
+    Admission in front of one Ollama server: priority slots per model.
+    Shared by the sync and async Ollama clients of a process (limits are
+    per worker process).
+    """
+
+    def __init__(self, slots_per_model=ADMISSION_SLOTS_PER_MODEL):
+        self.slots_per_model = slots_per_model
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def slots(self, model):
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = ModelSlots(model, self.slots_per_model)
+            return self._models[model]
+
+    def outstanding(self):
+        """Requests of this process in flight or queued on the server, over all models"""
+        with self._lock:
+            models = list(self._models.values())
+        return sum(slots.outstanding() for slots in models)
+
+    def waiting(self):
+        with self._lock:
+            models = dict(self._models)
+        return {(model, priority): count
+                for model, slots in models.items() for priority, count in slots.waiting().items()}
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission(base_url):
+    """Return the process-wide admission controller of an Ollama server."""
+    with _controllers_lock:
+        if base_url not in _controllers:
+            _controllers[base_url] = AdmissionController()
+        return _controllers[base_url]
+
+
+_client_limiter = ClientRateLimiter()
+
+
+def check_client_rate(client):
+    """Count a request of a client against the process-wide limiter; raises RateLimited"""
+    _client_limiter.check(client)
+
+
+def client_key(remote_addr, headers):
+    """
+    Identify the client of a request for rate limiting.
+
+    Args:
+        remote_addr (str): Peer address
+        headers (Mapping): Request headers (case-insensitive lookup)
+    """
+    if ADMISSION_CLIENT_HEADER:
+        value = headers.get(ADMISSION_CLIENT_HEADER)
+        if value:
+            return value.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+def _waiting_by_model():
+    waiting = {}
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    for controller in controllers:
+        for key, count in controller.waiting().items():
+            waiting[key] = waiting.get(key, 0) + count
+    return waiting
+
+
+ADMISSION_WAITING.set_function(_waiting_by_model)
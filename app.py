@@ -1,20 +1,86 @@
-from flask import Flask, request, Response, jsonify
-import requests
+from flask import Flask, request, Response, jsonify, g
 import json
 from flask_cors import CORS
 import re
 import os
+import shutil
 from werkzeug.utils import secure_filename
-from controller import extract_text_and_images
-from threading import Thread
+from controller import iter_pdf_pages, count_pdf_pages, PAGE_BANNER, PAGE_SOURCE_TEXT, OCR_SETTINGS_KEY
+from threading import Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from contextlib import contextmanager
 import time
-import base64
+import uuid
+from ollama_client import get_client, OllamaError, Base64File
+from admission import check_client_rate, client_key, AdmissionRejected, PRIORITY_INTERACTIVE
+from result_cache import get_cache, make_key, sha256_file
+from config import (MODEL_KEEP_ALIVE, ROUTES, ROUTE_SUMMARIZE, ROUTE_LABELS, ROUTE_FIGURES,
+                    ROUTE_PDF_SUMMARY, ROUTE_ASK, ROUTE_EMBEDDING)
+from routing import choose, route_headers, MODEL_HEADER
+from response_cache import get_response_cache, response_key, CACHE_HEADER, LOOKUP_MISS
+from model_manager import ModelManager, MODEL_WARMUP
+from job_store import JobStore, JobWorker, QueueFull, JOB_MAX_QUEUE, STATE_DONE, STATE_QUEUED, STATE_RUNNING
+from storage import write_text_atomic, save_upload_atomic, start_sweeper
+from vector_embedding.ingest import ingest_document
+from vector_embedding.service import connect_vector_store, has_document, query_similar_text
+from metrics import (render as render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUEST_SECONDS,
+                     STAGE_SECONDS, JOBS_FINISHED, JOBS_QUEUED, JOBS_RUNNING, RESPONSE_CACHE_ENTRIES)
+from prompt_compaction import compact_prompt_text, fit_to_budget, token_budget, PROMPT_COMPACTION_MODE
+from image_preprocessing import FigurePreprocessor, FIGURE_PREPROCESSING, SETTINGS_KEY as FIGURE_SETTINGS_KEY
+from summarizer import (chunk_text, map_reduce, estimate_tokens,
+                        CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, REDUCE_FANOUT)
 
 app = Flask(__name__)
 CORS(app)  # Allow all origins
 
-OLLAMA_SERVER_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "deepseek-r1:7b"
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_latency(response):
+    # Streamed bodies are still being generated at this point; this is the time to the first byte
+    started = g.pop("request_started", None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                     endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+                                     status=response.status_code)
+    return response
+
+# Endpoints that start generations count against the client's rate limit
+RATE_LIMITED_ENDPOINTS = {"summarize_text", "generate_labels", "generate_labels_batch", "upload_pdf", "ask"}
+
+def admission_response(error):
+    """429/503 JSON response with Retry-After for a refused request"""
+    response = jsonify({"error": str(error)})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, error.status_code
+
+@app.before_request
+def limit_client_rate():
+    if request.endpoint in RATE_LIMITED_ENDPOINTS:
+        try:
+            check_client_rate(client_key(request.remote_addr, request.headers))
+        except AdmissionRejected as e:
+            return admission_response(e)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 200 once every model the service calls is loaded in Ollama, 503 until then"""
+    status = model_manager.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
 
 # Prompt template for text summarization
 SUMMARY_PROMPT_TEMPLATE = """
@@ -51,64 +117,8 @@ Input Text:
 Output Title:
 """
 
-@app.route("/summarize", methods=["POST"])
-def summarize_text():
-    try:
-        req_data = request.get_json()
-        if not req_data or "text" not in req_data:
-            return jsonify({"error": "Missing 'text' field in request"}), 400
-        
-        text_to_summarize = req_data["text"]
-        prompt = SUMMARY_PROMPT_TEMPLATE.format(text=text_to_summarize)
-        
-        ollama_payload = {
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": True  # Enable streaming
-        }
-        
-        response = requests.post(
-            OLLAMA_SERVER_URL,
-            json=ollama_payload,
-            stream=True
-        )
-        
-        if response.status_code != 200:
-            return jsonify({"error": "Failed to get response from Ollama"}), 500
-
-        def generate():
-            try:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            chunk = json.loads(line.decode('utf-8'))
-                            yield chunk.get("response", "")
-                        except json.JSONDecodeError:
-                            app.logger.error("Failed to decode JSON chunk")
-                        except KeyError:
-                            app.logger.error("Malformed response chunk")
-            except Exception as e:
-                app.logger.error(f"Stream error: {str(e)}")
-            finally:
-                response.close()
-
-        return Response(generate(), mimetype='text/plain')
-    
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route("/generate_labels", methods=["POST"])
-def generate_labels():
-    try:
-        req_data = request.get_json()
-        if not req_data or "text" not in req_data:
-            return jsonify({"error": "Missing 'text' field in request"}), 400
-
-        issue_text = req_data["text"]
-
-        # Strict prompt ensuring LLM returns only labels
-        LABEL_PROMPT_TEMPLATE = """
+# Strict prompt ensuring LLM returns only labels
+LABEL_PROMPT_TEMPLATE = """
         You are an AI-driven GitHub issue labeler responsible for assigning the 2-3 most relevant labels to a GitHub issue description.
         Only use labels from the predefined list below.
         Strict Rule For Response : **ONLY WRITE THE LABELS , NO EXPLANATION NEEDED IN FINAL RESPONSE AFTER THINKING PHASE , MAKE SURE TO FOLLOW THIS**
@@ -148,59 +158,299 @@ def generate_labels():
         **Selected Labels (2-3 only, comma-separated):**
         """
 
-        GITHUB_LABELS = [
-            "bug", "feature", "enhancement", "documentation", "refactor",
-            "security", "performance", "accessibility", "priority: high",
-            "priority: medium", "priority: low", "triage", "in progress",
-            "blocked", "duplicate", "wontfix", "invalid", "needs more info",
-            "ready for review", "frontend", "backend", "database", "CI/CD",
-            "devops", "dependencies", "testing", "good first issue",
-            "help wanted", "hard", "moderate", "breaking change", "patch",
-            "minor update", "major update", "deprecated", "discussion",
-            "question", "proposal"
-        ]
+GITHUB_LABELS = [
+    "bug", "feature", "enhancement", "documentation", "refactor",
+    "security", "performance", "accessibility", "priority: high",
+    "priority: medium", "priority: low", "triage", "in progress",
+    "blocked", "duplicate", "wontfix", "invalid", "needs more info",
+    "ready for review", "frontend", "backend", "database", "CI/CD",
+    "devops", "dependencies", "testing", "good first issue",
+    "help wanted", "hard", "moderate", "breaking change", "patch",
+    "minor update", "major update", "deprecated", "discussion",
+    "question", "proposal"
+]
 
-        prompt = LABEL_PROMPT_TEMPLATE.format(
-            labels=", ".join(GITHUB_LABELS),
-            text=issue_text
-        )
+# The few-shot prefix is identical for every issue, so it is rendered once and
+# Ollama can reuse its cached prompt evaluation across requests
+LABEL_PROMPT_PREFIX, LABEL_PROMPT_SUFFIX = LABEL_PROMPT_TEMPLATE.split("{text}")
+LABEL_PROMPT_PREFIX = LABEL_PROMPT_PREFIX.format(labels=", ".join(GITHUB_LABELS))
 
-        ollama_payload = {
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": True  # Enable streaming
-        }
+# Keep the label model (and its prompt cache) loaded between requests
+LABEL_KEEP_ALIVE = os.environ.get("LABEL_KEEP_ALIVE", MODEL_KEEP_ALIVE or "30m")
+LABEL_BATCH_CONCURRENCY = int(os.environ.get("LABEL_BATCH_CONCURRENCY", os.environ.get("OLLAMA_NUM_PARALLEL", 4)))
+LABEL_BATCH_MAX_ISSUES = int(os.environ.get("LABEL_BATCH_MAX_ISSUES", 1000))
+LABEL_MAX_COUNT = 3
 
-        response = requests.post(
-            OLLAMA_SERVER_URL,
-            json=ollama_payload,
-            stream=True
-        )
+# Post-processing of label answers
+THINK_BLOCK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL)
+LABEL_SPLIT_PATTERN = re.compile(r"[,\n]")
+LABEL_STRIP_CHARS = " \t\r\"'`*_.-[]"
+LABEL_LOOKUP = {label.lower(): label for label in GITHUB_LABELS}
+
+# Set on /summarize responses whose text was cut to the model's token budget
+TRIMMED_HEADER = "X-Input-Trimmed"
+
+# Part of the response cache keys: another prompt (or token budget) gives other answers
+RESPONSE_PROMPT_KEYS = {
+    ROUTE_SUMMARIZE: make_key(SUMMARY_PROMPT_TEMPLATE, token_budget(ROUTES[ROUTE_SUMMARIZE].model)),
+    ROUTE_LABELS: make_key(LABEL_PROMPT_TEMPLATE, GITHUB_LABELS),
+}
+
+@app.route("/summarize", methods=["POST"])
+def summarize_text():
+    try:
+        req_data = request.get_json()
+        if not req_data or "text" not in req_data:
+            return jsonify({"error": "Missing 'text' field in request"}), 400
+        
+        cache_key, lookup = look_up_response(ROUTE_SUMMARIZE, req_data["text"])
+        if lookup is not None and lookup.result != LOOKUP_MISS:
+            return replay_response(lookup, input_headers(ROUTE_SUMMARIZE, req_data["text"], lookup.model))
+        
+        choice = choose(ROUTE_SUMMARIZE, PRIORITY_INTERACTIVE)
+        ollama_payload = summary_payload(req_data["text"], choice.model)
+        
+        response = get_client(choice.backend).generate(ollama_payload, stream=True, priority=PRIORITY_INTERACTIVE)
         
         if response.status_code != 200:
+            response.close()
             return jsonify({"error": "Failed to get response from Ollama"}), 500
 
         def generate():
+            parts = []
             try:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            chunk = json.loads(line.decode('utf-8'))
-                            yield chunk.get("response", "")
-                        except json.JSONDecodeError:
-                            app.logger.error("Failed to decode JSON chunk")
-                        except KeyError:
-                            app.logger.error("Malformed response chunk")
+                for chunk in response.iter_chunks():
+                    parts.append(chunk.get("response", ""))
+                    yield parts[-1]
             except Exception as e:
                 app.logger.error(f"Stream error: {str(e)}")
+                parts = None
             finally:
                 response.close()
+            remember_response(cache_key, lookup, choice, parts)
 
-        return Response(generate(), mimetype='text/plain')
+        headers = {**generation_headers(choice, lookup), **input_headers(ROUTE_SUMMARIZE, req_data["text"], choice.model)}
+        streamed = Response(generate(), mimetype='text/plain', headers=headers)
+        # Release the model slot even if the client goes away before streaming starts
+        streamed.call_on_close(response.close)
+        return streamed
     
+    except AdmissionRejected as e:
+        return admission_response(e)
     except Exception as e:
-        return jsonify({"error": str(e)}), 
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/generate_labels", methods=["POST"])
+def generate_labels():
+    try:
+        req_data = request.get_json()
+        if not req_data or "text" not in req_data:
+            return jsonify({"error": "Missing 'text' field in request"}), 400
+
+        cache_key, lookup = look_up_response(ROUTE_LABELS, req_data["text"])
+        if lookup is not None and lookup.result != LOOKUP_MISS:
+            return replay_response(lookup)
+
+        choice = choose(ROUTE_LABELS, PRIORITY_INTERACTIVE)
+        ollama_payload = label_payload(req_data["text"], choice.model)
+
+        response = get_client(choice.backend).generate(ollama_payload, stream=True, priority=PRIORITY_INTERACTIVE)
         
+        if response.status_code != 200:
+            response.close()
+            return jsonify({"error": "Failed to get response from Ollama"}), 500
+
+        def generate():
+            parts = []
+            try:
+                for chunk in response.iter_chunks():
+                    parts.append(chunk.get("response", ""))
+                    yield parts[-1]
+            except Exception as e:
+                app.logger.error(f"Stream error: {str(e)}")
+                parts = None
+            finally:
+                response.close()
+            remember_response(cache_key, lookup, choice, parts)
+
+        streamed = Response(generate(), mimetype='text/plain', headers=generation_headers(choice, lookup))
+        # Release the model slot even if the client goes away before streaming starts
+        streamed.call_on_close(response.close)
+        return streamed
+    
+    except AdmissionRejected as e:
+        return admission_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def look_up_response(route_name, text):
+    """
+    Look up the cached response of a /summarize or /generate_labels request
+    (shared with the ASGI server). Only responses of the route's own model
+    are cached, so a fallback answer is never replayed.
+    
+    Returns:
+        tuple: (ResponseKey, Lookup), or (None, None) when the response cache is disabled
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return None, None
+    key = response_key(route_name, ROUTES[route_name].model, RESPONSE_PROMPT_KEYS[route_name], text)
+    return key, cache.lookup(key)
+
+def remember_response(cache_key, lookup, choice, parts):
+    """Store a generation that streamed to its end (parts is None after a stream error)"""
+    if cache_key is None or parts is None or choice.fallback:
+        return
+    text = "".join(parts)
+    if not text.strip():
+        return
+    try:
+        get_response_cache().store(cache_key, text, choice.model, lookup)
+    except Exception as e:
+        print(f"Error storing response in the cache: {str(e)}")
+
+def generation_headers(choice, lookup):
+    """Response headers of a generation: its route, and the cache miss when the cache is enabled"""
+    headers = route_headers(choice)
+    if lookup is not None:
+        headers[CACHE_HEADER] = lookup.result
+    return headers
+
+def replay_headers(lookup):
+    """Response headers of a cached response"""
+    return {MODEL_HEADER: lookup.model, CACHE_HEADER: lookup.result}
+
+def replay_response(lookup, headers=None):
+    """Stream a cached response in the format of a generation"""
+    return Response(iter([lookup.response]), mimetype='text/plain', headers={**replay_headers(lookup), **(headers or {})})
+
+def input_headers(route_name, text, model):
+    """
+    Response headers saying what became of a request's text (shared with the
+    ASGI server): X-Input-Trimmed when /summarize cut it to the model's token
+    budget, as estimated tokens sent/received.
+    """
+    if route_name != ROUTE_SUMMARIZE:
+        return {}
+    received = estimate_tokens(text)
+    budget = token_budget(model)
+    if received <= budget:
+        return {}
+    return {TRIMMED_HEADER: f"{estimate_tokens(fit_to_budget(text, budget))}/{received}"}
+
+def summary_payload(text, model):
+    """
+    Streaming /api/generate payload of /summarize for a model (shared with the
+    ASGI server). Pasted text is the user's own: it is only trimmed to the
+    model's token budget (reported by input_headers), never compacted like
+    extracted PDF text.
+    """
+    return {
+        "model": model,
+        "prompt": SUMMARY_PROMPT_TEMPLATE.format(text=fit_to_budget(text, token_budget(model))),
+        "stream": True  # Enable streaming
+    }
+
+def label_payload(issue_text, model):
+    """Streaming /api/generate payload of /generate_labels for a model (shared with the ASGI server)"""
+    return {
+        "model": model,
+        "prompt": build_label_prompt(issue_text),
+        "stream": True,  # Enable streaming
+        "keep_alive": LABEL_KEEP_ALIVE
+    }
+
+def build_label_prompt(issue_text):
+    """Label prompt for one issue: the precomputed few-shot prefix, the issue, the answer cue"""
+    return LABEL_PROMPT_PREFIX + issue_text + LABEL_PROMPT_SUFFIX
+
+def parse_labels(raw_response):
+    """
+    Turn a raw model answer into a validated label list.
+    
+    Drops the <think> block, keeps only labels from GITHUB_LABELS (in answer
+    order, without duplicates, at most LABEL_MAX_COUNT) and falls back to
+    "triage" when nothing valid is found.
+    """
+    answer = THINK_BLOCK_PATTERN.sub("", raw_response)
+    
+    labels = []
+    for candidate in LABEL_SPLIT_PATTERN.split(answer):
+        label = LABEL_LOOKUP.get(candidate.strip(LABEL_STRIP_CHARS).lower())
+        if label and label not in labels:
+            labels.append(label)
+    
+    if not labels:
+        # Answer was prose rather than a list: pick up labels mentioned in it
+        lowered = answer.lower()
+        labels = [label for label in GITHUB_LABELS if re.search(rf"(?<![\w-]){re.escape(label.lower())}(?![\w-])", lowered)]
+    
+    return labels[:LABEL_MAX_COUNT] or ["triage"]
+
+def label_issue(issue_text):
+    """Label a single issue with a non-streaming generation, returns (labels, raw_response, RouteChoice)"""
+    choice = choose(ROUTE_LABELS)
+    payload = {
+        "model": choice.model,
+        "prompt": build_label_prompt(issue_text),
+        "stream": False,
+        "keep_alive": LABEL_KEEP_ALIVE
+    }
+    response = get_client(choice.backend).generate(payload)
+    if response.status_code != 200:
+        raise OllamaError(f"Status code: {response.status_code}", response.status_code)
+    raw_response = response.json().get("response", "")
+    return parse_labels(raw_response), raw_response, choice
+
+@app.route("/generate_labels/batch", methods=["POST"])
+def generate_labels_batch():
+    """
+    Label many issues in one call.
+    
+    Body: {"issues": ["text", ...] or [{"id": ..., "text": ...}, ...]}
+    Issues are labelled with bounded concurrency and one NDJSON line is
+    streamed per issue as soon as it completes.
+    """
+    req_data = request.get_json(silent=True)
+    if not req_data or not isinstance(req_data.get("issues"), list):
+        return jsonify({"error": "Missing 'issues' list in request"}), 400
+    
+    issues = []
+    for index, issue in enumerate(req_data["issues"]):
+        if isinstance(issue, str):
+            issues.append((index, None, issue))
+        elif isinstance(issue, dict) and isinstance(issue.get("text"), str):
+            issues.append((index, issue.get("id"), issue["text"]))
+        else:
+            return jsonify({"error": f"Issue {index} has no 'text'"}), 400
+    
+    if len(issues) > LABEL_BATCH_MAX_ISSUES:
+        return jsonify({"error": f"At most {LABEL_BATCH_MAX_ISSUES} issues per batch"}), 400
+    
+    def generate():
+        executor = ThreadPoolExecutor(max_workers=LABEL_BATCH_CONCURRENCY)
+        try:
+            futures = {
+                executor.submit(label_issue, text): (index, issue_id)
+                for index, issue_id, text in issues
+            }
+            for future in as_completed(futures):
+                index, issue_id = futures[future]
+                result = {"index": index, "id": issue_id}
+                try:
+                    result["labels"], result["raw"], choice = future.result()
+                    result.update(backend=choice.backend, model=choice.model)
+                except Exception as e:
+                    result["error"] = str(e)
+                yield json.dumps(result) + "\n"
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
 
 # Configure upload settings
 UPLOAD_FOLDER = 'user_pdf'
@@ -213,16 +463,144 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
     print(f"Created directory: {UPLOAD_FOLDER}")
 
+# Every job gets its own scratch directory under user_pdf/jobs/<job_id>
+JOBS_FOLDER = os.path.join(UPLOAD_FOLDER, "jobs")
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-# Constants for LLM endpoints
-GEMMA_SERVER_URL = "http://localhost:11434/api/generate"  # Adjust if different
-DEEPSEEK_SERVER_URL = "http://localhost:11434/api/generate"  # Adjust if different
-GEMMA_MODEL_NAME = "gemma3:4b"  # Replace with actual model name
-DEEPSEEK_MODEL_NAME = "deepseek-r1:7b"  # From your original code
+# Models of the PDF pipeline stages (routes in config.py; background work never
+# falls back, so cached figures and documents are keyed by these names)
+GEMMA_MODEL_NAME = ROUTES[ROUTE_FIGURES].model
+DEEPSEEK_MODEL_NAME = ROUTES[ROUTE_PDF_SUMMARY].model
+EMBEDDING_MODEL_NAME = ROUTES[ROUTE_EMBEDDING].model
+
+# Vector store ingestion of processed PDFs
+INGEST_DOCUMENTS = os.environ.get("INGEST_DOCUMENTS", "true").lower() in ("1", "true", "yes")
+
+# Retrieval for /ask: chunks retrieved per question and the context budget of the prompt
+ASK_TOP_K = int(os.environ.get("ASK_TOP_K", 8))
+ASK_MAX_TOP_K = 50
+ASK_CONTEXT_TOKENS = int(os.environ.get("ASK_CONTEXT_TOKENS", 1500))
+
+# Figure analysis runs this many Gemma requests at once; match Ollama's own parallelism
+GEMMA_MAX_WORKERS = int(os.environ.get("GEMMA_MAX_WORKERS", os.environ.get("OLLAMA_NUM_PARALLEL", 4)))
+
+# Start the DeepSeek text summary while figures are still being analysed,
+# then merge the figure analyses into it once they have all arrived
+OVERLAP_SUMMARY = os.environ.get("OVERLAP_SUMMARY", "false").lower() in ("1", "true", "yes")
+
+# PDF summary mode: "single" prompt, "chunked" map-reduce, or "auto" (chunked
+# once the document no longer fits SUMMARY_CONTEXT_TOKENS)
+SUMMARY_MODE = os.environ.get("SUMMARY_MODE", "auto")
+SUMMARY_CONTEXT_TOKENS = int(os.environ.get("SUMMARY_CONTEXT_TOKENS", 8000))
+
+# Prompt for per-figure analysis with Gemma
+FIGURE_ANALYSIS_PROMPT = "Analyze this scientific figure in detail. Describe what it shows, its significance, and any patterns or trends visible."
+
+# Prompt templates for the PDF summary with Deepseek
+PDF_COMBINED_INPUT_TEMPLATE = """
+    # Original Document Text
+    
+    {text_content}
+    
+    # Image Analysis
+    
+    {image_analysis}
+    """
+
+PDF_SUMMARY_PROMPT_TEMPLATE = """
+    You are an AI research assistant specialized in creating comprehensive summaries of scientific papers.
+    You have been provided with:
+    1. The extracted text from a research paper
+    2. An analysis of the figures/images in the paper
+
+    Make sure the output is in two sections - Explaining content and image in corelation and detailed as well
+    Your task is to create a technical yet detailed summary that:
+    - Captures the main research question or hypothesis
+    - Summarizes the methodology used
+    - Highlights key findings and their significance
+    - Incorporates relevant information from the figures/images
+    - Maintains technical accuracy while being accessible
+    - Retain most of the technical terms and explanations in brackets
+    
+    Here is the combined input:
+    
+    {combined_input}
+    
+    Please provide a comprehensive technical summary:
+    """
+
+SUMMARY_MERGE_PROMPT_TEMPLATE = """
+    You are an AI research assistant specialized in creating comprehensive summaries of scientific papers.
+    You have been provided with:
+    1. A technical summary written from the text of a research paper
+    2. An analysis of the figures/images in the paper
+
+    Make sure the output is in two sections - Explaining content and image in corelation and detailed as well
+    Rewrite the summary so that it incorporates relevant information from the figures/images,
+    keeping every technical detail of the existing summary.
+    
+    # Text Summary
+    
+    {text_summary}
+    
+    # Image Analysis
+    
+    {image_analysis}
+    
+    Please provide the merged comprehensive technical summary:
+    """
+
+ASK_PROMPT_TEMPLATE = """
+    You are an AI research assistant answering questions about scientific papers.
+    Answer the question using only the excerpts below. Cite the excerpts you use by their
+    number, e.g. [2]. If the excerpts do not contain the answer, say so.
+    
+    Excerpts:
+    
+    {context}
+    
+    Question: {question}
+    
+    Answer:
+    """
+
+CHUNK_SUMMARY_PROMPT_TEMPLATE = """
+    You are an AI research assistant specialized in creating comprehensive summaries of scientific papers.
+    Below is an excerpt (pages {first_page}-{last_page}) of a research paper.
+    Summarize this excerpt in detail, keeping the research question, methodology, key findings,
+    numbers and technical terms it contains. Do not add information that is not in the excerpt.
+    
+    Excerpt:
+    
+    {text}
+    
+    Detailed excerpt summary:
+    """
+
+CHUNK_REDUCE_PROMPT_TEMPLATE = """
+    You are an AI research assistant specialized in creating comprehensive summaries of scientific papers.
+    Below are summaries of consecutive parts of the same research paper, in order.
+    Combine them into a single detailed summary, keeping every technical detail and removing repetition.
+    
+    {summaries}
+    
+    Combined detailed summary:
+    """
+
+# Cached results are only reused while the prompts they were produced with are unchanged
+FIGURE_PROMPT_VERSION = make_key(FIGURE_ANALYSIS_PROMPT)
+PROMPT_VERSION = make_key(
+    FIGURE_ANALYSIS_PROMPT,
+    PDF_COMBINED_INPUT_TEMPLATE,
+    PDF_SUMMARY_PROMPT_TEMPLATE,
+    SUMMARY_MERGE_PROMPT_TEMPLATE,
+    CHUNK_SUMMARY_PROMPT_TEMPLATE,
+    CHUNK_REDUCE_PROMPT_TEMPLATE
+)
 
 # Define processing status constants
 STATUS_PENDING = "pending"
@@ -232,164 +610,592 @@ STATUS_GENERATING_SUMMARY = "generating_summary"
 STATUS_COMPLETED = "completed"
 STATUS_FAILED = "failed"
 
-# In-memory storage for processing status (replace with database in production)
-processing_jobs = {}
+# Server-Sent Events: how often the event log is polled and tokens are flushed
+SSE_POLL_INTERVAL = float(os.environ.get("SSE_POLL_INTERVAL", 0.25))
+SSE_TOKEN_FLUSH_SECONDS = float(os.environ.get("SSE_TOKEN_FLUSH_SECONDS", 0.25))
+SSE_KEEPALIVE_SECONDS = 15
+# Response headers of an event stream (shared with the ASGI server)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# The ASGI server streams /job/events on its event loop. Served by Flask, a
+# stream holds a sync worker (or a WSGI thread) for as long as it lasts, so at
+# most SSE_MAX_STREAMS run per process (0: answer 501 and point to
+# /job/status), and each ends after SSE_MAX_STREAM_SECONDS, below the
+# gunicorn timeout; EventSource clients reconnect and resume after Last-Event-ID
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", 0))
+SSE_MAX_STREAM_SECONDS = float(os.environ.get("SSE_MAX_STREAM_SECONDS", 240))
+sse_streams = BoundedSemaphore(SSE_MAX_STREAMS) if SSE_MAX_STREAMS > 0 else None
+
+# Pipeline stages; a recovered job resumes after the last completed one
+STAGE_EXTRACTED = "extracted"
+STAGE_FIGURES_ANALYZED = "figures_analyzed"
+
+# Durable job records shared by all gunicorn workers
+job_store = JobStore()
+
+def get_job(job_id):
+    """Return a job record, or None if the job does not exist"""
+    return job_store.get(job_id)
 
-def process_pdf_in_background(pdf_path, filename, job_id):
-    """Background processing function for PDF analysis"""
+def update_job(job_id, **fields):
+    """Update fields of a job record; status changes are also published as events"""
+    job_store.update(job_id, **fields)
+    if "status" in fields:
+        event = {"status": fields["status"]}
+        if "error" in fields:
+            event["error"] = fields["error"]
+        job_store.add_event(job_id, "status", event)
+
+class TokenEventWriter:
+    """Publish streamed summary tokens as job events, batched to limit writes"""
+    
+    def __init__(self, job_id, flush_interval=SSE_TOKEN_FLUSH_SECONDS):
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.time()
+    
+    def __call__(self, token):
+        self.buffer.append(token)
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        if self.buffer:
+            job_store.add_event(self.job_id, "token", {"text": "".join(self.buffer)})
+            self.buffer = []
+        self.last_flush = time.time()
+
+class StageTimings:
+    """
+    Time pipeline stages of a job.
+    
+    Each stage is observed in the stage duration histogram and its seconds are
+    kept in the job record's "stage_timings" (accumulated if a stage repeats).
+    """
+    
+    def __init__(self, job_id, timings=None):
+        self.job_id = job_id
+        self.timings = dict(timings or {})
+    
+    @contextmanager
+    def stage(self, name, model=""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            STAGE_SECONDS.observe(seconds, stage=name, model=model)
+            self.timings[name] = round(self.timings.get(name, 0) + seconds, 3)
+            update_job(self.job_id, stage_timings=self.timings)
+
+class RouteLog:
+    """
+    Record where a job's model requests were routed (pass it as on_route).
+    
+    The job record's "routing" has, per route, one {"backend", "model",
+    "requests"} entry for every backend and model that served the job.
+    """
+    
+    def __init__(self, job_id, routing=None):
+        self.job_id = job_id
+        self.routing = {route: [dict(entry) for entry in entries] for route, entries in (routing or {}).items()}
+        self._lock = Lock()
+    
+    def __call__(self, choice):
+        with self._lock:
+            entries = self.routing.setdefault(choice.route, [])
+            for entry in entries:
+                if entry["backend"] == choice.backend and entry["model"] == choice.model:
+                    entry["requests"] += 1
+                    break
+            else:
+                entries.append({"backend": choice.backend, "model": choice.model, "requests": 1})
+            update_job(self.job_id, routing=self.routing)
+
+def document_cache_key(pdf_hash):
+    """Cache key of a processed PDF: content hash, models and prompt version"""
+    return make_key(pdf_hash, GEMMA_MODEL_NAME, DEEPSEEK_MODEL_NAME, PROMPT_VERSION,
+                    SUMMARY_MODE, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, REDUCE_FANOUT,
+                    PROMPT_COMPACTION_MODE, token_budget(DEEPSEEK_MODEL_NAME), FIGURE_SETTINGS_KEY,
+                    OCR_SETTINGS_KEY)
+
+def process_pdf_in_background(job_id, pdf_path, filename, pdf_hash=None):
+    """Background processing function for PDF analysis, run by the job worker"""
     try:
-        # Update status
-        processing_jobs[job_id] = {
-            "status": STATUS_PROCESSING_TEXT,
-            "filename": filename,
-            "created_at": time.time()
-        }
+        job = get_job(job_id) or {}
+        stage = job.get("stage")
+        update_job(job_id, status=STATUS_PROCESSING_TEXT)
         
-        # Create a directory for extracted content
-        extraction_dir = os.path.join(app.config['UPLOAD_FOLDER'], f"{filename}_extracted")
+        # Extracted content goes to the job's own directory
+        extraction_dir = job_extraction_dir(job_id)
         if not os.path.exists(extraction_dir):
             os.makedirs(extraction_dir)
         
-        # Extract text and images from the PDF
-        text_content, image_paths = extract_text_and_images(pdf_path, extraction_dir)
+        on_token = TokenEventWriter(job_id)
+        timings = StageTimings(job_id, job.get("stage_timings"))
+        on_route = RouteLog(job_id, job.get("routing"))
         
-        # Save extracted text to a file
-        text_file_path = os.path.join(extraction_dir, "extracted_text.txt")
-        with open(text_file_path, "w", encoding="utf-8") as f:
-            f.write(text_content)
+        with ThreadPoolExecutor(max_workers=GEMMA_MAX_WORKERS) as figure_pool:
+            image_analysis = None
+            if stage in (STAGE_EXTRACTED, STAGE_FIGURES_ANALYZED):
+                # Resuming a recovered job: reuse the artefacts of completed stages
+                text_content = read_artefact(extraction_dir, "extracted_text.txt")
+                image_paths = job.get("image_paths", [])
+                if stage == STAGE_FIGURES_ANALYZED:
+                    image_analysis = read_artefact(extraction_dir, "image_analysis.txt")
+                    figure_futures = []
+                else:
+                    figure_futures = dispatch_figures(job_id, image_paths, figure_pool, on_route)
+            else:
+                # Extract page by page; figures go to Gemma as soon as their page is parsed
+                with timings.stage("extraction"):
+                    text_content, image_paths, figure_futures = extract_and_dispatch_figures(
+                        job_id, pdf_path, extraction_dir, figure_pool, on_route)
+                update_job(job_id, stage=STAGE_EXTRACTED, image_paths=image_paths)
+            
+            # DeepSeek gets the text without layout noise, within its token budget
+            with timings.stage("compaction"):
+                prompt_text = prepare_summary_text(job_id, text_content)
+            
+            if image_analysis is None and OVERLAP_SUMMARY:
+                # Figures and summary overlap; the stage covers both
+                with timings.stage("summary", DEEPSEEK_MODEL_NAME):
+                    image_analysis, final_summary = summarize_with_overlapping_figures(
+                        job_id, prompt_text, figure_futures, extraction_dir, on_token, on_route)
+            else:
+                if image_analysis is None:
+                    # Wait for the Gemma figure analyses
+                    update_job(job_id, status=STATUS_PROCESSING_IMAGES)
+                    with timings.stage("figures", GEMMA_MODEL_NAME):
+                        image_analysis = collect_figure_analyses(figure_futures)
+                    save_image_analysis(extraction_dir, image_analysis)
+                    update_job(job_id, stage=STAGE_FIGURES_ANALYZED)
+                
+                # Generate final summary with Deepseek
+                update_job(job_id, status=STATUS_GENERATING_SUMMARY)
+                with timings.stage("summary", DEEPSEEK_MODEL_NAME):
+                    final_summary = summarize_document(job_id, prompt_text, image_analysis, on_token, on_route)
+        on_token.flush()
         
-        # Process images with Gemma
-        processing_jobs[job_id]["status"] = STATUS_PROCESSING_IMAGES
-        image_analysis = process_images_with_gemma(image_paths)
+        # Save final summary
+        summary_path = os.path.join(extraction_dir, "final_summary.txt")
+        write_text_atomic(summary_path, final_summary)
         
-        # Save image analysis to a file
-        image_analysis_path = os.path.join(extraction_dir, "image_analysis.txt")
-        with open(image_analysis_path, "w", encoding="utf-8") as f:
-            f.write(image_analysis)
+        if pdf_hash is None:
+            pdf_hash = sha256_file(pdf_path)
         
-        # Generate final summary with Deepseek
-        processing_jobs[job_id]["status"] = STATUS_GENERATING_SUMMARY
-        final_summary = generate_summary_with_deepseek(text_content, image_analysis)
+        # Make the document searchable; a vector store outage must not fail the job
+        if INGEST_DOCUMENTS:
+            with timings.stage("ingestion", EMBEDDING_MODEL_NAME):
+                ingestion = ingest_pdf(pdf_hash, filename, text_content, image_analysis, on_route)
+            update_job(job_id, ingestion=ingestion)
         
-        # Save final summary
-        summary_path = os.path.join(extraction_dir, "final_summary.txt")
-        with open(summary_path, "w", encoding="utf-8") as f:
-            f.write(final_summary)
+        # Remember the results so a re-upload of the same PDF is served from cache
+        if not final_summary.startswith("Error"):
+            get_cache().put("documents", document_cache_key(pdf_hash), {
+                "filename": filename,
+                "text": text_content,
+                "image_analysis": image_analysis,
+                "summary": final_summary
+            })
         
-        # Update job status to completed
-        processing_jobs[job_id]["status"] = STATUS_COMPLETED
-        processing_jobs[job_id]["summary_path"] = summary_path
-        processing_jobs[job_id]["completed_at"] = time.time()
+        # Update job status to completed; the streamed tokens are now in the summary file
+        update_job(job_id, status=STATUS_COMPLETED, summary_path=summary_path, completed_at=time.time())
+        job_store.delete_events(job_id, "token")
+        JOBS_FINISHED.inc(status=STATUS_COMPLETED)
         
         print(f"Completed processing PDF {filename}")
         
     except Exception as e:
         print(f"Error processing PDF {filename}: {str(e)}")
-        processing_jobs[job_id]["status"] = STATUS_FAILED
-        processing_jobs[job_id]["error"] = str(e)
+        update_job(job_id, status=STATUS_FAILED, error=str(e), completed_at=time.time())
+        JOBS_FINISHED.inc(status=STATUS_FAILED)
 
-def process_images_with_gemma(image_paths):
-    """Process images with Gemma model and return consolidated analysis"""
-    if not image_paths:
-        return "No images found in the document."
+def ingest_pdf(pdf_hash, filename, text_content, image_analysis, on_route=None):
+    """
+    Chunk, embed and store a processed PDF in the vector store.
     
-    image_analyses = []
+    Returns:
+        dict: Ingestion outcome for the job record
+    """
+    try:
+        choice = choose(ROUTE_EMBEDDING, on_route=on_route)
+        return ingest_document(pdf_hash, filename, text_content, image_analysis, choice.backend, choice.model)
+    except Exception as e:
+        print(f"Error ingesting PDF {filename} into the vector store: {str(e)}")
+        return {"status": "failed", "error": str(e)}
+
+def job_workdir(job_id):
+    """Scratch directory holding a job's upload and artefacts"""
+    return os.path.join(JOBS_FOLDER, job_id)
+
+def job_extraction_dir(job_id):
+    """Directory for a job's extracted text, images, analyses and summary"""
+    return os.path.join(job_workdir(job_id), "extracted")
+
+def read_artefact(extraction_dir, name):
+    """Read a text artefact written by an earlier pipeline stage"""
+    with open(os.path.join(extraction_dir, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+def figure_progress(job_id):
+    """
+    Return a callback, figure_done(idx, future), that counts finished figures
+    in the job record and publishes each analysis as a "figure" event.
+    """
+    progress_lock = Lock()
+    figures_done = [0]
+    
+    def figure_done(idx, future):
+        with progress_lock:
+            figures_done[0] += 1
+            update_job(job_id, figures_done=figures_done[0])
+            job_store.add_event(job_id, "figure", {
+                "index": idx,
+                "figures_done": figures_done[0],
+                "analysis": future.result()
+            })
+    
+    return figure_done
+
+def dispatch_figures(job_id, image_paths, figure_pool, on_route=None):
+    """Submit already extracted figures to the Gemma pool"""
+    update_job(job_id, figures_done=0, figures_total=len(image_paths))
+    figure_done = figure_progress(job_id)
     
+    figure_futures = []
     for idx, img_path in enumerate(image_paths):
-        # Get image metadata
-        img_filename = os.path.basename(img_path)
-        
-        try:
-            # Read and encode the image as base64
-            with open(img_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode("utf-8")
-            
-            # Prepare payload with image data for multimodal model
-            payload = {
-                "model": GEMMA_MODEL_NAME,
-                "prompt": "Analyze this scientific figure in detail. Describe what it shows, its significance, and any patterns or trends visible.",
-                "images": [image_data],
-                "stream": False
-            }
+        future = figure_pool.submit(analyze_figure_with_gemma, idx, img_path, on_route)
+        future.add_done_callback(partial(figure_done, idx))
+        figure_futures.append(future)
+    return figure_futures
+
+def extract_and_dispatch_figures(job_id, pdf_path, extraction_dir, figure_pool, on_route=None):
+    """
+    Stream the PDF through iter_pdf_pages, writing the text incrementally and
+    submitting every extracted figure to the Gemma pool right away.
+    
+    Progress ("pages_done", "figures_done", ...) is kept in the job record, as
+    are the figure preprocessing decisions ("figure_decisions", one entry per
+    embedded image, and the "figure_preprocessing" counts) and where the text
+    of every page comes from ("page_sources": "text", "ocr", "empty" or
+    "ocr_failed").
+    
+    Returns:
+        tuple: (text_content, image_paths, list of figure analysis futures in figure order)
+    """
+    update_job(job_id, pages_done=0, pages_total=count_pdf_pages(pdf_path),
+               figures_done=0, figures_total=0)
+    figure_done = figure_progress(job_id)
+    preprocessor = FigurePreprocessor() if FIGURE_PREPROCESSING else None
+    
+    page_texts = []
+    image_paths = []
+    figure_futures = []
+    job_decisions = []
+    page_sources = []
+    # Written under a temporary name and renamed once complete
+    text_file_path = os.path.join(extraction_dir, "extracted_text.txt")
+    partial_path = text_file_path + ".part"
+    with open(partial_path, "w", encoding="utf-8") as text_file:
+        for page_number, page_text, images, source in iter_pdf_pages(pdf_path, extraction_dir, preprocessor):
+            page_sources.append(source)
+            page_block = PAGE_BANNER.format(page_number=page_number) + page_text
+            text_file.write(page_block)
+            page_texts.append(page_block)
             
-            # Send request to Gemma
-            response = requests.post(GEMMA_SERVER_URL, json=payload)
+            for image in images:
+                idx = len(figure_futures)
+                future = figure_pool.submit(analyze_figure_with_gemma, idx, image["path"], on_route)
+                future.add_done_callback(partial(figure_done, idx))
+                figure_futures.append(future)
+                image_paths.append(image["path"])
             
-            if response.status_code == 200:
-                result = response.json()
-                analysis = result.get("response", "")
-                image_analyses.append(f"### Analysis of Figure {idx+1} ({img_filename})\n\n{analysis}\n\n")
-            else:
-                error_message = f"Failed to analyze image. Status code: {response.status_code}"
-                print(f"Error analyzing {img_filename}: {error_message}")
-                try:
-                    error_detail = response.json()
-                    print(f"Error details: {error_detail}")
-                except:
-                    pass
-                image_analyses.append(f"### Figure {idx+1} ({img_filename})\n{error_message}\n\n")
-        except Exception as e:
-            error_message = f"Error processing image: {str(e)}"
-            print(f"Exception for {img_filename}: {error_message}")
-            image_analyses.append(f"### Figure {idx+1} ({img_filename})\n{error_message}\n\n")
+            progress = {"pages_done": page_number, "figures_total": len(figure_futures)}
+            if preprocessor is not None and len(preprocessor.decisions) > len(job_decisions):
+                job_decisions = list(preprocessor.decisions)
+                progress.update(figure_decisions=job_decisions, figure_preprocessing=preprocessor.summary())
+            if source != PAGE_SOURCE_TEXT:
+                progress.update(page_sources=page_sources)
+            update_job(job_id, **progress)
+    os.replace(partial_path, text_file_path)
+    update_job(job_id, page_sources=page_sources)
+    
+    return "".join(page_texts), image_paths, figure_futures
+
+def collect_figure_analyses(figure_futures, on_result=None):
+    """Wait for figure analyses and combine them in figure order"""
+    if not figure_futures:
+        return "No images found in the document."
+    
+    image_analyses = [None] * len(figure_futures)
+    index = {future: idx for idx, future in enumerate(figure_futures)}
+    for future in as_completed(figure_futures):
+        idx = index[future]
+        image_analyses[idx] = future.result()
+        if on_result:
+            on_result(idx, image_analyses[idx])
     
     # Combine all analyses into a single document
-    combined_analysis = "# Image Analysis Summary\n\n" + "\n".join(image_analyses)
-    return combined_analysis
+    return "# Image Analysis Summary\n\n" + "\n".join(image_analyses)
 
-def generate_summary_with_deepseek(text_content, image_analysis):
-    """Generate a comprehensive summary using Deepseek model"""
-    # Prepare the combined input
-    combined_input = f"""
-    # Original Document Text
+def save_image_analysis(extraction_dir, image_analysis):
+    """Save the combined image analysis next to the extracted text"""
+    image_analysis_path = os.path.join(extraction_dir, "image_analysis.txt")
+    write_text_atomic(image_analysis_path, image_analysis)
+
+def summarize_with_overlapping_figures(job_id, text_content, figure_futures, extraction_dir, on_token=None,
+                                       on_route=None):
+    """
+    Run the DeepSeek text summary while the Gemma figure analyses are still running.
     
-    {text_content}
+    Figure sections are collected as they arrive; once both sides are done the
+    text summary and the figure analyses are merged into the final summary.
     
-    # Image Analysis
+    Returns:
+        tuple: (image_analysis, final_summary)
+    """
+    update_job(job_id, status=STATUS_GENERATING_SUMMARY)
     
-    {image_analysis}
+    text_summary = summarize_document(job_id, text_content, "No figure analysis available yet.", on_route=on_route)
+    image_analysis = collect_figure_analyses(figure_futures)
+    save_image_analysis(extraction_dir, image_analysis)
+    update_job(job_id, stage=STAGE_FIGURES_ANALYZED)
+    
+    if not figure_futures:
+        if on_token:
+            on_token(text_summary)
+        return image_analysis, text_summary
+    return image_analysis, merge_figure_analysis_with_deepseek(text_summary, image_analysis, on_token, on_route)
+
+def analyze_figure_with_gemma(idx, img_path, on_route=None):
+    """Analyze a single figure with Gemma and return its markdown section"""
+    # Get image metadata
+    img_filename = os.path.basename(img_path)
+    
+    try:
+        # Figures shared across papers (logos, repeated diagrams) are only analysed once
+        cache_key = make_key(sha256_file(img_path), GEMMA_MODEL_NAME, FIGURE_PROMPT_VERSION)
+        cached = get_cache().get("figures", cache_key)
+        if cached is not None:
+            return f"### Analysis of Figure {idx+1} ({img_filename})\n\n{cached['analysis']}\n\n"
+        
+        # Prepare payload with image data for multimodal model; the image is
+        # base64-encoded while the request body is streamed
+        choice = choose(ROUTE_FIGURES, on_route=on_route)
+        payload = {
+            "model": choice.model,
+            "prompt": FIGURE_ANALYSIS_PROMPT,
+            "images": [Base64File(img_path)],
+            "stream": False
+        }
+        
+        # Send request to Gemma
+        with STAGE_SECONDS.time(stage="figure", model=GEMMA_MODEL_NAME):
+            response = get_client(choice.backend).generate(payload)
+        
+        if response.status_code == 200:
+            result = response.json()
+            analysis = result.get("response", "")
+            get_cache().put("figures", cache_key, {"analysis": analysis})
+            return f"### Analysis of Figure {idx+1} ({img_filename})\n\n{analysis}\n\n"
+        
+        error_message = f"Failed to analyze image. Status code: {response.status_code}"
+        print(f"Error analyzing {img_filename}: {error_message}")
+        try:
+            error_detail = response.json()
+            print(f"Error details: {error_detail}")
+        except:
+            pass
+        return f"### Figure {idx+1} ({img_filename})\n{error_message}\n\n"
+    except Exception as e:
+        error_message = f"Error processing image: {str(e)}"
+        print(f"Exception for {img_filename}: {error_message}")
+        return f"### Figure {idx+1} ({img_filename})\n{error_message}\n\n"
+
+def process_images_with_gemma(image_paths, max_workers=None, on_result=None):
     """
+    Process images with Gemma model and return consolidated analysis.
+    
+    Figures are analysed concurrently by a bounded worker pool; the combined
+    document keeps the original figure order. A failing figure only affects
+    its own section.
+    
+    Args:
+        image_paths (list): Paths to extracted images
+        max_workers (int, optional): Pool width, defaults to GEMMA_MAX_WORKERS
+        on_result (callable, optional): Called as on_result(idx, section) when a figure finishes
+        
+    Returns:
+        str: Combined image analysis document
+    """
+    if not image_paths:
+        return "No images found in the document."
+    
+    with ThreadPoolExecutor(max_workers=max_workers or GEMMA_MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(analyze_figure_with_gemma, idx, img_path)
+            for idx, img_path in enumerate(image_paths)
+        ]
+        return collect_figure_analyses(futures, on_result)
+
+def generate_summary_with_deepseek(text_content, image_analysis, on_token=None, on_route=None):
+    """Generate a comprehensive summary using Deepseek model, streaming tokens to on_token if given"""
+    # Prepare the combined input
+    combined_input = PDF_COMBINED_INPUT_TEMPLATE.format(
+        text_content=text_content,
+        image_analysis=image_analysis
+    )
     
     # Prepare the prompt for Deepseek
-    prompt = f"""
-    You are an AI research assistant specialized in creating comprehensive summaries of scientific papers.
-    You have been provided with:
-    1. The extracted text from a research paper
-    2. An analysis of the figures/images in the paper
+    prompt = PDF_SUMMARY_PROMPT_TEMPLATE.format(combined_input=combined_input)
+    
+    # Call Deepseek for summarization
+    try:
+        return deepseek_complete(prompt, on_token, on_route) or "Failed to generate summary."
+    except OllamaError as e:
+        return f"Error: Failed to generate summary. {str(e)}"
+    except Exception as e:
+        return f"Error generating summary: {str(e)}"
 
-    Make sure the output is in two sections - Explaining content and image in corelation and detailed as well
-    Your task is to create a technical yet detailed summary that:
-    - Captures the main research question or hypothesis
-    - Summarizes the methodology used
-    - Highlights key findings and their significance
-    - Incorporates relevant information from the figures/images
-    - Maintains technical accuracy while being accessible
-    - Retain most of the technical terms and explanations in brackets
+def use_chunked_summary(text_content):
+    """Whether SUMMARY_MODE sends this text through map-reduce rather than a single prompt"""
+    return SUMMARY_MODE == "chunked" or (
+        SUMMARY_MODE == "auto" and estimate_tokens(text_content) > SUMMARY_CONTEXT_TOKENS
+    )
+
+def prepare_summary_text(job_id, text_content):
+    """
+    Compact extracted text for the DeepSeek summary and record the token savings.
     
-    Here is the combined input:
+    Chunked summaries keep the page banners and the whole text; a single prompt
+    drops the banners and is trimmed to the model's token budget.
+    """
+    prompt_text, stats = compact_prompt_text(text_content, DEEPSEEK_MODEL_NAME, budget=False)
+    if not use_chunked_summary(prompt_text):
+        prompt_text, stats = compact_prompt_text(text_content, DEEPSEEK_MODEL_NAME, keep_page_markers=False)
+    update_job(job_id, compaction=stats)
+    return prompt_text
+
+def summarize_document(job_id, text_content, image_analysis, on_token=None, on_route=None):
+    """Summarize a document in a single prompt or map-reduce chunks, depending on SUMMARY_MODE"""
+    if not use_chunked_summary(text_content):
+        return generate_summary_with_deepseek(text_content, image_analysis, on_token, on_route)
     
-    {combined_input}
+    def on_progress(stage, done, total):
+        update_job(job_id, chunks={"stage": stage, "done": done, "total": total})
     
-    Please provide a comprehensive technical summary:
+    return generate_chunked_summary_with_deepseek(text_content, image_analysis, on_progress, on_token, on_route)
+
+def deepseek_complete(prompt, on_token=None, on_route=None):
     """
+    Run a Deepseek generation and return its text, raising OllamaError on failure.
     
-    # Call Deepseek for summarization
+    With on_token the generation is streamed and every token is passed to
+    on_token as it arrives. on_route receives the backend and model chosen.
+    """
+    choice = choose(ROUTE_PDF_SUMMARY, on_route=on_route)
     payload = {
-        "model": DEEPSEEK_MODEL_NAME,
+        "model": choice.model,
         "prompt": prompt,
-        "stream": False
+        "stream": on_token is not None
     }
+    response = get_client(choice.backend).generate(payload, stream=on_token is not None)
+    with response:
+        if response.status_code != 200:
+            raise OllamaError(f"Status code: {response.status_code}", response.status_code)
+        if on_token is None:
+            return response.json().get("response", "")
+        
+        tokens = []
+        for chunk in response.iter_chunks():
+            token = chunk.get("response", "")
+            if token:
+                tokens.append(token)
+                on_token(token)
+        return "".join(tokens)
+
+def generate_chunked_summary_with_deepseek(text_content, image_analysis, on_progress=None, on_token=None,
+                                           on_route=None):
+    """
+    Summarize a long document with Deepseek using map-reduce.
+    
+    The text is split on page banners into chunks of CHUNK_TOKENS, the chunks are
+    summarized in parallel, partial summaries are combined REDUCE_FANOUT at a time
+    and the remainder goes through the regular two-section summary prompt together
+    with the image analysis.
+    
+    Args:
+        text_content (str): Extracted document text
+        image_analysis (str): Combined figure analysis
+        on_progress (callable, optional): Called as on_progress(stage, done, total)
+        on_token (callable, optional): Receives the tokens of the final summary as they stream
+        on_route (callable, optional): Receives the RouteChoice of every generation
+        
+    Returns:
+        str: Final summary, or an error message
+    """
+    chunks = chunk_text(text_content, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    
+    def summarize_chunk(chunk):
+        return deepseek_complete(CHUNK_SUMMARY_PROMPT_TEMPLATE.format(
+            first_page=chunk["first_page"],
+            last_page=chunk["last_page"],
+            text=chunk["text"]
+        ), on_route=on_route)
+    
+    def combine_summaries(summaries):
+        return deepseek_complete(CHUNK_REDUCE_PROMPT_TEMPLATE.format(
+            summaries="\n\n".join(f"## Part {i+1}\n\n{summary}" for i, summary in enumerate(summaries))
+        ), on_route=on_route)
     
     try:
-        response = requests.post(DEEPSEEK_SERVER_URL, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", "Failed to generate summary.")
-        else:
-            return f"Error: Failed to generate summary. Status code: {response.status_code}"
+        summaries = map_reduce(chunks, summarize_chunk, combine_summaries, on_progress=on_progress)
+        partial_text = "\n\n".join(f"## Part {i+1}\n\n{summary}" for i, summary in enumerate(summaries))
+        
+        if on_progress:
+            on_progress("final", 0, 1)
+        combined_input = PDF_COMBINED_INPUT_TEMPLATE.format(
+            text_content=partial_text,
+            image_analysis=image_analysis
+        )
+        final_summary = deepseek_complete(
+            PDF_SUMMARY_PROMPT_TEMPLATE.format(combined_input=combined_input), on_token, on_route)
+        if on_progress:
+            on_progress("final", 1, 1)
+        return final_summary
+    except OllamaError as e:
+        return f"Error: Failed to generate summary. {str(e)}"
     except Exception as e:
         return f"Error generating summary: {str(e)}"
 
+def merge_figure_analysis_with_deepseek(text_summary, image_analysis, on_token=None, on_route=None):
+    """Fold figure analyses into an existing text-only summary using Deepseek"""
+    prompt = SUMMARY_MERGE_PROMPT_TEMPLATE.format(
+        text_summary=text_summary,
+        image_analysis=image_analysis
+    )
+    
+    try:
+        return deepseek_complete(prompt, on_token, on_route) or text_summary
+    except OllamaError as e:
+        return f"Error: Failed to merge figure analysis. {str(e)}"
+    except Exception as e:
+        return f"Error merging figure analysis: {str(e)}"
+
+def restore_cached_document(job_id, cached):
+    """Write a cached document's artefacts to the job's extraction directory, return the summary path"""
+    extraction_dir = job_extraction_dir(job_id)
+    if not os.path.exists(extraction_dir):
+        os.makedirs(extraction_dir)
+    
+    for name, content in (("extracted_text.txt", cached["text"]),
+                          ("image_analysis.txt", cached["image_analysis"]),
+                          ("final_summary.txt", cached["summary"])):
+        write_text_atomic(os.path.join(extraction_dir, name), content)
+    
+    return os.path.join(extraction_dir, "final_summary.txt")
+
 # Add this to your Flask app
 @app.route('/upload/pdf', methods=['POST'])
 def upload_pdf():
@@ -408,26 +1214,56 @@ def upload_pdf():
         # Secure the filename to prevent path traversal attacks
         filename = secure_filename(file.filename)
         
-        # Ensure the upload directory exists
-        if not os.path.exists(app.config['UPLOAD_FOLDER']):
-            os.makedirs(app.config['UPLOAD_FOLDER'])
-            
-        # Save the file to the upload folder
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Generate a unique job ID; uploads of the same file never share state
+        job_id = f"job_{uuid.uuid4().hex}"
         
-        # Generate a job ID
-        job_id = f"job_{int(time.time())}_{filename}"
+        # Save the file to the job's own directory
+        workdir = job_workdir(job_id)
+        os.makedirs(workdir)
+        filepath = os.path.join(workdir, filename)
+        save_upload_atomic(file, filepath)
         
-        # Initialize job status
-        processing_jobs[job_id] = {
-            "status": STATUS_PENDING,
-            "filename": filename,
-            "created_at": time.time()
-        }
+        # Serve re-uploads of an already processed PDF straight from the cache
+        pdf_hash = sha256_file(filepath)
+        cached = get_cache().get("documents", document_cache_key(pdf_hash))
+        if cached is not None:
+            summary_path = restore_cached_document(job_id, cached)
+            now = time.time()
+            job_store.create(job_id, {
+                "status": STATUS_COMPLETED,
+                "filename": filename,
+                "pdf_hash": pdf_hash,
+                "created_at": now,
+                "completed_at": now,
+                "summary_path": summary_path,
+                "cache_hit": True
+            }, state=STATE_DONE)
+            return jsonify({
+                'message': 'File was already processed. Returning cached result.',
+                'filename': filename,
+                'job_id': job_id,
+                'status': STATUS_COMPLETED
+            }), 200
         
-        # Start background processing thread
-        Thread(target=process_pdf_in_background, args=(filepath, filename, job_id)).start()
+        # Queue the job; the worker pool picks it up when a slot is free
+        try:
+            job_store.create(job_id, {
+                "status": STATUS_PENDING,
+                "filename": filename,
+                "pdf_hash": pdf_hash,
+                "created_at": time.time()
+            }, payload={
+                "pdf_path": filepath,
+                "filename": filename,
+                "pdf_hash": pdf_hash
+            }, max_queue=JOB_MAX_QUEUE)
+        except QueueFull as e:
+            # The job will never run: do not leave its upload for the sweeper
+            shutil.rmtree(workdir, ignore_errors=True)
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+        job_worker.notify()
         
         # Return immediate response to client
         return jsonify({
@@ -442,11 +1278,10 @@ def upload_pdf():
 @app.route('/job/status/<job_id>', methods=['GET'])
 def check_job_status(job_id):
     """Endpoint to check the status of a processing job"""
-    if job_id not in processing_jobs:
+    job_info = get_job(job_id)
+    if job_info is None:
         return jsonify({'error': 'Job not found'}), 404
     
-    job_info = processing_jobs[job_id].copy()
-    
     # Calculate processing time
     if 'completed_at' in job_info:
         job_info['processing_time'] = job_info['completed_at'] - job_info['created_at']
@@ -455,14 +1290,96 @@ def check_job_status(job_id):
     
     return jsonify(job_info)
 
+@app.route('/job/events/<job_id>', methods=['GET'])
+def stream_job_events(job_id):
+    """
+    Server-Sent Events stream of a job's progress: "status" transitions,
+    per-figure "figure" completions and "token" chunks of the summary.
+    
+    Events carry their sequence number as id, so a reconnecting client
+    resumes after Last-Event-ID. The stream ends once the job completes or fails.
+    """
+    if get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if sse_streams is None:
+        return jsonify({'error': f"Event streams need SERVER_MODE=async (or SSE_MAX_STREAMS); "
+                                 f"poll /job/status/{job_id} instead"}), 501
+    if not sse_streams.acquire(blocking=False):
+        response = jsonify({'error': f"Too many event streams, poll /job/status/{job_id} instead"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    released = []
+    
+    def release():
+        if not released:
+            released.append(True)
+            sse_streams.release()
+    
+    last_seq = last_event_id(request.headers)
+    
+    def generate():
+        seq = last_seq
+        started = last_sent = time.time()
+        try:
+            while True:
+                messages, seq, finished = job_event_messages(job_id, seq)
+                if messages:
+                    yield "".join(messages)
+                    last_sent = time.time()
+                # Past SSE_MAX_STREAM_SECONDS the client reconnects and resumes
+                if finished or time.time() - started >= SSE_MAX_STREAM_SECONDS:
+                    return
+                
+                if time.time() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                    yield ": keep-alive\n\n"
+                    last_sent = time.time()
+                time.sleep(SSE_POLL_INTERVAL)
+        finally:
+            release()
+    
+    response = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    # Free the stream slot even if the client goes away before streaming starts
+    response.call_on_close(release)
+    return response
+
+def last_event_id(headers):
+    """Sequence number a reconnecting client resumes after (0 for a new stream)"""
+    try:
+        return int(headers.get('Last-Event-ID', 0))
+    except ValueError:
+        return 0
+
+def job_event_messages(job_id, seq):
+    """
+    SSE messages of a job's events after seq (shared with the ASGI server).
+    
+    Returns:
+        tuple: (messages, sequence number of the last event, whether the job has ended)
+    """
+    messages = []
+    finished = False
+    for seq, event, data in job_store.events_since(job_id, seq):
+        messages.append(f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n")
+        if event == "status" and data["status"] in (STATUS_COMPLETED, STATUS_FAILED):
+            finished = True
+    
+    if not finished:
+        # Jobs completed from cache (or before this stream opened) have no status event
+        job = get_job(job_id)
+        if job and job["status"] in (STATUS_COMPLETED, STATUS_FAILED) and not job_store.events_since(job_id, seq):
+            messages.append(f"event: status\ndata: {json.dumps({'status': job['status']})}\n\n")
+            finished = True
+    return messages, seq, finished
+
 @app.route('/job/result/<job_id>', methods=['GET'])
 def get_job_result(job_id):
     """Endpoint to get the result of a completed job"""
-    if job_id not in processing_jobs:
+    job_info = get_job(job_id)
+    if job_info is None:
         return jsonify({'error': 'Job not found'}), 404
     
-    job_info = processing_jobs[job_id]
-    
     if job_info['status'] != STATUS_COMPLETED:
         return jsonify({
             'error': 'Job not completed yet',
@@ -480,10 +1397,140 @@ def get_job_result(job_id):
             'filename': job_info['filename'],
             'summary': summary
         })
+    except FileNotFoundError:
+        return jsonify({'error': 'Job artefacts have expired'}), 410
     except Exception as e:
         return jsonify({'error': f'Failed to read summary: {str(e)}'}), 500
 
 
+def build_ask_prompt(question, hits, max_tokens=ASK_CONTEXT_TOKENS):
+    """
+    Build the /ask prompt from retrieved chunks, closest first, within a token budget.
+    
+    Returns:
+        tuple: (prompt, hits used as context)
+    """
+    blocks = []
+    used = []
+    budget = max_tokens
+    for hit in hits:
+        source = "figure" if hit.get("source") == "figure" else "text"
+        block = f"[{len(used) + 1}] ({hit.get('filename')}, page {hit.get('page')}, {source})\n{hit['text'].strip()}"
+        cost = estimate_tokens(block)
+        if used and cost > budget:
+            break
+        blocks.append(block)
+        used.append(hit)
+        budget -= cost
+    
+    prompt = ASK_PROMPT_TEMPLATE.format(context="\n\n".join(blocks), question=question)
+    return prompt, used
+
+@app.route("/ask", methods=["POST"])
+def ask():
+    """
+    Answer a question from the ingested papers.
+    
+    Body: {"question": "...", "job_id" or "doc_hash": optional document filter, "top_k": optional}
+    The question is embedded, the closest chunks are retrieved from the vector
+    store and DeepSeek's answer is streamed as plain text.
+    """
+    req_data = request.get_json(silent=True)
+    if not req_data or not isinstance(req_data.get("question"), str) or not req_data["question"].strip():
+        return jsonify({"error": "Missing 'question' field in request"}), 400
+    question = req_data["question"].strip()
+    
+    doc_hash = req_data.get("doc_hash")
+    job = None
+    if req_data.get("job_id"):
+        job = get_job(req_data["job_id"])
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        # Without its document the question would go to the whole corpus
+        doc_hash = job.get("pdf_hash")
+        if not doc_hash:
+            return jsonify({"error": "Job has no document to search"}), 404
+    
+    top_k = req_data.get("top_k", ASK_TOP_K)
+    try:
+        # json accepts true, 2.5, NaN and Infinity; none of them is a hit count
+        if isinstance(top_k, bool) or (isinstance(top_k, float) and not top_k.is_integer()):
+            raise ValueError(top_k)
+        top_k = min(max(1, int(top_k)), ASK_MAX_TOP_K)
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({"error": "'top_k' must be an integer"}), 400
+    
+    try:
+        embedding = choose(ROUTE_EMBEDDING, PRIORITY_INTERACTIVE)
+        store = connect_vector_store()
+        if job is not None and not has_document(store, doc_hash, embedding.model):
+            return jsonify({"error": "The job's document is not ingested (yet)", "status": job["status"]}), 409
+        query_vector = get_client(embedding.backend).embed(embedding.model, [question],
+                                                           priority=PRIORITY_INTERACTIVE)[0]
+        # Only vectors of the question's embedding model are comparable to it
+        hits = query_similar_text(store, query_vector, top_k=top_k, doc_hash=doc_hash,
+                                  embedding_model=embedding.model)
+    except AdmissionRejected as e:
+        return admission_response(e)
+    except Exception as e:
+        return jsonify({"error": f"Retrieval failed: {str(e)}"}), 503
+    
+    if not hits:
+        return jsonify({"error": "No ingested content found for this question"}), 404
+    
+    prompt, _ = build_ask_prompt(question, hits)
+    choice = choose(ROUTE_ASK, PRIORITY_INTERACTIVE)
+    payload = {
+        "model": choice.model,
+        "prompt": prompt,
+        "stream": True
+    }
+    
+    try:
+        response = get_client(choice.backend).generate(payload, stream=True, priority=PRIORITY_INTERACTIVE)
+    except AdmissionRejected as e:
+        return admission_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    if response.status_code != 200:
+        response.close()
+        return jsonify({"error": "Failed to get response from Ollama"}), 500
+    
+    def generate():
+        try:
+            for chunk in response.iter_chunks():
+                yield chunk.get("response", "")
+        except Exception as e:
+            app.logger.error(f"Stream error: {str(e)}")
+        finally:
+            response.close()
+    
+    streamed = Response(generate(), mimetype='text/plain', headers=route_headers(choice))
+    streamed.call_on_close(response.close)
+    return streamed
+
+
+# Background workers claiming PDF jobs from the job store
+job_worker = JobWorker(job_store, process_pdf_in_background)
+job_worker.start()
+
+JOBS_QUEUED.set_function(lambda: job_store.counts()[STATE_QUEUED])
+JOBS_RUNNING.set_function(lambda: job_store.counts()[STATE_RUNNING])
+RESPONSE_CACHE_ENTRIES.set_function(lambda: len(get_response_cache() or ()))
+
+def job_is_active(job_id):
+    """Queued or running jobs keep their directory regardless of age"""
+    job = get_job(job_id)
+    return job is not None and job.get("status") not in (STATUS_COMPLETED, STATUS_FAILED)
+
+# Periodically delete artefacts and records of old jobs so user_pdf/ and the
+# job database don't grow without bound
+start_sweeper(JOBS_FOLDER, job_is_active, prune=job_store.prune_finished)
+
+# Load the models now rather than on the first requests (and keep them warm if configured)
+model_manager = ModelManager()
+model_manager.start(warm_up=MODEL_WARMUP)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,377 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from werkzeug.datastructures import Headers
+
+from admission import check_client_rate, client_key, AdmissionRejected, PRIORITY_INTERACTIVE
+from app import (app as flask_app, summary_payload, label_payload, look_up_response, remember_response,
+                 generation_headers, replay_headers, input_headers, get_job, job_event_messages, last_event_id,
+                 SSE_HEADERS, SSE_POLL_INTERVAL, SSE_KEEPALIVE_SECONDS)
+from config import ROUTE_SUMMARIZE, ROUTE_LABELS
+from metrics import HTTP_REQUEST_SECONDS
+from ollama_client import get_async_client, close_async_clients
+from response_cache import LOOKUP_MISS
+from routing import choose
+
+# Streaming endpoints served natively on the event loop: a client waiting for
+# tokens costs a socket and a coroutine instead of a worker process or thread.
+# Each has its model route and builds its Ollama payload from the request JSON
+# ("text" field); routing, validation and response format are the same as in app.py.
+STREAMING_ROUTES = {
+    "/summarize": (ROUTE_SUMMARIZE, summary_payload),
+    "/generate_labels": (ROUTE_LABELS, label_payload),
+}
+
+# Job event streams (SSE) are also native: a watcher polls the job store from
+# the event loop instead of holding a WSGI thread until its job ends
+JOB_EVENTS_PREFIX = "/job/events/"
+JOB_EVENTS_ENDPOINT = "/job/events/<job_id>"
+
+# Flask-CORS answers every other route; the native ones add the same header
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+# Threads running the Flask routes (uploads, job status, /ask...); a streamed
+# /ask answer holds its thread until it ends
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", 32))
+WSGI_SPOOL_BYTES = 1024 * 1024  # request bodies above this go to a temporary file
+
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+async def read_body(receive, max_bytes):
+    """Read the whole request body, returns None when it exceeds max_bytes"""
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if max_bytes is not None and len(body) > max_bytes:
+            return None
+        if not message.get("more_body", False):
+            return body
+
+
+def encode_headers(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+
+
+def request_headers(scope):
+    return Headers([(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope.get("headers", [])])
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                   + CORS_HEADERS + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_replay(send, lookup, headers=None):
+    """Send a cached response in the format of a streamed generation"""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/plain; charset=utf-8")] + CORS_HEADERS
+                   + encode_headers({**replay_headers(lookup), **(headers or {})}),
+    })
+    await send({"type": "http.response.body", "body": lookup.response.encode("utf-8")})
+
+
+async def stream_generation(send, choice, payload, observe, cache_key=None, lookup=None, headers=None):
+    """
+    Proxy a streamed generation as text/plain, like the Flask generators in
+    app.py, and store it in the response cache once it streamed to its end.
+    """
+    response = await get_async_client(choice.backend).generate(payload, stream=True, priority=PRIORITY_INTERACTIVE)
+    try:
+        if response.status_code != 200:
+            observe(500)
+            await send_json(send, 500, {"error": "Failed to get response from Ollama"})
+            return
+
+        observe(200)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")] + CORS_HEADERS
+                       + encode_headers({**generation_headers(choice, lookup), **(headers or {})}),
+        })
+        parts = []
+        try:
+            async for chunk in response.aiter_chunks():
+                text = chunk.get("response", "")
+                if text:
+                    parts.append(text)
+                    await send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": True})
+        except Exception as e:
+            flask_app.logger.error(f"Stream error: {str(e)}")
+            parts = None
+        # Store before the response ends: the server reports the client gone
+        # once it has the whole body, which cancels this task
+        await asyncio.to_thread(remember_response, cache_key, lookup, choice, parts)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        await response.aclose()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def streaming_endpoint(scope, receive, send, route_name, build_payload):
+    started = time.perf_counter()
+    responded = False
+
+    def observe(status):
+        # Time to the first byte, as in the Flask after_request hook
+        nonlocal responded
+        responded = True
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method="POST",
+                                     endpoint=scope["path"], status=status)
+
+    async def refuse(error):
+        observe(error.status_code)
+        await send_json(send, error.status_code, {"error": str(error)},
+                        [(b"retry-after", str(error.retry_after).encode())])
+
+    headers = request_headers(scope)
+    try:
+        check_client_rate(client_key((scope.get("client") or ("", 0))[0], headers))
+    except AdmissionRejected as e:
+        await refuse(e)
+        return
+
+    body = await read_body(receive, flask_app.config.get("MAX_CONTENT_LENGTH"))
+    if body is None:
+        observe(413)
+        await send_json(send, 413, {"error": "Request body too large"})
+        return
+    try:
+        req_data = json.loads(body)
+    except ValueError:
+        req_data = None
+    if not isinstance(req_data, dict) or not isinstance(req_data.get("text"), str):
+        observe(400)
+        await send_json(send, 400, {"error": "Missing 'text' field in request"})
+        return
+
+    try:
+        # Cache lookups read SQLite and may embed the text, building the prompt
+        # is CPU work: keep both off the event loop
+        cache_key, lookup = await asyncio.to_thread(look_up_response, route_name, req_data["text"])
+        if lookup is None or lookup.result == LOOKUP_MISS:
+            choice = choose(route_name, PRIORITY_INTERACTIVE)
+            payload = await asyncio.to_thread(build_payload, req_data["text"], choice.model)
+            generation = asyncio.create_task(stream_generation(
+                send, choice, payload, observe, cache_key, lookup,
+                input_headers(route_name, req_data["text"], choice.model)))
+    except Exception as e:
+        observe(500)
+        await send_json(send, 500, {"error": str(e)})
+        return
+
+    if lookup is not None and lookup.result != LOOKUP_MISS:
+        observe(200)
+        await send_replay(send, lookup, input_headers(route_name, req_data["text"], lookup.model))
+        return
+
+    # A client that goes away cancels its generation, which frees the model slot
+    disconnect = asyncio.create_task(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({generation, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not generation.done():
+            generation.cancel()
+        try:
+            await generation
+        except asyncio.CancelledError:
+            pass
+        except AdmissionRejected as e:
+            await refuse(e)
+        except Exception as e:
+            if responded:
+                flask_app.logger.error(f"Stream error: {str(e)}")
+            else:
+                # Ollama unreachable before the response started
+                observe(500)
+                await send_json(send, 500, {"error": str(e)})
+
+
+async def job_events_endpoint(scope, receive, send):
+    """/job/events/<job_id>: the SSE stream of app.stream_job_events, polled from the event loop"""
+    started = time.perf_counter()
+    job_id = scope["path"][len(JOB_EVENTS_PREFIX):]
+
+    def observe(status):
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method="GET",
+                                     endpoint=JOB_EVENTS_ENDPOINT, status=status)
+
+    if await asyncio.to_thread(get_job, job_id) is None:
+        observe(404)
+        await send_json(send, 404, {"error": "Job not found"})
+        return
+
+    observe(200)
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream; charset=utf-8")] + CORS_HEADERS
+                   + encode_headers(SSE_HEADERS),
+    })
+
+    disconnect = asyncio.create_task(wait_for_disconnect(receive))
+    try:
+        seq = last_event_id(request_headers(scope))
+        last_sent = time.monotonic()
+        while not disconnect.done():
+            messages, seq, finished = await asyncio.to_thread(job_event_messages, job_id, seq)
+            if messages:
+                await send({"type": "http.response.body", "body": "".join(messages).encode("utf-8"),
+                            "more_body": True})
+                last_sent = time.monotonic()
+            if finished:
+                break
+            if time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+                last_sent = time.monotonic()
+            await asyncio.wait({disconnect}, timeout=SSE_POLL_INTERVAL)
+        if not disconnect.done():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnect.cancel()
+
+
+def build_environ(scope, body):
+    """WSGI environ of an ASGI HTTP request (PEP 3333 and the ASGI spec)"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").lower()
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def run_wsgi(environ, send_message, disconnected):
+    """Run the Flask app in a worker thread, forwarding its response as ASGI messages"""
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start.update({
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        })
+
+    def send_start():
+        if response_start.get("type"):
+            send_message(dict(response_start))
+            response_start["type"] = None
+
+    result = flask_app(environ, start_response)
+    try:
+        for data in result:
+            if disconnected.is_set():
+                # Stop generating for a client that left; close() runs the generator's cleanup
+                return
+            send_start()
+            if data:
+                send_message({"type": "http.response.body", "body": data, "more_body": True})
+        send_start()
+        send_message({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+
+async def wsgi_endpoint(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    with SpooledTemporaryFile(max_size=WSGI_SPOOL_BYTES) as body:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body.seek(0)
+
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            await wait_for_disconnect(receive)
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await loop.run_in_executor(wsgi_executor, run_wsgi, build_environ(scope, body), send_message, disconnected)
+        finally:
+            watcher.cancel()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_clients()
+            wsgi_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """
+    ASGI entry point: the streaming endpoints run natively, every other route
+    is the Flask app on the WSGI thread pool.
+    """
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    streaming_route = STREAMING_ROUTES.get(scope.get("path"))
+    if scope["type"] == "http" and scope["method"] == "POST" and streaming_route is not None:
+        await streaming_endpoint(scope, receive, send, *streaming_route)
+    elif scope["type"] == "http" and scope["method"] == "GET" and scope["path"].startswith(JOB_EVENTS_PREFIX):
+        await job_events_endpoint(scope, receive, send)
+    elif scope["type"] == "http":
+        await wsgi_endpoint(scope, receive, send)
@@ -0,0 +1,84 @@
+"""
+Benchmark the PDF extraction engine against the original two-pass functions.
+
+Usage:
+    python benchmarks/bench_extraction.py [--repeat 5] [--workers 4] [pdf ...]
+
+By default every PDF in user_pdf/ is used. Each run extracts into a fresh
+temporary directory and checks that text and image files are identical.
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import controller
+from controller import extract_text_from_pdf, extract_images_from_pdf, extract_document
+
+
+def legacy_extract(pdf_path, output_dir):
+    text = extract_text_from_pdf(pdf_path, output_dir)
+    image_paths = extract_images_from_pdf(pdf_path, output_dir)
+    return text, image_paths
+
+
+def engine_extract(pdf_path, output_dir, workers):
+    document = extract_document(pdf_path, output_dir, workers=workers)
+    return document["text"], document["image_paths"]
+
+
+def time_runs(fn, pdf_path, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        output_dir = tempfile.mkdtemp(prefix="bench_extract_")
+        try:
+            start = time.perf_counter()
+            text, image_paths = fn(pdf_path, output_dir)
+            timings.append(time.perf_counter() - start)
+            files = {os.path.basename(p): open(p, "rb").read() for p in image_paths}
+            result = (text, files)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return min(timings), sum(timings) / len(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=controller.EXTRACTION_WORKERS)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pdfs = args.pdfs or sorted(glob.glob(os.path.join(root, "user_pdf", "*.pdf")))
+
+    # Force the parallel path regardless of document length
+    controller.PARALLEL_MIN_PAGES = 1
+    variants = [
+        ("legacy (two opens)", legacy_extract),
+        ("engine serial", lambda p, d: engine_extract(p, d, 1)),
+        (f"engine x{args.workers}", lambda p, d: engine_extract(p, d, args.workers)),
+    ]
+
+    # Warm the process pool so its start-up cost is not counted
+    engine_extract(pdfs[0], None, args.workers)
+
+    print(f"{'pdf':<28} {'variant':<20} {'best (s)':>9} {'mean (s)':>9}  identical")
+    for pdf_path in pdfs:
+        baseline = None
+        for name, fn in variants:
+            best, mean, result = time_runs(fn, pdf_path, args.repeat)
+            if baseline is None:
+                baseline = result
+            identical = "yes" if result == baseline else "NO"
+            print(f"{os.path.basename(pdf_path):<28} {name:<20} {best:>9.3f} {mean:>9.3f}  {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark the OCR fallback on scanned copies of the bundled PDFs.
+
+Usage:
+    python benchmarks/bench_ocr.py [--dpi 150] [--repeat 3] [--workers 4] [pdf ...]
+
+Every page of each PDF (by default those in user_pdf/) is rendered at --dpi
+and written to a new, image-only PDF, so the copy has no text layer at all.
+The copy is then extracted with extract_document, which OCRs every page:
+in this process (serial) and through the process pool (--workers), with an
+empty OCR cache, and once more with the cache filled by the previous run.
+Reports pages per second, the page sources, and the share of the original
+text layer's words found by OCR. Needs Tesseract (tessdata) to be installed.
+"""
+import argparse
+import glob
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymupdf
+
+import controller
+import result_cache
+from controller import extract_document, PAGE_SOURCE_OCR, PAGE_SOURCE_OCR_FAILED
+
+
+def rasterize(pdf_path, output_path, dpi):
+    """Write an image-only copy of a PDF, one rendered image per page"""
+    with pymupdf.open(pdf_path) as source, pymupdf.open() as scanned:
+        for page in source:
+            pix = page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY)
+            target = scanned.new_page(width=page.rect.width, height=page.rect.height)
+            target.insert_image(target.rect, stream=pix.tobytes("png"))
+        scanned.save(output_path, deflate=True)
+    return output_path
+
+
+def words(text):
+    return set(re.findall(r"[a-z]{3,}", text.lower()))
+
+
+def word_recall(reference, text):
+    """Share of the reference's distinct words (3+ letters) found in text"""
+    expected = words(reference)
+    return len(expected & words(text)) / len(expected) if expected else 1.0
+
+
+def run(pdf_path, workers, cache_dir, clear_cache):
+    if clear_cache:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    start = time.perf_counter()
+    document = extract_document(pdf_path, workers=workers)
+    return time.perf_counter() - start, document
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--dpi", type=int, default=150, help="Resolution of the scanned copies")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=controller.EXTRACTION_WORKERS)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pdfs = args.pdfs or sorted(glob.glob(os.path.join(root, "user_pdf", "*.pdf")))
+
+    workdir = tempfile.mkdtemp(prefix="bench_ocr_")
+    cache_dir = os.path.join(workdir, "cache")
+    # OCR results go to a private cache, so runs start cold unless stated otherwise
+    result_cache._cache = result_cache.ResultCache(cache_dir)
+    controller.OCR_FALLBACK = True
+
+    variants = [
+        ("serial", 1, True),
+        (f"pool x{args.workers}", args.workers, True),
+        (f"pool x{args.workers} cached", args.workers, False),
+    ]
+
+    try:
+        # Warm the process pool so its start-up cost is not counted
+        warm_up = rasterize(pdfs[0], os.path.join(workdir, "warm_up.pdf"), 36)
+        run(warm_up, args.workers, cache_dir, True)
+
+        print(f"{'pdf':<28} {'variant':<22} {'pages':>5} {'best (s)':>9} {'pages/s':>8} {'ocr':>4} {'recall':>7}")
+        for pdf_path in pdfs:
+            with pymupdf.open(pdf_path) as doc:
+                reference = "".join(page.get_text() for page in doc)
+            scanned = rasterize(pdf_path, os.path.join(workdir, os.path.basename(pdf_path)), args.dpi)
+
+            for name, workers, clear_cache in variants:
+                timings = []
+                for _ in range(args.repeat):
+                    seconds, document = run(scanned, workers, cache_dir, clear_cache)
+                    timings.append(seconds)
+                sources = document["page_sources"]
+                ocr_pages = sources.count(PAGE_SOURCE_OCR)
+                if ocr_pages == 0 and PAGE_SOURCE_OCR_FAILED in sources:
+                    sys.exit("OCR failed, is Tesseract installed (tessdata found)?")
+                best = min(timings)
+                print(f"{os.path.basename(pdf_path):<28} {name:<22} {len(sources):>5} {best:>9.3f} "
+                      f"{len(sources) / best:>8.2f} {ocr_pages:>4} {word_recall(reference, document['text']):>7.1%}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Microbenchmark text preprocessing: the previous implementation against the
+single-pass one, and the batch API serially against the process pool.
+
+Usage:
+    python benchmarks/bench_text_preprocessing.py [--docs 2000] [--words 800] [--workers 4]
+        [--file extracted_text.txt]
+
+Every output of the new implementation is checked to be identical to the
+previous implementation's before timings are reported.
+"""
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import text_preprocessing
+from text_preprocessing import get_stopwords, preprocess_text, preprocess_texts
+
+VOCABULARY = ("the model results figure table method data we propose baseline accuracy "
+              "training dataset neural layer attention of and in is to for with on that "
+              "loss was were between, (see Fig. 3) 12.5% 2023 états-unis naïve café ½ ٣").split()
+
+
+def legacy_preprocess_text(text, stopwords):
+    """The implementation before the single-pass rewrite"""
+    text = text.lower()
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    text = re.sub(r'\d+', '', text)
+    text = " ".join(text.split())
+    text = " ".join([word for word in text.split() if word not in stopwords])
+    return text
+
+
+def make_corpus(docs, words, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(docs):
+        tokens = [rng.choice(VOCABULARY) for _ in range(words)]
+        corpus.append(" ".join(tokens).replace(" table", "\n\ntable").replace(" data", "\tData"))
+    return corpus
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=800)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--file", help="Also check and time a real document, e.g. an extracted_text.txt")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.docs, args.words)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            corpus.append(f.read())
+    chars = sum(len(text) for text in corpus)
+
+    start = time.perf_counter()
+    stopwords = get_stopwords()
+    load_seconds = time.perf_counter() - start
+
+    expected, legacy = timed(lambda: [legacy_preprocess_text(text, stopwords) for text in corpus])
+    single, new = timed(lambda: [preprocess_text(text) for text in corpus])
+    assert single == expected, "single-pass output differs from the previous implementation"
+
+    text_preprocessing.PREPROCESS_PARALLEL_MIN_CHARS = 0
+    pooled, pool = timed(lambda: preprocess_texts(corpus, workers=args.workers))
+    assert pooled == expected, "process pool output differs from the previous implementation"
+
+    print(f"docs={len(corpus)} chars={chars} workers={args.workers} stopwords loaded in {load_seconds * 1000:.2f} ms")
+    for name, seconds in (("previous", legacy), ("single-pass", new), (f"pool ({args.workers} workers)", pool)):
+        print(f"{name:<22} {seconds:>8.3f} s  {chars / seconds / 1e6:>8.1f} MB/s  {legacy / seconds:>5.2f}x")
+    print("outputs identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark batched vector ingestion against the per-object path.
+
+Usage:
+    python benchmarks/bench_vector_ingest.py [--objects 2000] [--dim 768] [--batch-size 100]
+        [--backend mock|embedded|local] [--rtt-ms 2.0]
+
+Backends:
+    mock      In-process stand-in for the Weaviate client; every request costs
+              --rtt-ms of latency plus a small per-object cost (default)
+    embedded  Embedded Weaviate (downloads the Weaviate binary on first use)
+    local     Weaviate reachable via WEAVIATE_HOST/WEAVIATE_PORT
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_embedding import service
+
+
+class _MockBatch:
+    def __init__(self, collection, batch_size):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.pending = []
+
+    def add_object(self, properties=None, vector=None):
+        self.pending.append((properties, vector))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.collection.request(len(self.pending))
+            self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+class _MockBatchFactory:
+    def __init__(self, collection):
+        self.collection = collection
+        self.failed_objects = []
+
+    def fixed_size(self, batch_size=100, concurrent_requests=2):
+        return _MockBatch(self.collection, batch_size)
+
+    def dynamic(self):
+        return _MockBatch(self.collection, 100)
+
+
+class _MockData:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def insert(self, properties=None, vector=None):
+        self.collection.request(1)
+
+
+class _MockCollection:
+    def __init__(self, rtt, per_object):
+        self.rtt = rtt
+        self.per_object = per_object
+        self.requests = 0
+        self.data = _MockData(self)
+        self.batch = _MockBatchFactory(self)
+
+    def request(self, objects):
+        self.requests += 1
+        time.sleep(self.rtt + self.per_object * objects)
+
+
+class _MockCollections:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def exists(self, name):
+        return True
+
+    def get(self, name):
+        return self.collection
+
+
+class MockClient:
+    """Duck-typed stand-in for weaviate.WeaviateClient with simulated latency"""
+
+    def __init__(self, rtt, per_object=0.00002):
+        self.collection = _MockCollection(rtt, per_object)
+        self.collections = _MockCollections(self.collection)
+
+
+def make_client(backend, rtt):
+    if backend == "mock":
+        return MockClient(rtt)
+    import weaviate
+    if backend == "embedded":
+        return weaviate.connect_to_embedded()
+    return service.connect_weaviate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--backend", choices=("mock", "embedded", "local"), default="mock")
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="Round-trip latency of the mock backend")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    items = [
+        (f"chunk {i}", [rng.random() for _ in range(args.dim)])
+        for i in range(args.objects)
+    ]
+
+    client = make_client(args.backend, args.rtt_ms / 1000)
+    service.create_schema(client)
+
+    start = time.perf_counter()
+    for text, vector in items:
+        service.store_embedding(client, text, vector)
+    per_object = time.perf_counter() - start
+
+    start = time.perf_counter()
+    failed = service.store_embeddings(client, items, batch_size=args.batch_size)
+    batched = time.perf_counter() - start
+
+    print(f"backend={args.backend} objects={args.objects} dim={args.dim} batch_size={args.batch_size}")
+    print(f"{'per-object insert':<20} {per_object:>8.3f} s  {args.objects / per_object:>10.0f} obj/s")
+    print(f"{'batched insert':<20} {batched:>8.3f} s  {args.objects / batched:>10.0f} obj/s  ({len(failed)} failed)")
+    print(f"speed-up: {per_object / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
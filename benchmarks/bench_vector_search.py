@@ -0,0 +1,121 @@
+"""
+Benchmark vector search backends for recall@k and queries per second.
+
+Usage:
+    python benchmarks/bench_vector_search.py [--vectors 100000] [--dim 768] [--queries 200]
+        [--top-k 10] [--nprobe 4,8,16] [--weaviate]
+
+Synthetic clustered embeddings are loaded into a temporary local store; exact
+top-k from a float64 scan is the ground truth. Backends:
+    local brute-force   Exact cosine scan over the memory-mapped matrix
+    local IVF           IVF index, one row per --nprobe value
+    weaviate            HNSW in a running Weaviate (--weaviate), in a scratch collection
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_embedding import service
+from vector_embedding.local_store import LocalVectorStore
+
+
+def make_dataset(count, dim, queries, clusters=1024, noise=1.5, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + noise * rng.standard_normal((count, dim)).astype(np.float32)
+    query_labels = rng.integers(0, clusters, queries)
+    query_vectors = centers[query_labels] + noise * rng.standard_normal((queries, dim)).astype(np.float32)
+    return vectors, query_vectors
+
+
+def ground_truth(vectors, queries, top_k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit_queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = []
+    for start in range(0, len(unit_queries), 64):
+        scores = unit_queries[start:start + 64].astype(np.float64) @ unit.T.astype(np.float64)
+        truth.extend(np.argsort(-scores, axis=1)[:, :top_k])
+    return [set(row.tolist()) for row in truth]
+
+
+def recall(results, truth):
+    return float(np.mean([len(set(found) & expected) / len(expected) for found, expected in zip(results, truth)]))
+
+
+def run(name, search, queries, truth, rows):
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    elapsed = time.perf_counter() - start
+    rows.append((name, recall(results, truth), len(queries) / elapsed))
+
+
+def bench_weaviate(vectors, queries, top_k, truth, rows):
+    client = service.connect_weaviate()
+    service.COLLECTION_NAME = "VectorSearchBenchmark"
+    if client.collections.exists(service.COLLECTION_NAME):
+        client.collections.delete(service.COLLECTION_NAME)
+    service.create_schema(client)
+    try:
+        service.store_embeddings(client, [(str(i), vector.tolist(), {"chunk_index": i})
+                                          for i, vector in enumerate(vectors)])
+        run("weaviate HNSW",
+            lambda q: [hit["chunk_index"] for hit in service.query_similar_text(client, q.tolist(), top_k)],
+            queries, truth, rows)
+    finally:
+        client.collections.delete(service.COLLECTION_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", default="4,8,16", help="Comma-separated IVF probe counts")
+    parser.add_argument("--weaviate", action="store_true", help="Also benchmark a running Weaviate")
+    args = parser.parse_args()
+
+    vectors, queries = make_dataset(args.vectors, args.dim, args.queries)
+    truth = ground_truth(vectors, queries, args.top_k)
+    rows = []
+
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(path, ivf_min_vectors=len(vectors) + 1)
+        for start in range(0, len(vectors), 10000):
+            store.add((str(i), vector) for i, vector in enumerate(vectors[start:start + 10000], start))
+
+        run("local brute-force", lambda q: store.search([q], args.top_k)[0][0].tolist(), queries, truth, rows)
+
+        start = time.perf_counter()
+        store.build_index()
+        build_seconds = time.perf_counter() - start
+        store.ivf_min_vectors = 0
+        for nprobe in (int(n) for n in args.nprobe.split(",")):
+            store.nprobe = nprobe
+            run(f"local IVF nprobe={nprobe}", lambda q: store.search([q], args.top_k)[0][0].tolist(), queries, truth, rows)
+
+        # All queries in one call: every block of the matrix is read once per batch
+        store.ivf_min_vectors = len(vectors) + 1
+        start = time.perf_counter()
+        results = [ids.tolist() for ids, _ in store.search(queries, args.top_k)]
+        rows.insert(1, ("local brute-force batch", recall(results, truth), len(queries) / (time.perf_counter() - start)))
+
+    if args.weaviate:
+        bench_weaviate(vectors, queries, args.top_k, truth, rows)
+
+    print(f"vectors={args.vectors} dim={args.dim} queries={args.queries} top_k={args.top_k} "
+          f"(IVF build {build_seconds:.2f} s)")
+    print(f"{'backend':<24} {f'recall@{args.top_k}':>10} {'QPS':>10}")
+    for name, rec, qps in rows:
+        print(f"{name:<24} {rec:>10.3f} {qps:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
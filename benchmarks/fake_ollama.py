@@ -0,0 +1,269 @@
+"""
+Fake Ollama server for offline benchmarks.
+
+Emulates /api/generate (streamed and non-streamed), /api/embed, /api/tags
+and /api/ps with configurable latency and generation speed, so the service
+can be load-tested without models.
+
+Usage:
+    python benchmarks/fake_ollama.py [--port 11435] [--latency 0.2] [--tokens-per-second 40]
+        [--response-tokens 64] [--parallel 4] [--load-time 0] [--keep-alive 300]
+
+Timing model per request:
+    queue for one of --parallel slots of the model (Ollama's OLLAMA_NUM_PARALLEL)
+    + --load-time when the model is not resident: on first use, or once its
+      keep_alive (from the request, --keep-alive seconds by default) has expired
+    + --latency (prompt evaluation) before the first token
+    + one token every 1 / --tokens-per-second seconds, --response-tokens tokens
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+WORDS = ("the model results show that the proposed method improves accuracy on "
+         "the benchmark while reducing latency bug enhancement documentation").split()
+
+
+class FakeOllama:
+    """Timing configuration and per-model state shared by the request handlers"""
+
+    def __init__(self, latency=0.2, tokens_per_second=40.0, response_tokens=64, parallel=4,
+                 load_time=0.0, keep_alive=300.0, embedding_dim=768):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.parallel = parallel
+        self.load_time = load_time
+        self.keep_alive = keep_alive
+        self.embedding_dim = embedding_dim
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._load_locks = {}
+        self.loaded = {}  # model -> time its keep_alive expires (None: never)
+        self.loads = 0
+        self.requests = 0
+
+    def slot(self, model):
+        with self._lock:
+            self.requests += 1
+            if model not in self._slots:
+                self._slots[model] = threading.BoundedSemaphore(self.parallel)
+            return self._slots[model]
+
+    def keep_alive_seconds(self, value):
+        """Seconds of an Ollama keep_alive ("30m", "1h30m", 300, "-1"), None for ever"""
+        if value is None:
+            return self.keep_alive
+        if isinstance(value, (int, float)) or re.fullmatch(r"-?[0-9.]+", str(value)):
+            seconds = float(value)
+        else:
+            parts = re.findall(r"(-?[0-9.]+)(ms|s|m|h)", str(value))
+            seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+        return None if seconds < 0 else seconds
+
+    def resident(self):
+        """Models currently loaded, with the time their keep_alive expires"""
+        now = time.time()
+        with self._lock:
+            return {model: expires for model, expires in self.loaded.items() if expires is None or expires > now}
+
+    def load(self, model, keep_alive=None):
+        """
+        Sleep for the load time unless the model is resident, then renew its
+        keep_alive. Requests arriving during a load wait for it, as in Ollama.
+        Returns the load duration in ns.
+        """
+        keep_seconds = self.keep_alive_seconds(keep_alive)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model, threading.Lock())
+        with load_lock:
+            load_ns = 0
+            if model not in self.resident():
+                with self._lock:
+                    self.loads += 1
+                if self.load_time:
+                    time.sleep(self.load_time)
+                    load_ns = int(self.load_time * 1e9)
+            with self._lock:
+                self.loaded[model] = None if keep_seconds is None else time.time() + keep_seconds
+        return load_ns
+
+    def tokens(self, prompt):
+        # Deterministic answer that depends on the prompt, like a model with temperature 0
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        return [WORDS[(seed + i) % len(WORDS)] + " " for i in range(self.response_tokens)]
+
+    def embedding(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 - 0.5 for i in range(self.embedding_dim)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            return body
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": model} for model in self.fake.loaded]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [
+                {"name": model, "model": model,
+                 "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(expires or 0x7fffffff))}
+                for model, expires in self.fake.resident().items()]})
+        elif self.path == "/":
+            self._send_json({"status": "Ollama is running"})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self._read_body() or b"{}")
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, 400)
+            return
+
+        model = payload.get("model", "")
+        if self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            with self.fake.slot(model):
+                load_ns = self.fake.load(model, payload.get("keep_alive"))
+            self._send_json({"model": model, "embeddings": [self.fake.embedding(text) for text in inputs],
+                             "load_duration": load_ns, "prompt_eval_count": sum(len(t) // 4 for t in inputs)})
+        elif self.path == "/api/generate":
+            self._generate(model, payload)
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, model, payload):
+        fake = self.fake
+        prompt = payload.get("prompt", "")
+        stream = payload.get("stream", True)
+
+        with fake.slot(model):
+            load_ns = fake.load(model, payload.get("keep_alive"))
+            if not prompt and not payload.get("images"):
+                # Empty prompt: Ollama only loads the model (used for warm-up)
+                self._send_json({"model": model, "response": "", "done": True, "load_duration": load_ns})
+                return
+
+            time.sleep(fake.latency)
+            stats = {
+                "load_duration": load_ns,
+                "prompt_eval_count": len(prompt) // 4,
+                "prompt_eval_duration": int(fake.latency * 1e9),
+                "eval_count": fake.response_tokens,
+                "eval_duration": int(fake.response_tokens / fake.tokens_per_second * 1e9),
+            }
+            interval = 1.0 / fake.tokens_per_second
+            tokens = fake.tokens(prompt)
+
+            if not stream:
+                time.sleep(interval * len(tokens))
+                self._send_json({"model": model, "response": "".join(tokens), "done": True, **stats})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(interval)
+                    self._write_chunk({"model": model, "response": token, "done": False})
+                self._write_chunk({"model": model, "response": "", "done": True, **stats})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+
+def start_server(port=0, host="127.0.0.1", **options):
+    """
+    Start a fake Ollama server in a daemon thread.
+
+    Returns:
+        tuple: (server, base URL); server.fake holds the FakeOllama state
+    """
+    fake = FakeOllama(**options)
+    handler = type("Handler", (FakeOllamaHandler,), {"fake": fake})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--parallel", type=int, default=4, help="Concurrent requests per model")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Seconds to load a model that is not resident")
+    parser.add_argument("--keep-alive", type=float, default=300.0,
+                        help="Seconds a model stays loaded after a request without keep_alive (Ollama: 5m)")
+
+
+def server_options(args):
+    return {
+        "latency": args.latency,
+        "tokens_per_second": args.tokens_per_second,
+        "response_tokens": args.response_tokens,
+        "parallel": args.parallel,
+        "load_time": args.load_time,
+        "keep_alive": args.keep_alive,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_server(args.port, args.host, **server_options(args))
+    print(f"Fake Ollama listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+End-to-end load test of the Flask service against the fake Ollama server.
+
+Usage:
+    python benchmarks/load_test.py [--scenarios summarize,labels,upload] [--concurrency 8]
+        [--requests 40] [--uploads 6] [--baseline benchmarks/baseline.json] [--save-baseline PATH]
+        [--no-warmup] [--app-url URL] [--ollama-url URL] [fake Ollama options, see fake_ollama.py]
+
+By default the fake Ollama server and the app (werkzeug, threaded) both run
+in this process, with the job database, caches and vector store in a
+temporary directory and the result and response caches disabled, so every
+upload and every text is processed end to end. Pass --app-url/--ollama-url to target running servers
+instead (the app must then point at the fake server itself).
+
+Scenarios:
+    coldstart   Time from app start until /readyz reports every model resident,
+                then one /summarize (run it first, with --load-time, to see
+                the model loads; --no-warmup starts the app without warm-up)
+    summarize   POST /summarize with a text excerpt of a bundled PDF, reading the whole stream
+    labels      POST /generate_labels with an issue, reading the whole stream
+    upload      POST /upload/pdf with the PDFs of user_pdf/ and poll the job until it finishes
+
+For every scenario the report has throughput, p50/p95/p99 latency (time to
+first byte and total) and, for uploads, job completion time. --baseline
+compares the run against a stored report and exits with status 1 when a
+latency grows or the throughput drops by more than --tolerance.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_ollama
+
+ISSUES = [
+    "App crashes with a NullPointerException when saving a profile without an avatar.",
+    "Add dark mode support to the settings page.",
+    "The README install instructions reference a script that no longer exists.",
+    "Login takes more than ten seconds on slow networks; we should cache the token.",
+]
+
+JOB_POLL_INTERVAL = 0.1
+JOB_TIMEOUT = 600
+
+
+def percentile(values, p):
+    """Linear-interpolated percentile of a list of numbers (p in 0..100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def distribution(values):
+    return {f"p{p}": round(percentile(values, p), 4) if values else None for p in (50, 95, 99)}
+
+
+def start_app(ollama_url, workdir, cache, warmup=True):
+    """Import the app against the fake server and serve it from a background thread"""
+    os.environ.update({
+        "MODEL_WARMUP": "true" if warmup else "false",
+        "OLLAMA_SERVER_URL": ollama_url,
+        "JOB_DB_PATH": os.path.join(workdir, "jobs.db"),
+        "RESULT_CACHE_DIR": os.path.join(workdir, "cache"),
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(workdir, "vector_store"),
+        # Every simulated user comes from 127.0.0.1: no per-client rate limit
+        "ADMISSION_CLIENT_RATE": "0",
+    })
+    if not cache:
+        # Every simulated user posts the same texts: measure generations, not replays
+        os.environ["RESULT_CACHE_MAX_BYTES"] = "0"
+        os.environ["RESPONSE_CACHE"] = "false"
+
+    from werkzeug.serving import make_server
+    os.chdir(workdir)  # user_pdf/ and its job directories live in the temporary directory
+    import app as service
+
+    server = make_server("127.0.0.1", 0, service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="app-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def timed_stream(session, url, payload):
+    """POST and read a streamed body, returns (ttfb, total, ok)"""
+    start = time.perf_counter()
+    with session.post(url, json=payload, stream=True, timeout=JOB_TIMEOUT) as response:
+        ttfb = None
+        for chunk in response.iter_content(chunk_size=None):
+            if ttfb is None and chunk:
+                ttfb = time.perf_counter() - start
+        total = time.perf_counter() - start
+        return ttfb if ttfb is not None else total, total, response.status_code == 200
+
+
+def run_upload(session, app_url, pdf_path):
+    """Upload a PDF and wait for its job, returns (upload latency, completion time, ok)"""
+    start = time.perf_counter()
+    with open(pdf_path, "rb") as f:
+        response = session.post(f"{app_url}/upload/pdf", timeout=JOB_TIMEOUT,
+                                files={"file": (os.path.basename(pdf_path), f, "application/pdf")})
+    upload_seconds = time.perf_counter() - start
+    if response.status_code not in (200, 202):
+        return upload_seconds, None, False
+
+    job_id = response.json()["job_id"]
+    while time.perf_counter() - start < JOB_TIMEOUT:
+        status = session.get(f"{app_url}/job/status/{job_id}", timeout=30).json()
+        if status.get("status") in ("completed", "failed"):
+            return upload_seconds, time.perf_counter() - start, status["status"] == "completed"
+        time.sleep(JOB_POLL_INTERVAL)
+    return upload_seconds, None, False
+
+
+def run_coldstart(session, app_url, started, warmup, excerpt):
+    """
+    Cold start of the app (started at perf_counter() value `started`):
+    seconds until /readyz answers 200, then the first /summarize.
+    """
+    ready_seconds = None
+    if warmup:
+        while time.perf_counter() - started < JOB_TIMEOUT:
+            if session.get(f"{app_url}/readyz", timeout=30).status_code == 200:
+                ready_seconds = time.perf_counter() - started
+                break
+            time.sleep(JOB_POLL_INTERVAL)
+    ttfb, total, ok = timed_stream(session, f"{app_url}/summarize", {"text": excerpt})
+    return {
+        "requests": 1,
+        "errors": 0 if ok and (ready_seconds is not None or not warmup) else 1,
+        "warmup": warmup,
+        "ready_seconds": round(ready_seconds, 4) if ready_seconds is not None else None,
+        "first_ttfb": round(ttfb, 4),
+        "first_latency": round(total, 4),
+    }
+
+
+def run_scenario(name, count, concurrency, task):
+    """Run task(i) count times with the given concurrency and summarise the results"""
+    local = threading.local()
+
+    def call(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        try:
+            return task(local.session, i)
+        except requests.RequestException:
+            return None, None, False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(count)))
+    elapsed = time.perf_counter() - start
+
+    ok = [result for result in results if result[2]]
+    first = [result[0] for result in ok if result[0] is not None]
+    second = [result[1] for result in ok if result[1] is not None]
+    report = {
+        "requests": count,
+        "errors": count - len(ok),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(ok) / elapsed, 3) if elapsed else None,
+    }
+    if name == "upload":
+        report["upload_latency"] = distribution(first)
+        report["job_completion"] = distribution(second)
+    else:
+        report["ttfb"] = distribution(first)
+        report["latency"] = distribution(second)
+    return report
+
+
+def compare(report, baseline, tolerance, min_delta):
+    """
+    Print the change against the baseline, return the regressions.
+
+    A latency only regresses if it grew by more than tolerance (relative) and
+    min_delta seconds (absolute), so jitter on tiny values is not reported.
+    Upload latency is shown but not gated: it mostly measures CPU contention
+    with the extraction running for earlier uploads.
+    """
+    regressions = []
+    for scenario, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        rows = [("throughput", current.get("throughput"), previous.get("throughput"), True)]
+        for metric in ("ttfb", "latency", "upload_latency", "job_completion"):
+            for p, value in current.get(metric, {}).items():
+                rows.append((f"{metric} {p}", value, previous.get(metric, {}).get(p), False))
+        for metric in ("ready_seconds", "first_ttfb", "first_latency"):
+            if metric in current:
+                rows.append((metric, current[metric], previous.get(metric), False))
+        for label, value, old, higher_is_better in rows:
+            if value is None or not old:
+                continue
+            change = (value - old) / old
+            worse = -change if higher_is_better else change
+            significant = (higher_is_better or abs(value - old) > min_delta) and not label.startswith("upload_latency")
+            flag = "  REGRESSION" if worse > tolerance and significant else ""
+            print(f"  {scenario:<10} {label:<20} {old:>9.3f} -> {value:>9.3f}  {change:+7.1%}{flag}")
+            if flag:
+                regressions.append(f"{scenario} {label}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="summarize,labels,upload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40, help="Requests per streaming scenario")
+    parser.add_argument("--uploads", type=int, default=6, help="PDF uploads in the upload scenario")
+    parser.add_argument("--pdf-dir", default=os.path.join(ROOT_DIR, "user_pdf"))
+    parser.add_argument("--app-url", help="Test a running app instead of starting one")
+    parser.add_argument("--ollama-url", help="Use a running (fake) Ollama instead of starting one")
+    parser.add_argument("--cache", action="store_true", help="Keep the result and response caches enabled")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false",
+                        help="Start the app without loading the models (MODEL_WARMUP=false)")
+    parser.add_argument("--baseline", help="Compare against this stored report")
+    parser.add_argument("--save-baseline", help="Write the report to this path")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--min-delta", type=float, default=0.25, help="Ignore latency changes below this many seconds")
+    fake_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    # The in-process app runs from a temporary directory
+    for name in ("baseline", "save_baseline"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    pdfs = sorted(glob.glob(os.path.join(os.path.abspath(args.pdf_dir), "*.pdf")))
+    if not pdfs:
+        parser.error(f"No PDFs found in {args.pdf_dir}")
+    with open(pdfs[0], "rb") as f:
+        import pymupdf
+        with pymupdf.open(stream=f.read(), filetype="pdf") as doc:
+            excerpt = "".join(page.get_text() for page in doc)[:8000]
+
+    ollama_url = args.ollama_url
+    if not ollama_url:
+        _, ollama_url = fake_ollama.start_server(**fake_ollama.server_options(args))
+
+    started = time.perf_counter()
+    app_url = args.app_url or start_app(ollama_url, tempfile.mkdtemp(prefix="load_test_"), args.cache, args.warmup)
+
+    tasks = {
+        "summarize": (args.requests, lambda session, i: timed_stream(
+            session, f"{app_url}/summarize", {"text": excerpt})),
+        "labels": (args.requests, lambda session, i: timed_stream(
+            session, f"{app_url}/generate_labels", {"text": ISSUES[i % len(ISSUES)]})),
+        "upload": (args.uploads, lambda session, i: run_upload(session, app_url, pdfs[i % len(pdfs)])),
+    }
+
+    report = {
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "uploads": args.uploads,
+            "warmup": args.warmup,
+            "fake_ollama": None if args.ollama_url else fake_ollama.server_options(args),
+        },
+        "host": {"cpus": os.cpu_count(), "python": platform.python_version()},
+        "scenarios": {},
+    }
+    for name in args.scenarios.split(","):
+        if name == "coldstart":
+            report["scenarios"][name] = run_coldstart(requests.Session(), app_url, started, args.warmup, excerpt)
+            continue
+        count, task = tasks[name]
+        report["scenarios"][name] = run_scenario(name, count, args.concurrency, task)
+
+    print(json.dumps(report, indent=2))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Warning: baseline was recorded with a different configuration")
+        if baseline.get("host") != report["host"]:
+            print(f"Warning: baseline was recorded on a different host ({baseline.get('host')})")
+        print(f"Against baseline {args.baseline}:")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            status = 1
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Models and Ollama servers used by the service (override through the environment).
+
+Every endpoint and pipeline stage is a route with its model, its pool of
+backends and an optional fallback model (see routing.py). Every module takes
+its models from here, and the dockerfile pulls the list printed by
+`python config.py`, so the models that are pulled, preloaded and called are
+always the same.
+"""
+import json
+import os
+from collections import namedtuple
+
+# Ollama servers: one by default; figures, PDF summaries and embeddings can each
+# go elsewhere. Every *_SERVER_URL may list several servers, comma-separated:
+# requests are spread over them by least outstanding requests (routing.py)
+OLLAMA_SERVER_URL = os.environ.get("OLLAMA_SERVER_URL", "http://localhost:11434")
+GEMMA_SERVER_URL = os.environ.get("GEMMA_SERVER_URL", OLLAMA_SERVER_URL)
+DEEPSEEK_SERVER_URL = os.environ.get("DEEPSEEK_SERVER_URL", OLLAMA_SERVER_URL)
+EMBEDDING_SERVER_URL = os.environ.get("EMBEDDING_SERVER_URL", OLLAMA_SERVER_URL)
+
+# /summarize, /generate_labels and /generate_labels/batch
+TEXT_MODEL_NAME = os.environ.get("TEXT_MODEL_NAME", "deepseek-r1:7b")
+# PDF figures, PDF summaries and /ask answers, embeddings of ingested documents
+GEMMA_MODEL_NAME = os.environ.get("GEMMA_MODEL_NAME", "gemma3:4b")
+DEEPSEEK_MODEL_NAME = os.environ.get("DEEPSEEK_MODEL_NAME", "deepseek-r1:7b")
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "nomic-embed-text")
+
+# Load shedding: interactive requests (/summarize, /generate_labels, /ask) go to
+# this smaller model while the estimated queue wait of their own model exceeds
+# FALLBACK_QUEUE_SECONDS (empty disables the fallback)
+FALLBACK_MODEL_NAME = os.environ.get("FALLBACK_MODEL_NAME", "")
+FALLBACK_QUEUE_SECONDS = float(os.environ.get("FALLBACK_QUEUE_SECONDS", 10))
+
+# JSON file overriding routes, e.g. {"summarize": {"model": "...", "backends": ["http://..."],
+# "fallback_model": "deepseek-r1:1.5b", "fallback_queue_seconds": 5}}
+MODEL_ROUTES_FILE = os.environ.get("MODEL_ROUTES_FILE")
+
+# How long Ollama keeps a model loaded after each request ("30m", "1h", "-1" for
+# ever); sent with every request, empty leaves it to Ollama's OLLAMA_KEEP_ALIVE
+MODEL_KEEP_ALIVE = os.environ.get("MODEL_KEEP_ALIVE", "30m")
+
+MODEL_KIND_GENERATE = "generate"
+MODEL_KIND_EMBED = "embed"
+
+# Routes: the endpoints and pipeline stages that call a model
+ROUTE_SUMMARIZE = "summarize"      # /summarize
+ROUTE_LABELS = "labels"            # /generate_labels and /generate_labels/batch
+ROUTE_FIGURES = "figures"          # figure analysis of PDF jobs
+ROUTE_PDF_SUMMARY = "pdf_summary"  # summaries of PDF jobs
+ROUTE_ASK = "ask"                  # /ask answers
+ROUTE_EMBEDDING = "embedding"      # document ingestion and /ask questions
+
+Route = namedtuple("Route", ["name", "model", "backends", "fallback_model", "fallback_queue_seconds", "kind"])
+
+
+def server_urls(value):
+    """List of servers from a comma-separated setting"""
+    return tuple(dict.fromkeys(url.strip().rstrip("/") for url in value.split(",") if url.strip()))
+
+
+def load_routes(path=MODEL_ROUTES_FILE):
+    """
+    Routes from the environment, overridden per route by the JSON file at path.
+
+    Returns:
+        dict: Route by name
+
+    Raises:
+        ValueError: Unknown route or field in the file, or a route without backends
+    """
+    fallback = FALLBACK_MODEL_NAME or None
+    routes = {
+        ROUTE_SUMMARIZE: Route(ROUTE_SUMMARIZE, TEXT_MODEL_NAME, server_urls(OLLAMA_SERVER_URL),
+                               fallback, FALLBACK_QUEUE_SECONDS, MODEL_KIND_GENERATE),
+        ROUTE_LABELS: Route(ROUTE_LABELS, TEXT_MODEL_NAME, server_urls(OLLAMA_SERVER_URL),
+                            fallback, FALLBACK_QUEUE_SECONDS, MODEL_KIND_GENERATE),
+        ROUTE_FIGURES: Route(ROUTE_FIGURES, GEMMA_MODEL_NAME, server_urls(GEMMA_SERVER_URL),
+                             None, FALLBACK_QUEUE_SECONDS, MODEL_KIND_GENERATE),
+        ROUTE_PDF_SUMMARY: Route(ROUTE_PDF_SUMMARY, DEEPSEEK_MODEL_NAME, server_urls(DEEPSEEK_SERVER_URL),
+                                 None, FALLBACK_QUEUE_SECONDS, MODEL_KIND_GENERATE),
+        ROUTE_ASK: Route(ROUTE_ASK, DEEPSEEK_MODEL_NAME, server_urls(DEEPSEEK_SERVER_URL),
+                         fallback, FALLBACK_QUEUE_SECONDS, MODEL_KIND_GENERATE),
+        ROUTE_EMBEDDING: Route(ROUTE_EMBEDDING, EMBEDDING_MODEL_NAME, server_urls(EMBEDDING_SERVER_URL),
+                               None, FALLBACK_QUEUE_SECONDS, MODEL_KIND_EMBED),
+    }
+
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        for name, fields in overrides.items():
+            if name not in routes:
+                raise ValueError(f"Unknown route {name!r} in {path}, expected one of {', '.join(routes)}")
+            unknown = set(fields) - {"model", "backends", "fallback_model", "fallback_queue_seconds"}
+            if unknown:
+                raise ValueError(f"Unknown field(s) {', '.join(sorted(unknown))} of route {name!r} in {path}")
+            fields = dict(fields)
+            if "backends" in fields:
+                backends = fields["backends"]
+                fields["backends"] = server_urls(backends if isinstance(backends, str) else ",".join(backends))
+            routes[name] = routes[name]._replace(**fields)
+
+    for route in routes.values():
+        if not route.backends:
+            raise ValueError(f"Route {route.name!r} has no backends")
+    return routes
+
+
+ROUTES = load_routes()
+
+
+def required_models():
+    """
+    Models the service calls, with their server: every model (and fallback
+    model) of every route on each of its backends.
+
+    Returns:
+        list: (server_url, model, kind) tuples without duplicates, kind being
+            MODEL_KIND_GENERATE or MODEL_KIND_EMBED
+    """
+    models = []
+    for route in ROUTES.values():
+        for backend in route.backends:
+            models.append((backend, route.model, route.kind))
+            if route.fallback_model:
+                models.append((backend, route.fallback_model, route.kind))
+    return list(dict.fromkeys(models))
+
+
+if __name__ == "__main__":
+    # One model name per line, for `ollama pull`
+    print("\n".join(dict.fromkeys(model for _, model, _ in required_models())))
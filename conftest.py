@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Importing app opens the job database, starts the job worker and warms up the
+# models: keep tests off the real database and Ollama
+os.environ["JOB_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="jobs-test-"), "jobs.db")
+os.environ["JOB_CONCURRENCY"] = "0"
+os.environ["MODEL_WARMUP"] = "false"
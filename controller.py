@@ -1,6 +1,40 @@
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+import multiprocessing
+import threading
 import pymupdf
 
+from result_cache import get_cache, make_key, sha256_file
+
+# Page-parallel extraction settings (override through the environment)
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_PAGES = int(os.environ.get("PARALLEL_MIN_PAGES", 32))
+# Pages per pool task when iter_pdf_pages parses a large document in parallel;
+# small ranges let the first pages be yielded early
+PARALLEL_RANGE_PAGES = int(os.environ.get("PARALLEL_RANGE_PAGES", 8))
+
+PAGE_BANNER = "\n\n----- Page {page_number} -----\n\n"
+
+# OCR fallback for scanned pages (OCR_FALLBACK=false disables it): a page with
+# fewer than OCR_MIN_CHARS non-whitespace characters in its text layer is
+# rendered at OCR_DPI and read by Tesseract, if it has an image to read from
+OCR_FALLBACK = os.environ.get("OCR_FALLBACK", "true").lower() in ("1", "true", "yes")
+OCR_MIN_CHARS = int(os.environ.get("OCR_MIN_CHARS", 32))
+OCR_LANGUAGE = os.environ.get("OCR_LANGUAGE", "eng")
+OCR_DPI = int(os.environ.get("OCR_DPI", 300))
+# Pages iter_pdf_pages parses ahead while earlier pages are being OCR'd
+OCR_LOOKAHEAD_PAGES = int(os.environ.get("OCR_LOOKAHEAD_PAGES", 4 * EXTRACTION_WORKERS))
+
+# Where the text of a page comes from
+PAGE_SOURCE_TEXT = "text"            # the PDF's text layer
+PAGE_SOURCE_OCR = "ocr"              # OCR of the rendered page
+PAGE_SOURCE_EMPTY = "empty"          # no text layer and nothing OCR could read
+PAGE_SOURCE_OCR_FAILED = "ocr_failed"  # near-empty text layer, OCR raised an error
+
+# Part of the document cache key: other settings give other page texts
+OCR_SETTINGS_KEY = make_key(OCR_FALLBACK, OCR_MIN_CHARS, OCR_LANGUAGE, OCR_DPI)
+
 def extract_text_from_pdf(pdf_file, output_dir=None):
     """
     Extract text from a PDF file using PyMuPDF.
@@ -98,30 +132,403 @@ def extract_images_from_pdf(pdf_file, output_dir):
     except Exception as e:
         return f"Error extracting images: {str(e)}"
 
-def extract_text_and_images(pdf_file, output_dir=None):
+def _extract_page(doc, page_num, output_dir=None, figure_preprocessor=None):
+    """
+    Extract the text and (if output_dir is set) the images of one page.
+    
+    With a figure_preprocessor (image_preprocessing.FigurePreprocessor), images
+    are filtered, downsized and saved as JPEG by it instead of as full PNGs.
+    
+    Returns:
+        tuple: (page_text, list of image records with "path", "page" and "xref")
+    """
+    page = doc[page_num]
+    page_text = page.get_text()
+    images = _extract_images(doc, page_num, page.get_images(), output_dir, figure_preprocessor) if output_dir else []
+    return page_text, images
+
+def _extract_images(doc, page_num, image_list, output_dir, figure_preprocessor=None):
+    """
+    Save the images of one page, listed by page.get_images().
+    
+    Returns:
+        list: Image records with "path", "page" and "xref"
+    """
+    images = []
+    if output_dir:
+        for img_num, img in enumerate(image_list, start=1):
+            xref = img[0]  # Get the XREF of the image
+            
+            if figure_preprocessor is not None:
+                image = figure_preprocessor.prepare(doc, xref, img[2], img[3], page_num + 1, output_dir,
+                                                    f"page_{page_num + 1}-image_{img_num}")
+                if image is not None:
+                    images.append(image)
+                continue
+            
+            try:
+                pix = pymupdf.Pixmap(doc, xref)
+                
+                # Convert CMYK to RGB if needed
+                if pix.n - pix.alpha > 3:
+                    pix = pymupdf.Pixmap(pymupdf.csRGB, pix)
+                
+                # Save the image
+                img_filename = f"page_{page_num + 1}-image_{img_num}.png"
+                img_path = os.path.join(output_dir, img_filename)
+                pix.save(img_path)
+                images.append({"path": img_path, "page": page_num + 1, "xref": xref})
+                
+                # Clean up pixmap
+                pix = None
+                
+            except Exception:
+                continue  # Skip images that can't be extracted
+    
+    return images
+
+def _extract_page_range(pdf_path, start, stop, output_dir):
+    """Process pool worker: open its own handle and extract pages [start, stop)"""
+    doc = pymupdf.open(pdf_path)
+    try:
+        return [(page_num,) + _extract_page(doc, page_num, output_dir) for page_num in range(start, stop)]
+    finally:
+        doc.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Shared process pool for page-parallel extraction, created on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def _page_ranges(page_count, parts):
+    """Split [0, page_count) into at most `parts` contiguous ranges of similar size"""
+    parts = max(1, min(parts, page_count))
+    size, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def _visible_chars(text):
+    """Number of non-whitespace characters of a text"""
+    return len("".join(text.split()))
+
+def needs_ocr(page_text):
+    """Whether a page's text layer is empty or near-empty enough to try OCR"""
+    return OCR_FALLBACK and _visible_chars(page_text) < OCR_MIN_CHARS
+
+def _ocr_page(doc, page_num, language=OCR_LANGUAGE, dpi=OCR_DPI):
+    """
+    OCR one page of an open document.
+    
+    Returns:
+        str or None: OCR text, or None if the page has no image to read text from
+    """
+    page = doc[page_num]
+    if not page.get_images():
+        return None
+    tp = page.get_textpage_ocr(language=language, dpi=dpi, full=True)
+    return page.get_text(textpage=tp)
+
+# Document held open by a pool worker between OCR tasks, with its (path, mtime, size)
+_worker_doc = None
+_worker_doc_key = None
+
+def _worker_document(pdf_path):
+    """The open document of this pool worker; reopened only for another file"""
+    global _worker_doc, _worker_doc_key
+    stat = os.stat(pdf_path)
+    key = (pdf_path, stat.st_mtime_ns, stat.st_size)
+    if key != _worker_doc_key:
+        if _worker_doc is not None:
+            _worker_doc.close()
+        _worker_doc = pymupdf.open(pdf_path)
+        _worker_doc_key = key
+    return _worker_doc
+
+def _ocr_page_worker(pdf_path, page_num, language, dpi):
+    """Process pool worker: OCR a page of the worker's open document"""
+    return _ocr_page(_worker_document(pdf_path), page_num, language, dpi)
+
+def _parse_page_range(pdf_path, start, stop):
+    """Process pool worker: (page_num, page_text, image_list) of pages [start, stop) of the worker's open document"""
+    doc = _worker_document(pdf_path)
+    return [(page_num, doc[page_num].get_text(), doc[page_num].get_images()) for page_num in range(start, stop)]
+
+def _parsed_pages(pdf_file, doc, workers):
+    """
+    (page_num, page_text, image_list) of every page, in order.
+    
+    Documents on disk with at least PARALLEL_MIN_PAGES pages are parsed by the
+    process pool in ranges of PARALLEL_RANGE_PAGES, at most 2 * workers ranges
+    ahead of the page being yielded; other documents are parsed here.
+    """
+    page_count = len(doc)
+    if not isinstance(pdf_file, (str, os.PathLike)) or workers < 2 or page_count < PARALLEL_MIN_PAGES:
+        for page_num in range(page_count):
+            page = doc[page_num]
+            yield page_num, page.get_text(), page.get_images()
+        return
+    
+    pool = _get_pool()
+    ranges = iter(_page_ranges(page_count, -(-page_count // PARALLEL_RANGE_PAGES)))
+    pending = deque()
+    
+    def submit_next():
+        page_range = next(ranges, None)
+        if page_range is not None:
+            pending.append(pool.submit(_parse_page_range, os.fspath(pdf_file), *page_range))
+    
+    try:
+        for _ in range(2 * workers):
+            submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        for future in pending:
+            future.cancel()
+
+class PageOcr:
+    """
+    OCR fallback of one document.
+    
+    Near-empty pages of a PDF on disk are OCR'd by the shared process pool,
+    whose workers keep the document open across pages; file-like objects and
+    single-worker setups OCR in this process with the caller's open document.
+    Results are cached per (PDF hash, page) in the result cache.
     """
-    Extract both text and images from a PDF file.
+    
+    def __init__(self, pdf_file, doc, workers=None):
+        self.pdf_file = pdf_file
+        self.doc = doc
+        self.workers = workers or EXTRACTION_WORKERS
+        self.is_path = isinstance(pdf_file, (str, os.PathLike))
+        self._pdf_hash = None
+        self._cache_keys = {}  # page number -> cache key of OCR results not cached yet
+        self._error_reported = False
+    
+    def _cache_key(self, page_num):
+        if not self.is_path:
+            return None
+        if self._pdf_hash is None:
+            self._pdf_hash = sha256_file(self.pdf_file)
+        return make_key(self._pdf_hash, page_num, OCR_LANGUAGE, OCR_DPI)
+    
+    def submit(self, page_num, page_text):
+        """
+        Start OCR of a page if its text layer is near-empty.
+        
+        Returns:
+            Future or None: Future of the OCR text (None: no image on the page),
+            or None if the text layer is used as is
+        """
+        if not needs_ocr(page_text):
+            return None
+        
+        cache_key = self._cache_key(page_num)
+        cached = get_cache().get("ocr", cache_key) if cache_key else None
+        if cached is not None:
+            future = Future()
+            future.set_result(cached["text"])
+            return future
+        
+        if self.is_path and self.workers >= 2:
+            future = _get_pool().submit(_ocr_page_worker, os.fspath(self.pdf_file), page_num,
+                                        OCR_LANGUAGE, OCR_DPI)
+        else:
+            future = Future()
+            try:
+                future.set_result(_ocr_page(self.doc, page_num))
+            except Exception as e:
+                future.set_exception(e)
+        if cache_key:
+            self._cache_keys[page_num] = cache_key
+        return future
+    
+    def finish(self, page_num, page_text, future):
+        """
+        Merge a page's OCR result (if any) with its text layer.
+        
+        Returns:
+            tuple: (page_text, source), source being one of the PAGE_SOURCE_* flags
+        """
+        if future is not None:
+            cache_key = self._cache_keys.pop(page_num, None)
+            try:
+                ocr_text = future.result()
+            except Exception as e:
+                if not self._error_reported:
+                    self._error_reported = True
+                    print(f"OCR error on page {page_num + 1}: {str(e)}")
+                return page_text, PAGE_SOURCE_OCR_FAILED
+            
+            if cache_key:
+                get_cache().put("ocr", cache_key, {"text": ocr_text})
+            if ocr_text and _visible_chars(ocr_text) > _visible_chars(page_text):
+                return ocr_text, PAGE_SOURCE_OCR
+        
+        return page_text, PAGE_SOURCE_TEXT if page_text.strip() else PAGE_SOURCE_EMPTY
+
+def extract_document(pdf_file, output_dir=None, workers=None):
+    """
+    Extract text and images from a PDF in a single pass per page.
+    
+    Small documents (and file-like objects) are processed with one open document
+    handle. Documents with at least PARALLEL_MIN_PAGES pages are split into page
+    ranges handled by a process pool, where every worker opens its own handle.
+    Pages with a near-empty text layer are then OCR'd (see PageOcr). Page texts
+    are joined once at the end.
     
     Args:
         pdf_file: File-like object or path to PDF
-        output_dir (str, optional): Directory to save extracted content
+        output_dir (str, optional): Directory to save extracted content. If None,
+            only text is extracted.
+        workers (int, optional): Process pool width, defaults to EXTRACTION_WORKERS
         
     Returns:
-        tuple: (extracted_text, list_of_image_paths)
+        dict: "text" (str), "image_paths" (list), "images" (list of image records)
+            and "page_sources" (PAGE_SOURCE_* flag of every page)
     """
-    # If output directory is specified, create it
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # Extract text
-    text_content = extract_text_from_pdf(pdf_file, output_dir)
+    workers = workers or EXTRACTION_WORKERS
+    is_path = isinstance(pdf_file, (str, os.PathLike))
     
-    # Extract images if output directory is specified
-    image_paths = []
+    doc = pymupdf.open(pdf_file)
+    try:
+        page_count = len(doc)
+        if not is_path or workers < 2 or page_count < PARALLEL_MIN_PAGES:
+            pages = [(page_num,) + _extract_page(doc, page_num, output_dir) for page_num in range(page_count)]
+        else:
+            pool = _get_pool()
+            futures = [
+                pool.submit(_extract_page_range, os.fspath(pdf_file), start, stop, output_dir)
+                for start, stop in _page_ranges(page_count, workers)
+            ]
+            pages = [page for future in futures for page in future.result()]
+        
+        # All OCR pages are submitted before the first result is awaited
+        ocr = PageOcr(pdf_file, doc, workers)
+        ocr_futures = [ocr.submit(page_num, page_text) for page_num, page_text, _ in pages]
+        page_texts = [
+            ocr.finish(page_num, page_text, future)
+            for (page_num, page_text, _), future in zip(pages, ocr_futures)
+        ]
+    finally:
+        doc.close()
+    
+    full_text = "".join(
+        PAGE_BANNER.format(page_number=page_num + 1) + page_text
+        for page_num, (page_text, _) in enumerate(page_texts)
+    )
+    images = [image for _, _, page_images in pages for image in page_images]
+    
+    # Save to file if output directory is specified
     if output_dir:
-        image_paths = extract_images_from_pdf(pdf_file, output_dir)
+        text_output_path = os.path.join(output_dir, "extracted_text.txt")
+        with open(text_output_path, "w", encoding="utf-8") as text_out:
+            text_out.write(full_text)
+    
+    return {
+        "text": full_text,
+        "image_paths": [image["path"] for image in images],
+        "images": images,
+        "page_sources": [source for _, source in page_texts]
+    }
+
+def iter_pdf_pages(pdf_file, output_dir=None, figure_preprocessor=None, workers=None):
+    """
+    Extract a PDF page by page, yielding each page as soon as it is parsed.
+    
+    Consumers can start working on early pages (e.g. analysing their figures)
+    while later pages are parsed. Documents with at least PARALLEL_MIN_PAGES
+    pages are parsed by the process pool in page ranges (see _parsed_pages);
+    their images are still extracted here, in page order, since the figure
+    preprocessor deduplicates across pages. Pages with a near-empty text
+    layer are OCR'd (see PageOcr) while parsing continues up to
+    OCR_LOOKAHEAD_PAGES ahead; pages are still yielded in order, and only
+    those in the window are held in memory.
+    
+    Args:
+        pdf_file: File-like object or path to PDF
+        output_dir (str, optional): Directory to save extracted images. If None,
+            only text is extracted.
+        figure_preprocessor (FigurePreprocessor, optional): Filters and downsizes
+            the images; it keeps its state (seen images, decisions) across pages
+        workers (int, optional): Process pool width, defaults to EXTRACTION_WORKERS
+        
+    Yields:
+        tuple: (page_number, page_text, image_records, source), page_number being
+            1-based and source the page's PAGE_SOURCE_* flag
+    """
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    workers = workers or EXTRACTION_WORKERS
+    doc = pymupdf.open(pdf_file)
+    ocr = PageOcr(pdf_file, doc, workers)
+    window = deque()
+    
+    def finish_page():
+        page_num, page_text, images, future = window.popleft()
+        page_text, source = ocr.finish(page_num, page_text, future)
+        return page_num + 1, page_text, images, source
+    
+    try:
+        for page_num, page_text, image_list in _parsed_pages(pdf_file, doc, workers):
+            images = _extract_images(doc, page_num, image_list, output_dir, figure_preprocessor)
+            window.append((page_num, page_text, images, ocr.submit(page_num, page_text)))
+            while window and (window[0][3] is None or window[0][3].done()
+                              or len(window) > OCR_LOOKAHEAD_PAGES):
+                yield finish_page()
+        while window:
+            yield finish_page()
+    finally:
+        for _, _, _, future in window:
+            if future is not None:
+                future.cancel()
+        doc.close()
+
+def count_pdf_pages(pdf_file):
+    """Return the number of pages in a PDF"""
+    doc = pymupdf.open(pdf_file)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+def extract_text_and_images(pdf_file, output_dir=None):
+    """
+    Extract both text and images from a PDF file.
+    
+    Args:
+        pdf_file: File-like object or path to PDF
+        output_dir (str, optional): Directory to save extracted content
+        
+    Returns:
+        tuple: (extracted_text, list_of_image_paths)
+    """
+    try:
+        document = extract_document(pdf_file, output_dir)
+    except Exception as e:
+        return f"Error extracting text: {str(e)}", []
     
-    return text_content, image_paths
+    return document["text"], document["image_paths"]
 
 def ocr_pdf_page(pdf_file, page_num=0):
     """
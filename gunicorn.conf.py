@@ -0,0 +1,20 @@
+import os
+
+# SERVER_MODE=async (default): asgi_app on uvicorn workers, the streaming
+# endpoints (including /job/events) run on an event loop and the other routes
+# in threads
+# SERVER_MODE=sync: Flask on gunicorn's sync workers (one request per worker,
+# /job/events answers 501 unless SSE_MAX_STREAMS is set)
+SERVER_MODE = os.environ.get("SERVER_MODE", "async")
+
+if SERVER_MODE == "async":
+    wsgi_app = "asgi_app:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    worker_class = "sync"
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+# Sync workers are killed when a request (e.g. a long summary stream) outlives the timeout
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
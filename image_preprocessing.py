@@ -0,0 +1,158 @@
+import os
+
+import pymupdf
+
+from result_cache import make_key
+
+# Figure preprocessing before vision analysis (FIGURE_PREPROCESSING=false keeps
+# the full-resolution PNGs of every embedded image)
+FIGURE_PREPROCESSING = os.environ.get("FIGURE_PREPROCESSING", "true").lower() in ("1", "true", "yes")
+
+# Icons, logos and rules: images whose short side or area is below these are skipped
+FIGURE_MIN_SIDE = int(os.environ.get("FIGURE_MIN_SIDE", 64))
+FIGURE_MIN_AREA = int(os.environ.get("FIGURE_MIN_AREA", 128 * 128))
+
+# Near-duplicates: difference hashes at most this many bits apart (-1 disables)
+FIGURE_HASH_DISTANCE = int(os.environ.get("FIGURE_HASH_DISTANCE", 4))
+
+# Gemma 3's vision encoder works on 896x896 inputs; larger figures only cost
+# bandwidth and encoding time, so the long side is scaled down to this
+FIGURE_MAX_SIDE = int(os.environ.get("FIGURE_MAX_SIDE", 896))
+FIGURE_JPEG_QUALITY = int(os.environ.get("FIGURE_JPEG_QUALITY", 85))
+
+# Difference hash: 9x8 grayscale thumbnail, one bit per horizontal neighbour pair
+DHASH_WIDTH = 9
+DHASH_HEIGHT = 8
+
+SKIP_TOO_SMALL = "too_small"
+SKIP_DUPLICATE_XREF = "duplicate_xref"
+SKIP_DUPLICATE_IMAGE = "duplicate_image"
+SKIP_UNREADABLE = "unreadable"
+
+# Part of the document cache key: other settings give other figures and summaries
+SETTINGS_KEY = make_key(FIGURE_PREPROCESSING, FIGURE_MIN_SIDE, FIGURE_MIN_AREA, FIGURE_HASH_DISTANCE,
+                        FIGURE_MAX_SIDE, FIGURE_JPEG_QUALITY)
+
+
+def difference_hash(pix):
+    """64-bit perceptual (difference) hash of a pixmap"""
+    if pix.colorspace is None or pix.colorspace.n != 1 or pix.alpha:
+        pix = pymupdf.Pixmap(pymupdf.csGRAY, pix)
+    thumb = pymupdf.Pixmap(pix, DHASH_WIDTH, DHASH_HEIGHT)
+    samples = thumb.samples
+    stride = thumb.stride
+    value = 0
+    for y in range(DHASH_HEIGHT):
+        row = samples[y * stride:y * stride + DHASH_WIDTH]
+        for x in range(DHASH_WIDTH - 1):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def fit_size(width, height, max_side=FIGURE_MAX_SIDE):
+    """Scale (width, height) down so the long side is at most max_side"""
+    scale = max_side / max(width, height)
+    if scale >= 1:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def to_rgb(pix):
+    """Drop alpha and convert CMYK/indexed/other colorspaces so JPEG can encode the pixmap"""
+    if pix.alpha:
+        pix = pymupdf.Pixmap(pix, 0)
+    if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+        pix = pymupdf.Pixmap(pymupdf.csRGB, pix)
+    return pix
+
+
+class FigurePreprocessor:
+    """
+    Per-document figure filter: skips small and duplicate images, downsizes
+    the rest to the vision model's resolution and saves them as JPEG.
+
+    Every decision is appended to .decisions, in page order, for the job record.
+    """
+
+    def __init__(self, min_side=FIGURE_MIN_SIDE, min_area=FIGURE_MIN_AREA, hash_distance=FIGURE_HASH_DISTANCE,
+                 max_side=FIGURE_MAX_SIDE, quality=FIGURE_JPEG_QUALITY):
+        self.min_side = min_side
+        self.min_area = min_area
+        self.hash_distance = hash_distance
+        self.max_side = max_side
+        self.quality = quality
+        self.decisions = []
+        self._xrefs = {}
+        self._hashes = []
+
+    def _skip(self, decision, reason, **details):
+        decision.update(action="skipped", reason=reason, **details)
+        self.decisions.append(decision)
+        return None
+
+    def _find_duplicate(self, image_hash):
+        for known_hash, name in self._hashes:
+            if bin(known_hash ^ image_hash).count("1") <= self.hash_distance:
+                return name
+        return None
+
+    def prepare(self, doc, xref, width, height, page_number, output_dir, name):
+        """
+        Decide whether to analyse an embedded image, and write it if so.
+
+        Args:
+            doc (pymupdf.Document): Open document
+            xref (int): Image XREF
+            width (int), height (int): Image size from page.get_images()
+            page_number (int): 1-based page number
+            output_dir (str): Directory for the processed image
+            name (str): File name without extension, e.g. "page_3-image_1"
+
+        Returns:
+            dict: Image record ("path", "page", "xref") or None if the image is skipped
+        """
+        decision = {"name": name, "page": page_number, "xref": xref, "original_size": [width, height]}
+
+        # Cheap checks first, before the image is decoded
+        if min(width, height) < self.min_side or width * height < self.min_area:
+            return self._skip(decision, SKIP_TOO_SMALL)
+        if xref in self._xrefs:
+            return self._skip(decision, SKIP_DUPLICATE_XREF, duplicate_of=self._xrefs[xref])
+        self._xrefs[xref] = name
+
+        try:
+            pix = to_rgb(pymupdf.Pixmap(doc, xref))
+        except Exception as e:
+            return self._skip(decision, SKIP_UNREADABLE, error=str(e))
+
+        if self.hash_distance >= 0:
+            image_hash = difference_hash(pix)
+            duplicate = self._find_duplicate(image_hash)
+            if duplicate:
+                return self._skip(decision, SKIP_DUPLICATE_IMAGE, duplicate_of=duplicate)
+            self._hashes.append((image_hash, name))
+
+        size = fit_size(pix.width, pix.height, self.max_side)
+        resized = size != (pix.width, pix.height)
+        if resized:
+            pix = pymupdf.Pixmap(pix, size[0], size[1])
+
+        path = os.path.join(output_dir, f"{name}.jpg")
+        data = pix.tobytes("jpeg", jpg_quality=self.quality)
+        with open(path, "wb") as f:
+            f.write(data)
+
+        decision.update(action="resized" if resized else "kept", size=list(size), bytes=len(data))
+        self.decisions.append(decision)
+        return {"path": path, "page": page_number, "xref": xref}
+
+    def summary(self):
+        """Counts of kept, resized and skipped (by reason) images"""
+        summary = {"kept": 0, "resized": 0, "skipped": {}, "bytes": 0}
+        for decision in self.decisions:
+            if decision["action"] == "skipped":
+                summary["skipped"][decision["reason"]] = summary["skipped"].get(decision["reason"], 0) + 1
+            else:
+                summary[decision["action"]] += 1
+                summary["bytes"] += decision["bytes"]
+        return summary
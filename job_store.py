@@ -0,0 +1,313 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# Job store / worker queue settings (override through the environment)
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "jobs.db")
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", 2))
+JOB_MAX_QUEUE = int(os.environ.get("JOB_MAX_QUEUE", 50))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", 10))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", 60))
+
+# Queue states (the detailed pipeline status lives in the job record)
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    data TEXT NOT NULL,
+    owner TEXT,
+    heartbeat REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq);
+"""
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at JOB_MAX_QUEUE"""
+
+
+class JobStore:
+    """
+    Durable job records and queue backed by SQLite.
+
+    Every gunicorn worker opens the same database file, so status and result
+    lookups are consistent no matter which worker serves them. Writes go
+    through BEGIN IMMEDIATE transactions so record updates and queue claims
+    are atomic across processes.
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def create(self, job_id, record, payload=None, state=STATE_QUEUED, max_queue=None):
+        """
+        Insert a new job.
+
+        Args:
+            job_id (str): Job identifier
+            record (dict): Initial job record (status, filename, ...)
+            payload (dict, optional): Arguments for the job handler
+            state (str): Initial queue state
+            max_queue (int, optional): Reject with QueueFull if this many jobs are queued
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if max_queue is not None and state == STATE_QUEUED:
+                queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (STATE_QUEUED,)).fetchone()[0]
+                if queued >= max_queue:
+                    raise QueueFull(f"Job queue is full ({queued} jobs waiting)")
+            conn.execute(
+                "INSERT INTO jobs (job_id, state, payload, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, state, json.dumps(payload or {}), json.dumps(record), now, now)
+            )
+
+    def get(self, job_id):
+        """Return the job record, or None if the job does not exist"""
+        row = self._connection().execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id, **fields):
+        """Merge fields into the job record"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            record = json.loads(row[0])
+            record.update(fields)
+            conn.execute(
+                "UPDATE jobs SET data = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(record), time.time(), job_id)
+            )
+
+    def add_event(self, job_id, event, data):
+        """Append a progress event to a job's event log"""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, event, json.dumps(data), time.time())
+            )
+
+    def events_since(self, job_id, after_seq=0):
+        """
+        Return a job's events with a sequence number above after_seq.
+
+        Returns:
+            list: (seq, event, data) tuples in order
+        """
+        rows = self._connection().execute(
+            "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after_seq)
+        ).fetchall()
+        return [(seq, event, json.loads(data)) for seq, event, data in rows]
+
+    def delete_events(self, job_id, event=None):
+        """Drop a job's events, or only those of one type"""
+        with self._transaction() as conn:
+            if event is None:
+                conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            else:
+                conn.execute("DELETE FROM job_events WHERE job_id = ? AND event = ?", (job_id, event))
+
+    def claim(self, owner, max_running):
+        """
+        Atomically move the oldest queued job to running, unless max_running
+        jobs are already running across all processes.
+
+        Returns:
+            tuple or None: (job_id, payload) of the claimed job
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (STATE_RUNNING,)).fetchone()[0]
+            if running >= max_running:
+                return None
+            row = conn.execute(
+                "SELECT job_id, payload FROM jobs WHERE state = ? ORDER BY created_at LIMIT 1",
+                (STATE_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = ?, heartbeat = ?, updated_at = ? WHERE job_id = ?",
+                (STATE_RUNNING, owner, now, now, row[0])
+            )
+            return row[0], json.loads(row[1])
+
+    def heartbeat(self, owner):
+        """Refresh the heartbeat of every job this owner is running"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND state = ?",
+                (time.time(), owner, STATE_RUNNING)
+            )
+
+    def finish(self, job_id, owner):
+        """
+        Mark a job an owner was running as no longer queued or running.
+
+        A job requeued by requeue_stale (and maybe claimed by another worker
+        since) belongs to its new owner: the old one cannot finish it.
+
+        Returns:
+            bool: Whether the job was this owner's
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, updated_at = ? WHERE job_id = ? AND owner = ?",
+                (STATE_DONE, time.time(), job_id, owner)
+            )
+            return cursor.rowcount > 0
+
+    def requeue_stale(self, stale_seconds=JOB_STALE_SECONDS):
+        """
+        Put running jobs whose owner stopped heartbeating (crash, restart) back
+        in the queue. Their record keeps the last completed stage so the
+        handler can resume from there.
+
+        Returns:
+            int: Number of requeued jobs
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL WHERE state = ? AND heartbeat < ?",
+                (STATE_QUEUED, STATE_RUNNING, time.time() - stale_seconds)
+            )
+            return cursor.rowcount
+
+    def prune_finished(self, max_age):
+        """
+        Delete finished jobs not updated for max_age seconds, and their events.
+
+        Returns:
+            int: Number of deleted jobs
+        """
+        cutoff = time.time() - max_age
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE state = ? AND updated_at < ?)",
+                (STATE_DONE, cutoff)
+            )
+            cursor = conn.execute("DELETE FROM jobs WHERE state = ? AND updated_at < ?", (STATE_DONE, cutoff))
+            return cursor.rowcount
+
+    def counts(self):
+        """Return the number of queued and running jobs"""
+        rows = self._connection().execute(
+            "SELECT state, COUNT(*) FROM jobs WHERE state IN (?, ?) GROUP BY state",
+            (STATE_QUEUED, STATE_RUNNING)
+        ).fetchall()
+        counts = {STATE_QUEUED: 0, STATE_RUNNING: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class JobWorker:
+    """
+    Per-process pool of threads that claim jobs from a JobStore and run them.
+
+    At most `concurrency` jobs run at once across all processes sharing the
+    store. Running jobs are heartbeated; jobs left behind by a dead process
+    are requeued once their heartbeat goes stale.
+    """
+
+    def __init__(self, store, handler, concurrency=JOB_CONCURRENCY):
+        self.store = store
+        self.handler = handler
+        self.concurrency = concurrency
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker and heartbeat threads (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.concurrency):
+            threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def notify(self):
+        """Wake the workers after a job was submitted"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                claimed = self.store.claim(self.owner, self.concurrency)
+            except Exception as e:
+                print(f"Error claiming job: {str(e)}")
+                claimed = None
+
+            if claimed is None:
+                self._wake.wait(JOB_POLL_INTERVAL)
+                self._wake.clear()
+                continue
+
+            job_id, payload = claimed
+            try:
+                self.handler(job_id, **payload)
+            except Exception as e:
+                print(f"Error running job {job_id}: {str(e)}")
+            finally:
+                if not self.store.finish(job_id, self.owner):
+                    print(f"Job {job_id} was requeued while it ran here, leaving it to its new owner")
+
+    def _heartbeat(self):
+        while True:
+            try:
+                self.store.heartbeat(self.owner)
+                self.store.requeue_stale()
+            except Exception as e:
+                print(f"Error updating job heartbeat: {str(e)}")
+            time.sleep(JOB_HEARTBEAT_SECONDS)
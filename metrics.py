@@ -0,0 +1,292 @@
+import math
+import threading
+import time
+
+# Default histogram buckets in seconds, from a cache hit to a long summary
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label combination"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down.
+
+    Either set/inc/dec it, or give it a function that is called at scrape time
+    and returns the current value (a number, or a {label values tuple: value} dict).
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                return []
+            values = value.items() if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values)]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.seconds = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.histogram.observe(self.seconds, **self.labels)
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count of observations"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block; .seconds holds it afterwards"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, dict(series, buckets=list(series["buckets"]))) for key, series in self._values.items())
+        lines = []
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics.append(metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Metrics are per process: with several gunicorn workers, each worker is
+# scraped (or aggregated) separately
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time until a Flask handler returned its response (streamed bodies excluded)",
+    ["method", "endpoint", "status"])
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Duration of PDF pipeline stages",
+    ["stage", "model"])
+
+JOBS_FINISHED = Counter(
+    "pipeline_jobs_finished_total",
+    "PDF jobs that finished, by final status",
+    ["status"])
+
+JOBS_QUEUED = Gauge("pipeline_jobs_queued", "PDF jobs waiting for a worker")
+JOBS_RUNNING = Gauge("pipeline_jobs_running", "PDF jobs being processed")
+
+CACHE_REQUESTS = Counter(
+    "result_cache_requests_total",
+    "Result cache lookups, by namespace and result (hit or miss)",
+    ["namespace", "result"])
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "Response cache lookups of /summarize and /generate_labels, by route and result (hit, semantic or miss)",
+    ["route", "result"])
+
+RESPONSE_CACHE_ENTRIES = Gauge("response_cache_entries", "Responses in the response cache")
+
+OLLAMA_REQUESTS = Counter(
+    "ollama_requests_total",
+    "Requests sent to Ollama, by model, API path and HTTP status",
+    ["model", "path", "status"])
+
+OLLAMA_IN_FLIGHT = Gauge(
+    "ollama_requests_in_flight",
+    "Ollama requests holding a model slot",
+    ["model"])
+
+OLLAMA_TTFT_SECONDS = Histogram(
+    "ollama_time_to_first_token_seconds",
+    "Time to the first generated token (streamed), or model load plus prompt evaluation (non-streamed)",
+    ["model"])
+
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "ollama_eval_tokens_per_second",
+    "Generation speed reported by Ollama (eval_count / eval_duration)",
+    ["model"], buckets=TOKENS_PER_SECOND_BUCKETS)
+
+OLLAMA_TOKENS = Counter(
+    "ollama_tokens_total",
+    "Tokens processed by Ollama, by model and kind (prompt or generated)",
+    ["model", "kind"])
+
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "admission_queue_wait_seconds",
+    "Time requests waited for a model slot, by priority",
+    ["model", "priority"])
+
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests turned away by admission control (rate_limited: 429, overloaded: 503)",
+    ["model", "reason"])
+
+ADMISSION_WAITING = Gauge(
+    "admission_waiting_requests",
+    "Requests queued for a model slot, by priority",
+    ["model", "priority"])
+
+MODEL_LOAD_SECONDS = Histogram(
+    "ollama_model_load_seconds",
+    "Duration of warm-up and keep-warm requests (the load time when the model was not resident)",
+    ["model"])
+
+MODEL_RESIDENT = Gauge(
+    "ollama_model_resident",
+    "1 when a model the service uses is loaded in Ollama (as of the last readiness check)",
+    ["model"])
+
+ROUTED_REQUESTS = Counter(
+    "model_routed_requests_total",
+    "Model requests by route, chosen backend and model (the fallback model under load)",
+    ["route", "backend", "model"])
+
+
+def observe_generation(model, stats):
+    """
+    Record Ollama's statistics from the final chunk of a generation.
+
+    Args:
+        model (str): Model name
+        stats (dict): Final response with eval_count, eval_duration, prompt_eval_count... (nanoseconds)
+    """
+    eval_count = stats.get("eval_count")
+    eval_duration = stats.get("eval_duration")
+    if eval_count:
+        OLLAMA_TOKENS.inc(eval_count, model=model, kind="generated")
+        if eval_duration:
+            OLLAMA_TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), model=model)
+    if stats.get("prompt_eval_count"):
+        OLLAMA_TOKENS.inc(stats["prompt_eval_count"], model=model, kind="prompt")
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format"""
+    return REGISTRY.render()
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+from config import required_models, MODEL_KEEP_ALIVE
+from metrics import MODEL_LOAD_SECONDS, MODEL_RESIDENT
+from ollama_client import get_client
+
+# Load every model at startup (MODEL_WARMUP=false leaves it to the first request)
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+# Seconds between keep-warm requests that reload evicted models and renew their
+# keep_alive (0 disables); useful when other clients of Ollama evict them
+MODEL_KEEP_WARM_INTERVAL = float(os.environ.get("MODEL_KEEP_WARM_INTERVAL", 0))
+# Seconds between warm-up attempts while Ollama is unreachable or still pulling
+MODEL_WARMUP_RETRY_SECONDS = float(os.environ.get("MODEL_WARMUP_RETRY_SECONDS", 5))
+# /readyz answers from the last /api/ps result for this long
+READY_CHECK_TTL = 2.0
+
+
+def model_tag(name):
+    """Name of a model as listed by Ollama: "nomic-embed-text" is "nomic-embed-text:latest\""""
+    return name if ":" in name.rsplit("/", 1)[-1] else f"{name}:latest"
+
+
+class ModelManager:
+    """
+    Startup and readiness of the Ollama models the service calls.
+
+    start() loads every model of config.required_models() in a background
+    thread, retrying until Ollama has them all, and optionally keeps them
+    warm. status() reports whether they are all resident (/api/ps).
+    """
+
+    def __init__(self, models=None, keep_alive=MODEL_KEEP_ALIVE, keep_warm_interval=MODEL_KEEP_WARM_INTERVAL):
+        self.models = models if models is not None else required_models()
+        self.keep_alive = keep_alive
+        self.keep_warm_interval = keep_warm_interval
+        self.errors = {}
+        self._status = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def load(self, base_url, model, kind):
+        """Load one model, returns the seconds it took"""
+        seconds = get_client(base_url).load_model(model, kind, self.keep_alive)
+        MODEL_LOAD_SECONDS.observe(seconds, model=model)
+        return seconds
+
+    def warm_up(self):
+        """Load every model, retrying failed ones until they load or stop() is called"""
+        pending = list(self.models)
+        while pending and not self._stop.is_set():
+            for base_url, model, kind in list(pending):
+                try:
+                    seconds = self.load(base_url, model, kind)
+                except Exception as e:
+                    self.errors[model] = str(e)
+                    continue
+                self.errors.pop(model, None)
+                pending.remove((base_url, model, kind))
+                print(f"Loaded model {model} in {seconds:.1f}s")
+            if pending:
+                self._stop.wait(MODEL_WARMUP_RETRY_SECONDS)
+
+    def keep_warm(self):
+        """Reload the models every keep_warm_interval seconds until stop() is called"""
+        while not self._stop.wait(self.keep_warm_interval):
+            for base_url, model, kind in self.models:
+                try:
+                    self.load(base_url, model, kind)
+                    self.errors.pop(model, None)
+                except Exception as e:
+                    self.errors[model] = str(e)
+                    print(f"Error keeping model {model} warm: {str(e)}")
+
+    def start(self, warm_up=True):
+        """Start the warm-up and (if configured) keep-warm threads"""
+        if warm_up:
+            threading.Thread(target=self.warm_up, name="model-warmup", daemon=True).start()
+        if self.keep_warm_interval > 0:
+            threading.Thread(target=self.keep_warm, name="model-keep-warm", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        """
+        Check which models are resident, at most every READY_CHECK_TTL seconds.
+
+        Returns:
+            dict: "ready" (bool, every model is loaded) and "models", one
+                {"model", "server", "resident"[, "error"]} entry per model
+        """
+        with self._lock:
+            if self._status is not None and time.monotonic() - self._checked < READY_CHECK_TTL:
+                return self._status
+
+            running = {}
+            for base_url in dict.fromkeys(base_url for base_url, _, _ in self.models):
+                try:
+                    running[base_url] = {model_tag(name) for name in get_client(base_url).running_models()}
+                except Exception as e:
+                    running[base_url] = e
+
+            models = []
+            for base_url, model, _ in self.models:
+                entry = {"model": model, "server": base_url}
+                if isinstance(running[base_url], Exception):
+                    entry.update(resident=False, error=str(running[base_url]))
+                else:
+                    entry["resident"] = model_tag(model) in running[base_url]
+                    if not entry["resident"] and model in self.errors:
+                        entry["error"] = self.errors[model]
+                MODEL_RESIDENT.set(int(entry["resident"]), model=model)
+                models.append(entry)
+
+            self._status = {"ready": all(entry["resident"] for entry in models), "models": models}
+            self._checked = time.monotonic()
+            return self._status
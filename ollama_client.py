@@ -0,0 +1,527 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from admission import get_admission, PRIORITY_BACKGROUND
+from config import MODEL_KEEP_ALIVE, MODEL_KIND_EMBED, MODEL_KIND_GENERATE
+from metrics import OLLAMA_IN_FLIGHT, OLLAMA_REQUESTS, OLLAMA_TTFT_SECONDS, observe_generation
+
+# Connection / concurrency settings (override through the environment)
+# (in-flight requests per model are capped by admission.py, ADMISSION_SLOTS_PER_MODEL)
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", 16))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 5))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", 300))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", 3))
+OLLAMA_BACKOFF_FACTOR = float(os.environ.get("OLLAMA_BACKOFF_FACTOR", 0.5))
+# Read timeout of status requests (/api/ps), which answer right away
+OLLAMA_STATUS_TIMEOUT = 10
+
+# Status codes worth retrying: Ollama answers 5xx while a model is (re)loading
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+# Streamed request bodies: file bytes read per base64 block (a multiple of 3,
+# so blocks encode without padding) and size of the chunks sent
+BASE64_READ_BYTES = 3 * 64 * 1024
+BODY_CHUNK_BYTES = 256 * 1024
+
+
+class OllamaError(Exception):
+    """Raised when Ollama cannot be reached or keeps answering with an error."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Base64File:
+    """
+    Payload value sent as the base64 encoding of a file's content.
+
+    A payload holding one is streamed to Ollama as a chunked JSON body: the
+    file is read and encoded block by block, never held in memory whole.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+def _has_files(value):
+    if isinstance(value, Base64File):
+        return True
+    if isinstance(value, dict):
+        return any(_has_files(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_files(item) for item in value)
+    return False
+
+
+def _is_read_timeout(error):
+    """Whether a requests.ConnectionError wraps a read timeout (raised while reading the body)"""
+    return any(isinstance(arg, urllib3.exceptions.ReadTimeoutError) for arg in error.args)
+
+
+def _iter_json(value):
+    if isinstance(value, Base64File):
+        yield '"'
+        with open(value.path, "rb") as f:
+            while True:
+                block = f.read(BASE64_READ_BYTES)
+                if not block:
+                    break
+                yield base64.b64encode(block).decode("ascii")
+        yield '"'
+    elif isinstance(value, dict):
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            yield ("," if i else "") + json.dumps(str(key)) + ":"
+            yield from _iter_json(item)
+        yield "}"
+    elif isinstance(value, (list, tuple)):
+        yield "["
+        for i, item in enumerate(value):
+            if i:
+                yield ","
+            yield from _iter_json(item)
+        yield "]"
+    else:
+        yield json.dumps(value)
+
+
+def with_keep_alive(payload):
+    """The payload with config.MODEL_KEEP_ALIVE, unless it sets its own keep_alive"""
+    if MODEL_KEEP_ALIVE and "keep_alive" not in payload:
+        return dict(payload, keep_alive=MODEL_KEEP_ALIVE)
+    return payload
+
+
+def iter_json_body(payload):
+    """Encode a payload as JSON bytes in chunks of about BODY_CHUNK_BYTES, expanding Base64File values"""
+    buffered = []
+    size = 0
+    for text in _iter_json(payload):
+        buffered.append(text)
+        size += len(text)
+        if size >= BODY_CHUNK_BYTES:
+            yield "".join(buffered).encode("utf-8")
+            buffered, size = [], 0
+    if buffered:
+        yield "".join(buffered).encode("utf-8")
+
+
+class OllamaResponse:
+    """
+    Thin wrapper around a requests.Response that holds a model slot.
+
+    The slot is released when the response is closed, so streaming callers
+    keep their slot for the whole generation. Decoding the body through
+    json() or iter_chunks() records the generation metrics.
+    """
+
+    def __init__(self, response, release, model=None, started=None):
+        self._response = response
+        self._release = release
+        self._model = model
+        self._started = started
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def json(self, **kwargs):
+        result = self._response.json(**kwargs)
+        if isinstance(result, dict) and result.get("done"):
+            # Non-streamed: the first token came after loading the model and reading the prompt
+            first_token_ns = result.get("load_duration", 0) + result.get("prompt_eval_duration", 0)
+            if first_token_ns:
+                OLLAMA_TTFT_SECONDS.observe(first_token_ns / 1e9, model=self._model)
+            observe_generation(self._model, result)
+        return result
+
+    def iter_chunks(self):
+        """Yield decoded NDJSON chunks from a streaming response."""
+        first = True
+        for line in self._response.iter_lines():
+            if line:
+                chunk = json.loads(line.decode("utf-8"))
+                if first and self._started is not None:
+                    OLLAMA_TTFT_SECONDS.observe(time.perf_counter() - self._started, model=self._model)
+                    first = False
+                if chunk.get("done"):
+                    observe_generation(self._model, chunk)
+                yield chunk
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            release, self._release = self._release, None
+            if release:
+                release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OllamaClient:
+    """
+    Shared HTTP client for an Ollama server.
+
+    - Keeps a bounded pool of keep-alive connections
+    - Caps in-flight requests per model through the server's admission
+      controller, interactive requests first
+    - Applies connect/read timeouts
+    - Retries 5xx answers and failed connections with exponential backoff;
+      read timeouts are raised right away, Ollama may still be generating
+    - Sends config.MODEL_KEEP_ALIVE with every request that sets no keep_alive
+    """
+
+    def __init__(self, base_url, pool_size=OLLAMA_POOL_SIZE,
+                 connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout=OLLAMA_READ_TIMEOUT,
+                 max_retries=OLLAMA_MAX_RETRIES,
+                 backoff_factor=OLLAMA_BACKOFF_FACTOR,
+                 admission=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.admission = admission or get_admission(self.base_url)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt):
+        delay = self.backoff_factor * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+    def post(self, path, payload, stream=False, priority=PRIORITY_BACKGROUND):
+        """
+        POST a JSON payload to the Ollama API, holding a slot for payload["model"].
+
+        Args:
+            path (str): API path, e.g. "/api/generate"
+            payload (dict): JSON body; Base64File values are streamed from disk
+            stream (bool): Stream the response body
+            priority (str): admission.PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+
+        Returns:
+            OllamaResponse: Response wrapper; close it to release the model slot
+
+        Raises:
+            admission.Overloaded: Interactive request over the queue latency SLO
+        """
+        model = payload.get("model")
+        slots = self.admission.slots(model)
+        slots.acquire(priority)
+        OLLAMA_IN_FLIGHT.inc(model=model)
+        started = time.perf_counter()
+
+        def release(failed=False):
+            OLLAMA_IN_FLIGHT.dec(model=model)
+            # Failed requests say nothing about generation time
+            slots.release(priority, None if failed else time.perf_counter() - started)
+
+        try:
+            response = self._post_with_retries(self.base_url + path, with_keep_alive(payload), stream)
+        except Exception:
+            OLLAMA_REQUESTS.inc(model=model, path=path, status="error")
+            release(failed=True)
+            raise
+        OLLAMA_REQUESTS.inc(model=model, path=path, status=response.status_code)
+
+        if not stream:
+            # Body is fully read, the slot can go back right away
+            try:
+                response.content
+            finally:
+                release()
+            return OllamaResponse(response, None, model, started)
+
+        return OllamaResponse(response, release, model, started)
+
+    def _post_with_retries(self, url, payload, stream):
+        streamed_body = _has_files(payload)
+        attempt = 0
+        while True:
+            try:
+                if streamed_body:
+                    # A fresh generator per attempt, the files are read again on retries
+                    response = self.session.post(url, data=iter_json_body(payload), stream=stream,
+                                                 timeout=self.timeout, headers={"Content-Type": "application/json"})
+                else:
+                    response = self.session.post(url, json=payload, stream=stream, timeout=self.timeout)
+            except requests.ReadTimeout as e:
+                # Ollama took the request and is still working on it: sending
+                # it again would only queue a second generation behind the first
+                raise OllamaError(f"Ollama request timed out: {str(e)}")
+            except requests.ConnectionError as e:
+                # A body read that times out surfaces as a ConnectionError
+                if _is_read_timeout(e):
+                    raise OllamaError(f"Ollama request timed out: {str(e)}")
+                if attempt >= self.max_retries:
+                    raise OllamaError(f"Ollama request failed: {str(e)}")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                response.close()
+            self._backoff(attempt)
+            attempt += 1
+
+    def generate(self, payload, stream=False, priority=PRIORITY_BACKGROUND):
+        """Call /api/generate. See post() for the arguments and return value."""
+        return self.post("/api/generate", payload, stream=stream, priority=priority)
+
+    def embed(self, model, inputs, keep_alive=None, priority=PRIORITY_BACKGROUND):
+        """
+        Embed a batch of texts with /api/embed.
+
+        Args:
+            model (str): Embedding model name
+            inputs (list): Texts to embed
+            keep_alive (str, optional): How long Ollama keeps the model loaded
+            priority (str): Admission priority, see post()
+
+        Returns:
+            list: One embedding (list of floats) per input
+        """
+        payload = {"model": model, "input": list(inputs)}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        response = self.post("/api/embed", payload, priority=priority)
+        if response.status_code != 200:
+            raise OllamaError(f"Embedding failed. Status code: {response.status_code}", response.status_code)
+        return response.json()["embeddings"]
+
+    def load_model(self, model, kind=MODEL_KIND_GENERATE, keep_alive=MODEL_KEEP_ALIVE):
+        """
+        Have Ollama load a model and keep it loaded for keep_alive.
+
+        An empty prompt (or input list) only loads the model, so the request
+        takes no model slot.
+
+        Args:
+            model (str): Model name
+            kind (str): config.MODEL_KIND_GENERATE or MODEL_KIND_EMBED
+            keep_alive (str, optional): How long Ollama keeps the model loaded
+
+        Returns:
+            float: Seconds the request took, i.e. the load time of a cold model
+        """
+        if kind == MODEL_KIND_EMBED:
+            path, payload = "/api/embed", {"model": model, "input": []}
+        else:
+            path, payload = "/api/generate", {"model": model, "prompt": ""}
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        started = time.perf_counter()
+        response = self._post_with_retries(self.base_url + path, payload, stream=False)
+        OLLAMA_REQUESTS.inc(model=model, path=path, status=response.status_code)
+        if response.status_code != 200:
+            raise OllamaError(f"Loading {model} failed. Status code: {response.status_code}", response.status_code)
+        return time.perf_counter() - started
+
+    def running_models(self):
+        """
+        List the models Ollama holds in memory (/api/ps).
+
+        Returns:
+            list: Model names, e.g. "deepseek-r1:7b"
+        """
+        try:
+            response = self.session.get(self.base_url + "/api/ps",
+                                        timeout=(self.timeout[0], OLLAMA_STATUS_TIMEOUT))
+        except requests.RequestException as e:
+            raise OllamaError(f"Ollama request failed: {str(e)}")
+        if response.status_code != 200:
+            raise OllamaError(f"Listing models failed. Status code: {response.status_code}", response.status_code)
+        return [model.get("name") or model.get("model") for model in response.json().get("models", [])]
+
+
+class AsyncOllamaResponse:
+    """
+    Streaming httpx response holding a model slot of an AsyncOllamaClient.
+
+    Same contract as OllamaResponse: aclose() it to release the slot.
+    """
+
+    def __init__(self, response, release, model=None, started=None):
+        self._response = response
+        self._release = release
+        self._model = model
+        self._started = started
+
+    @property
+    def status_code(self):
+        return self._response.status_code
+
+    def json(self, **kwargs):
+        """Decode a non-streamed body (read by post()), recording the generation metrics."""
+        result = self._response.json(**kwargs)
+        if isinstance(result, dict) and result.get("done"):
+            first_token_ns = result.get("load_duration", 0) + result.get("prompt_eval_duration", 0)
+            if first_token_ns:
+                OLLAMA_TTFT_SECONDS.observe(first_token_ns / 1e9, model=self._model)
+            observe_generation(self._model, result)
+        return result
+
+    async def aiter_chunks(self):
+        """Yield decoded NDJSON chunks from a streaming response."""
+        first = True
+        async for line in self._response.aiter_lines():
+            if line:
+                chunk = json.loads(line)
+                if first and self._started is not None:
+                    OLLAMA_TTFT_SECONDS.observe(time.perf_counter() - self._started, model=self._model)
+                    first = False
+                if chunk.get("done"):
+                    observe_generation(self._model, chunk)
+                yield chunk
+
+    async def aclose(self):
+        try:
+            await self._response.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release:
+                release()
+
+
+class AsyncOllamaClient:
+    """
+    asyncio counterpart of OllamaClient for the ASGI server.
+
+    Same pool size, timeouts and retries, and the same admission controller
+    (model slots are shared with the threads of the process), but a request
+    waiting for a slot or a token costs a coroutine, not a thread. Must be
+    used (and closed) on a single event loop.
+    """
+
+    def __init__(self, base_url, pool_size=OLLAMA_POOL_SIZE,
+                 connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout=OLLAMA_READ_TIMEOUT,
+                 max_retries=OLLAMA_MAX_RETRIES,
+                 backoff_factor=OLLAMA_BACKOFF_FACTOR,
+                 admission=None):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.admission = admission or get_admission(self.base_url)
+
+        # pool=None: wait for a free connection like the blocking requests pool
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def _backoff(self, attempt):
+        delay = self.backoff_factor * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def post(self, path, payload, stream=False, priority=PRIORITY_BACKGROUND):
+        """
+        POST a JSON payload to the Ollama API, holding a slot for payload["model"].
+
+        Args:
+            path (str): API path, e.g. "/api/generate"
+            payload (dict): JSON body
+            stream (bool): Stream the response body
+            priority (str): admission.PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+
+        Returns:
+            AsyncOllamaResponse: Response wrapper; aclose() it to release the model slot
+
+        Raises:
+            admission.Overloaded: Interactive request over the queue latency SLO
+        """
+        model = payload.get("model")
+        slots = self.admission.slots(model)
+        await slots.acquire_async(priority)
+        OLLAMA_IN_FLIGHT.inc(model=model)
+        started = time.perf_counter()
+
+        def release(failed=False):
+            OLLAMA_IN_FLIGHT.dec(model=model)
+            slots.release(priority, None if failed else time.perf_counter() - started)
+
+        try:
+            response = await self._post_with_retries(self.base_url + path, with_keep_alive(payload))
+        except BaseException:
+            # Also on cancellation, or the slot would leak
+            OLLAMA_REQUESTS.inc(model=model, path=path, status="error")
+            release(failed=True)
+            raise
+        OLLAMA_REQUESTS.inc(model=model, path=path, status=response.status_code)
+
+        wrapped = AsyncOllamaResponse(response, release, model, started)
+        if not stream:
+            try:
+                await response.aread()
+            finally:
+                await wrapped.aclose()
+        return wrapped
+
+    async def _post_with_retries(self, url, payload):
+        attempt = 0
+        while True:
+            try:
+                request = self.http.build_request("POST", url, json=payload)
+                response = await self.http.send(request, stream=True)
+            except httpx.ReadTimeout as e:
+                # Not retried, see OllamaClient._post_with_retries
+                raise OllamaError(f"Ollama request timed out: {str(e)}")
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise OllamaError(f"Ollama request failed: {str(e)}")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                await response.aclose()
+            await self._backoff(attempt)
+            attempt += 1
+
+    async def generate(self, payload, stream=False, priority=PRIORITY_BACKGROUND):
+        """Call /api/generate. See post() for the arguments and return value."""
+        return await self.post("/api/generate", payload, stream=stream, priority=priority)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_async_clients = {}
+
+
+def get_client(base_url):
+    """Return the process-wide client for an Ollama server, creating it on first use."""
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = OllamaClient(base_url)
+        return _clients[base_url]
+
+
+def get_async_client(base_url):
+    """Return the event loop's client for an Ollama server, creating it on first use."""
+    if base_url not in _async_clients:
+        _async_clients[base_url] = AsyncOllamaClient(base_url)
+    return _async_clients[base_url]
+
+
+async def close_async_clients():
+    """Close the async clients (on ASGI shutdown)."""
+    while _async_clients:
+        _, client = _async_clients.popitem()
+        await client.aclose()
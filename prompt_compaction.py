@@ -0,0 +1,198 @@
+import math
+import os
+import re
+from collections import Counter
+
+from controller import PAGE_BANNER
+from summarizer import CHARS_PER_TOKEN, estimate_tokens, split_pages
+from text_preprocessing import preprocess_text
+
+# Compaction mode: "off", "standard" (layout clean-up) or "aggressive" (standard,
+# then preprocess_text: lowercase, no punctuation, numbers or stopwords)
+PROMPT_COMPACTION_MODE = os.environ.get("PROMPT_COMPACTION_MODE", "standard")
+
+# Token budget for document text in a single prompt, per model, e.g.
+# "deepseek-r1:7b=6000,deepseek-r1:1.5b=3000"; other models get the default
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.environ.get("DEFAULT_PROMPT_TOKEN_BUDGET", 8000))
+PROMPT_TOKEN_BUDGETS = {
+    model.strip(): int(budget)
+    for model, _, budget in (
+        entry.rpartition("=") for entry in os.environ.get("PROMPT_TOKEN_BUDGETS", "").split(",") if "=" in entry
+    )
+}
+
+# Header/footer detection: lines among the first/last EDGE_LINES of a page that
+# recur on at least REPEATED_LINE_MIN_RATIO of the pages (and 3 pages or more)
+EDGE_LINES = 3
+REPEATED_LINE_MIN_RATIO = 0.4
+REPEATED_LINE_MIN_PAGES = 3
+
+# Marker left where fit_to_budget cut the middle of a document
+TRIM_MARKER = "\n\n[...]\n\n"
+
+DIGITS_PATTERN = re.compile(r"\d+")
+REFERENCES_HEADING_PATTERN = re.compile(
+    r"^\s*(?:\d+\.?|[IVX]+\.)?\s*(?:references|bibliography|works cited|literature cited)\s*:?\s*$",
+    re.IGNORECASE)
+APPENDIX_HEADING_PATTERN = re.compile(
+    r"^\s*(?:[A-Z]\.?|\d+\.?)?\s*(?:appendix|appendices|supplementary material)\b",
+    re.IGNORECASE)
+HYPHENATION_PATTERN = re.compile(r"(?<=[a-z])-\n(?=[a-z])")
+SPACES_PATTERN = re.compile(r"[ \t\f\v\u00a0]+")
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+
+def token_budget(model):
+    """Token budget of document text in a single prompt for a model"""
+    return PROMPT_TOKEN_BUDGETS.get(model, DEFAULT_PROMPT_TOKEN_BUDGET)
+
+
+def _edge_key(line):
+    # Page numbers and dates change from page to page; compare the rest
+    return DIGITS_PATTERN.sub("#", line.strip().lower())
+
+
+def _edge_indices(lines):
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def find_repeated_lines(pages):
+    """
+    Detect running headers and footers.
+
+    Returns:
+        set: Normalised lines found at the top or bottom of many pages
+    """
+    if len(pages) < REPEATED_LINE_MIN_PAGES:
+        return set()
+
+    counts = Counter()
+    for lines in pages:
+        counts.update({_edge_key(lines[i]) for i in _edge_indices(lines)})
+
+    min_pages = max(REPEATED_LINE_MIN_PAGES, math.ceil(REPEATED_LINE_MIN_RATIO * len(pages)))
+    return {key for key, count in counts.items() if count >= min_pages}
+
+
+def _clean_page(text):
+    text = HYPHENATION_PATTERN.sub("", text)
+    lines = [SPACES_PATTERN.sub(" ", line).strip() for line in text.split("\n")]
+    return BLANK_LINES_PATTERN.sub("\n\n", "\n".join(lines)).strip()
+
+
+def compact_text(text, mode=PROMPT_COMPACTION_MODE, keep_page_markers=True):
+    """
+    Remove layout noise from extracted text before it goes into a prompt.
+
+    - Drops running headers/footers (lines repeated at the edges of many pages)
+    - Drops the references/bibliography section, up to an appendix if any
+    - Joins words hyphenated across line breaks and collapses whitespace
+    - In "aggressive" mode, also runs preprocess_text on every page
+
+    Args:
+        text (str): Extracted document text, with or without page banners
+        mode (str): "off", "standard" or "aggressive"
+        keep_page_markers (bool): Keep the page banners (chunked summaries need them)
+
+    Returns:
+        tuple: (compacted text, stats dict)
+    """
+    stats = {"mode": mode, "header_footer_lines": 0, "reference_lines": 0}
+    if mode == "off":
+        return text, stats
+
+    pages = [(page_num, page_text.split("\n")) for page_num, page_text in split_pages(text)]
+    repeated = find_repeated_lines([lines for _, lines in pages])
+
+    # References only count past the first half of the document (not in a table of contents)
+    total_lines = sum(len(lines) for _, lines in pages)
+    line_number = 0
+    in_references = False
+
+    compacted = []
+    for page_num, lines in pages:
+        edges = _edge_indices(lines) if repeated else set()
+        kept = []
+        for i, line in enumerate(lines):
+            line_number += 1
+            if i in edges and _edge_key(line) in repeated:
+                stats["header_footer_lines"] += 1
+                continue
+            if in_references:
+                if APPENDIX_HEADING_PATTERN.match(line):
+                    in_references = False
+                else:
+                    stats["reference_lines"] += 1
+                    continue
+            elif line_number > total_lines // 2 and REFERENCES_HEADING_PATTERN.match(line):
+                in_references = True
+                stats["reference_lines"] += 1
+                continue
+            kept.append(line)
+
+        page_text = _clean_page("\n".join(kept))
+        if mode == "aggressive":
+            page_text = preprocess_text(page_text)
+        if page_text:
+            compacted.append((page_num, page_text))
+
+    if keep_page_markers:
+        result = "".join(PAGE_BANNER.format(page_number=page_num) + page_text for page_num, page_text in compacted)
+    else:
+        result = "\n\n".join(page_text for _, page_text in compacted)
+    return result, stats
+
+
+def fit_to_budget(text, max_tokens):
+    """
+    Trim text to a token budget.
+
+    Keeps the beginning (abstract, introduction) and the end (conclusion) of the
+    document, two thirds and one third of the budget, and cuts the middle on
+    whitespace boundaries.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(TRIM_MARKER))
+    head_chars = max_chars * 2 // 3
+    tail_chars = max_chars - head_chars
+
+    head = text[:head_chars]
+    cut = head.rfind(" ")
+    if cut > head_chars // 2:
+        head = head[:cut]
+    tail = text[len(text) - tail_chars:] if tail_chars else ""
+    cut = tail.find(" ")
+    if 0 <= cut < tail_chars // 2:
+        tail = tail[cut + 1:]
+    return head + TRIM_MARKER + tail
+
+
+def compact_prompt_text(text, model, mode=PROMPT_COMPACTION_MODE, budget=True, keep_page_markers=True):
+    """
+    Compact document text for a model's prompt and report the token savings.
+
+    Args:
+        text (str): Document text
+        model (str): Model the prompt is for, selects the token budget
+        mode (str): Compaction mode, see compact_text
+        budget (bool): Trim to the model's token budget after compaction
+        keep_page_markers (bool): Keep the page banners
+
+    Returns:
+        tuple: (prompt text, stats with tokens_before, tokens_after and saved_tokens)
+    """
+    tokens_before = estimate_tokens(text)
+    compacted, stats = compact_text(text, mode, keep_page_markers)
+    stats["tokens_compacted"] = estimate_tokens(compacted)
+
+    if budget:
+        stats["token_budget"] = token_budget(model)
+        compacted = fit_to_budget(compacted, stats["token_budget"])
+
+    stats["tokens_before"] = tokens_before
+    stats["tokens_after"] = estimate_tokens(compacted)
+    stats["saved_tokens"] = tokens_before - stats["tokens_after"]
+    return compacted, stats
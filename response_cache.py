@@ -0,0 +1,360 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from admission import PRIORITY_INTERACTIVE
+from config import ROUTE_EMBEDDING
+from metrics import RESPONSE_CACHE_REQUESTS
+from ollama_client import get_client
+from result_cache import make_key
+from routing import choose
+from text_preprocessing import preprocess_text
+
+# Response cache of /summarize and /generate_labels (RESPONSE_CACHE=false disables it)
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "true").lower() in ("1", "true", "yes")
+# Entries expire this many seconds after they were stored (0: never); past
+# RESPONSE_CACHE_MAX_ENTRIES the least recently used ones are evicted
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 24 * 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+# SQLite file shared by every gunicorn worker (unset: one in-memory cache per process)
+RESPONSE_CACHE_DB = os.environ.get("RESPONSE_CACHE_DB")
+# Semantic lookup: on an exact miss, embed the text as preprocess_text leaves it
+# (no stopwords, punctuation or numbers) and reuse the response of the most
+# similar cached text at or above RESPONSE_CACHE_SIMILARITY (cosine). Costs one
+# embedding request per miss; "not" is a stopword, so keep the threshold high
+RESPONSE_CACHE_SEMANTIC = os.environ.get("RESPONSE_CACHE_SEMANTIC", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0.97))
+
+# Lookup results, also the value of the X-Response-Cache header
+LOOKUP_EXACT = "hit"
+LOOKUP_SEMANTIC = "semantic"
+LOOKUP_MISS = "miss"
+CACHE_HEADER = "X-Response-Cache"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    model TEXT NOT NULL,
+    semantic_scope TEXT,
+    vector BLOB,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used_at);
+"""
+
+# What is cached: route, scope (route, model and prompt), exact key and the request text
+ResponseKey = namedtuple("ResponseKey", ["route", "scope", "key", "text"])
+# Outcome of a lookup: result (LOOKUP_*), the cached response and its model on a
+# hit, and on a miss the (embedding model, vector) of the text for store()
+Lookup = namedtuple("Lookup", ["result", "response", "model", "embedding"])
+
+
+def normalize_text(text):
+    """Text of an exact cache key: lowercase, whitespace runs collapsed"""
+    return " ".join(text.lower().split())
+
+
+def response_key(route, model, prompt_key, text):
+    """
+    Cache key of a request: the text with only case and whitespace
+    normalised (anything else, a "not" or a number, changes the answer),
+    the model and the prompt.
+
+    Args:
+        route (str): config.ROUTE_* name
+        model (str): Model answering the request
+        prompt_key (str): Hash of the prompt template and settings that shape it
+        text (str): Request text
+    """
+    scope = make_key(route, model, prompt_key)
+    return ResponseKey(route, scope, make_key(scope, normalize_text(text)), text)
+
+
+class MemoryBackend:
+    """Per-process entries in LRU order, each with its expiry time"""
+
+    shared = False
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, response, model, semantic_scope=None, vector=None):
+        expires = time.time() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            self._entries[key] = (expires, {"response": response, "model": model})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """
+    Entries in a SQLite file shared by every worker process; a hit refreshes
+    used_at and every put deletes expired entries and the least recently used
+    ones past max_entries.
+    """
+
+    shared = True
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute("SELECT response, model, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl > 0 and row[2] < time.time() - self.ttl):
+            return None
+        conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+        return {"response": row[0], "model": row[1]}
+
+    def put(self, key, response, model, semantic_scope=None, vector=None):
+        now = time.time()
+        blob = np.asarray(vector, dtype=np.float32).tobytes() if vector is not None else None
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, model, semantic_scope, vector, created_at, used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, response, model, semantic_scope, blob, now, now)
+            )
+            if self.ttl > 0:
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute("DELETE FROM responses WHERE key IN "
+                             "(SELECT key FROM responses ORDER BY used_at LIMIT ?)", (excess,))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def vectors_since(self, rowid):
+        """(rowid, key, semantic_scope, vector) of the entries with an embedding stored after rowid"""
+        rows = self._connection().execute(
+            "SELECT rowid, key, semantic_scope, vector FROM responses"
+            " WHERE rowid > ? AND vector IS NOT NULL ORDER BY rowid", (rowid,)
+        ).fetchall()
+        return [(row[0], row[1], row[2], np.frombuffer(row[3], dtype=np.float32)) for row in rows]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class SemanticIndex:
+    """
+    Unit-normalised embeddings of the cached texts of one scope and embedding
+    model, searched by cosine similarity. Keeps the newest max_entries.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.keys = []
+        self.vectors = None
+
+    def add(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return
+        if self.vectors is None:
+            self.vectors = np.empty((16, len(vector)), dtype=np.float32)
+        elif len(vector) != self.vectors.shape[1]:
+            return
+        count = len(self.keys)
+        if count == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+        self.vectors[count] = vector / norm
+        self.keys.append(key)
+
+        if len(self.keys) > self.max_entries:
+            drop = len(self.keys) - self.max_entries
+            count = len(self.keys)
+            self.vectors[:count - drop] = self.vectors[drop:count]
+            del self.keys[:drop]
+
+    def remove(self, key):
+        """Forget an entry that expired or was evicted"""
+        for i, known in enumerate(self.keys):
+            if known == key:
+                self.keys[i] = None
+                self.vectors[i] = 0
+
+    def search(self, vector):
+        """
+        Returns:
+            tuple: (key, similarity) of the most similar entry, or None when empty
+        """
+        if not self.keys:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0 or len(vector) != self.vectors.shape[1]:
+            return None
+        similarities = self.vectors[:len(self.keys)] @ (vector / norm)
+        best = int(np.argmax(similarities))
+        if self.keys[best] is None:
+            return None
+        return self.keys[best], float(similarities[best])
+
+
+class ResponseCache:
+    """
+    Cache of generated responses: an exact lookup on the text (case and
+    whitespace normalised), model and prompt, then (optionally) a semantic
+    one on the embedding of the preprocess_text output among the entries of
+    the same route, model and prompt.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_DB, ttl=RESPONSE_CACHE_TTL_SECONDS, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 semantic=RESPONSE_CACHE_SEMANTIC, similarity=RESPONSE_CACHE_SIMILARITY):
+        self.backend = SqliteBackend(path, ttl, max_entries) if path else MemoryBackend(ttl, max_entries)
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity = similarity
+        self._indexes = {}
+        self._synced = 0
+        self._lock = threading.Lock()
+
+    def embed(self, text):
+        """
+        Embed a preprocessed text with the embedding route.
+
+        Returns:
+            tuple: (embedding model, vector), or None if embedding failed
+        """
+        try:
+            choice = choose(ROUTE_EMBEDDING, PRIORITY_INTERACTIVE)
+            vector = get_client(choice.backend).embed(choice.model, [text], priority=PRIORITY_INTERACTIVE)[0]
+        except Exception as e:
+            print(f"Error embedding text for the response cache: {str(e)}")
+            return None
+        return choice.model, vector
+
+    def _index(self, semantic_scope):
+        index = self._indexes.get(semantic_scope)
+        if index is None:
+            index = self._indexes[semantic_scope] = SemanticIndex(self.max_entries)
+        return index
+
+    def _sync(self):
+        """Index the embeddings other processes stored in the shared backend"""
+        for rowid, key, semantic_scope, vector in self.backend.vectors_since(self._synced):
+            self._index(semantic_scope).add(key, vector)
+            self._synced = rowid
+
+    def _find_similar(self, key, embedding):
+        semantic_scope = make_key(key.scope, embedding[0])
+        with self._lock:
+            if self.backend.shared:
+                self._sync()
+            found = self._index(semantic_scope).search(embedding[1])
+        if found is None or found[1] < self.similarity:
+            return None
+        entry = self.backend.get(found[0])
+        if entry is None:
+            with self._lock:
+                self._index(semantic_scope).remove(found[0])
+        return entry
+
+    def lookup(self, key):
+        """
+        Look up the response of a request.
+
+        Args:
+            key (ResponseKey): From response_key()
+
+        Returns:
+            Lookup: The cached response on a hit; pass it to store() on a miss
+        """
+        entry = self.backend.get(key.key)
+        if entry is not None:
+            RESPONSE_CACHE_REQUESTS.inc(route=key.route, result=LOOKUP_EXACT)
+            return Lookup(LOOKUP_EXACT, entry["response"], entry["model"], None)
+
+        embedding = None
+        preprocessed = preprocess_text(key.text) if self.semantic else ""
+        if preprocessed:
+            embedding = self.embed(preprocessed)
+            entry = self._find_similar(key, embedding) if embedding else None
+            if entry is not None:
+                RESPONSE_CACHE_REQUESTS.inc(route=key.route, result=LOOKUP_SEMANTIC)
+                return Lookup(LOOKUP_SEMANTIC, entry["response"], entry["model"], None)
+
+        RESPONSE_CACHE_REQUESTS.inc(route=key.route, result=LOOKUP_MISS)
+        return Lookup(LOOKUP_MISS, None, None, embedding)
+
+    def store(self, key, response, model, lookup=None):
+        """
+        Store a complete response.
+
+        Args:
+            key (ResponseKey): From response_key()
+            response (str): Full generated text
+            model (str): Model that generated it
+            lookup (Lookup, optional): The miss, whose embedding is stored for semantic lookups
+        """
+        embedding = lookup.embedding if lookup is not None else None
+        if embedding is None:
+            self.backend.put(key.key, response, model)
+            return
+        semantic_scope = make_key(key.scope, embedding[0])
+        self.backend.put(key.key, response, model, semantic_scope, embedding[1])
+        if not self.backend.shared:
+            with self._lock:
+                self._index(semantic_scope).add(key.key, embedding[1])
+
+    def __len__(self):
+        return len(self.backend)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None when RESPONSE_CACHE is disabled"""
+    global _response_cache
+    if not RESPONSE_CACHE:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
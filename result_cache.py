@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import threading
+
+from metrics import CACHE_REQUESTS
+from storage import write_text_atomic
+
+# Cache location and size bound (override through the environment)
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "cache")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Eviction frees space down to this share of max_bytes, so a full cache is not
+# walked again on the next put
+RESULT_CACHE_EVICT_TO = 0.9
+
+
+def sha256_bytes(data):
+    """Return the hex SHA-256 of a bytes object"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Build a cache key from content hashes, model names, prompt versions..."""
+    return sha256_bytes("\x1f".join(str(part) for part in parts).encode("utf-8"))
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of JSON entries with LRU eviction.
+
+    Entries live in <root>/<namespace>/<key[:2]>/<key>.json. A hit refreshes the
+    file's mtime, and once the cache grows past max_bytes the least recently
+    used entries are deleted.
+
+    The cache size is measured once, on the first put, and then kept up to
+    date by every put and eviction, so the tree is only walked when the size
+    crosses max_bytes. Entries written by other processes are picked up by
+    that walk.
+    """
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, namespace, key):
+        return os.path.join(self.root, namespace, key[:2], f"{key}.json")
+
+    def get(self, namespace, key):
+        """
+        Look up an entry.
+
+        Returns:
+            dict or None: The stored entry, or None on a miss
+        """
+        path = self._path(namespace, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            CACHE_REQUESTS.inc(namespace=namespace, result="miss")
+            return None
+        CACHE_REQUESTS.inc(namespace=namespace, result="hit")
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, namespace, key, entry):
+        """Store an entry and evict old ones if the cache is over its size bound"""
+        path = self._path(namespace, key)
+        data = json.dumps(entry)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_text_atomic(path, data)
+        with self._lock:
+            self._size += len(data.encode("utf-8")) - replaced
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _scan(self):
+        """(mtime, size, path) of every entry, and their total size"""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".json") or name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def evict(self):
+        """Delete least recently used entries once the cache is over max_bytes"""
+        with self._lock:
+            entries, total = self._scan()
+            self._size = total
+            if total <= self.max_bytes:
+                return
+
+            target = self.max_bytes * RESULT_CACHE_EVICT_TO
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+            self._size = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide result cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
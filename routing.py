@@ -0,0 +1,66 @@
+import itertools
+from collections import namedtuple
+
+from admission import get_admission, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from config import ROUTES
+from metrics import ROUTED_REQUESTS
+
+# Where a request goes: route name, backend URL, model, and whether the model is the route's fallback
+RouteChoice = namedtuple("RouteChoice", ["route", "backend", "model", "fallback"])
+
+# Response headers naming the backend and model that served a request
+BACKEND_HEADER = "X-Ollama-Backend"
+MODEL_HEADER = "X-Ollama-Model"
+
+_turns = itertools.count()
+
+
+def least_outstanding(backends):
+    """
+    Backend with the fewest requests of this process holding or waiting for
+    a model slot; backends tied for the fewest are taken in turn, so a burst
+    arriving at idle backends is spread over them.
+    """
+    if len(backends) == 1:
+        return backends[0]
+    loads = [get_admission(backend).outstanding() for backend in backends]
+    lowest = min(loads)
+    candidates = [backend for backend, load in zip(backends, loads) if load == lowest]
+    return candidates[next(_turns) % len(candidates)]
+
+
+def choose(route_name, priority=PRIORITY_BACKGROUND, on_route=None):
+    """
+    Pick the backend and model of a request.
+
+    Interactive requests switch to the route's fallback model while the
+    estimated queue wait of its model on the chosen backend exceeds the
+    route's fallback_queue_seconds. Background work keeps the route's model,
+    so results cached under its name stay consistent.
+
+    Args:
+        route_name (str): One of the config.ROUTE_* names
+        priority (str): admission.PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND
+        on_route (callable, optional): Called with the RouteChoice, e.g. to record it in a job
+
+    Returns:
+        RouteChoice: Backend URL and model to send the request to
+    """
+    route = ROUTES[route_name]
+    backend = least_outstanding(route.backends)
+    model, fallback = route.model, False
+    if priority == PRIORITY_INTERACTIVE and route.fallback_model:
+        wait = get_admission(backend).slots(route.model).estimated_wait(priority)
+        if wait > route.fallback_queue_seconds:
+            model, fallback = route.fallback_model, True
+
+    choice = RouteChoice(route_name, backend, model, fallback)
+    ROUTED_REQUESTS.inc(route=route_name, backend=backend, model=model)
+    if on_route:
+        on_route(choice)
+    return choice
+
+
+def route_headers(choice):
+    """Response headers recording where a request was routed"""
+    return {BACKEND_HEADER: choice.backend, MODEL_HEADER: choice.model}
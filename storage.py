@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Retention of per-job working directories (override through the environment)
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+JOB_SWEEP_INTERVAL = float(os.environ.get("JOB_SWEEP_INTERVAL", 3600))
+
+
+def write_text_atomic(path, content):
+    """Write a text file through a temporary file and rename, so readers never see partial content"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_upload_atomic(file_storage, path):
+    """Save an uploaded werkzeug FileStorage through a temporary file and rename"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    os.close(fd)
+    try:
+        file_storage.save(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def sweep_expired_dirs(root, max_age=JOB_RETENTION_SECONDS, is_active=None):
+    """
+    Delete sub-directories of root that have not been modified for max_age seconds.
+
+    Args:
+        root (str): Directory holding one sub-directory per job
+        max_age (float): Retention in seconds
+        is_active (callable, optional): is_active(name) -> True to keep a directory
+            whose job is still queued or running
+
+    Returns:
+        int: Number of deleted directories
+    """
+    if not os.path.isdir(root):
+        return 0
+
+    cutoff = time.time() - max_age
+    deleted = 0
+    for entry in os.scandir(root):
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+        except OSError:
+            continue
+        if is_active and is_active(entry.name):
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        deleted += 1
+    return deleted
+
+
+def start_sweeper(root, is_active=None, interval=JOB_SWEEP_INTERVAL, max_age=JOB_RETENTION_SECONDS, prune=None):
+    """
+    Run sweep_expired_dirs every `interval` seconds in a daemon thread.
+
+    Args:
+        prune (callable, optional): prune(max_age) -> number of deleted job
+            records, called on every sweep so the records expire with their
+            directories (e.g. JobStore.prune_finished)
+    """
+    def sweep_forever():
+        while True:
+            try:
+                deleted = sweep_expired_dirs(root, max_age, is_active)
+                if deleted:
+                    print(f"Removed {deleted} expired job directories from {root}")
+            except Exception as e:
+                print(f"Error sweeping {root}: {str(e)}")
+            if prune is not None:
+                try:
+                    pruned = prune(max_age)
+                    if pruned:
+                        print(f"Removed {pruned} expired job records")
+                except Exception as e:
+                    print(f"Error pruning job records: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=sweep_forever, name="job-sweeper", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,140 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Chunked (map-reduce) summarisation settings (override through the environment)
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", 3000))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 200))
+REDUCE_FANOUT = int(os.environ.get("REDUCE_FANOUT", 4))
+CHUNK_MAX_WORKERS = int(os.environ.get("CHUNK_MAX_WORKERS", os.environ.get("OLLAMA_NUM_PARALLEL", 4)))
+
+# Rough characters-per-token ratio for English text with LLM tokenizers
+CHARS_PER_TOKEN = 4
+
+# Page banner written by controller.extract_text_from_pdf
+PAGE_MARKER_PATTERN = re.compile(r"\n\n----- Page (\d+) -----\n\n")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate, good enough for budgeting prompts"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_pages(text):
+    """
+    Split extracted text on its "----- Page N -----" banners.
+
+    Returns:
+        list: (page_number, page_text) tuples; text without banners is page 1
+    """
+    parts = PAGE_MARKER_PATTERN.split(text)
+    if len(parts) == 1:
+        return [(1, text)]
+
+    pages = []
+    if parts[0].strip():
+        pages.append((1, parts[0]))
+    for i in range(1, len(parts), 2):
+        pages.append((int(parts[i]), parts[i + 1]))
+    return pages
+
+
+def _split_long_text(text, max_chars):
+    """Split text into pieces of at most max_chars, preferring whitespace boundaries"""
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= max_chars // 2:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:]
+    pieces.append(text)
+    return pieces
+
+
+def chunk_text(text, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Split a document into chunks that fit a token budget.
+
+    Whole pages are packed together while they fit; pages larger than the budget
+    are split on whitespace. Each chunk after the first starts with the last
+    overlap_tokens of the previous chunk so context is not lost at the seams.
+
+    Args:
+        text (str): Extracted document text
+        chunk_tokens (int): Token budget per chunk
+        overlap_tokens (int): Tokens repeated from the previous chunk
+
+    Returns:
+        list: Dicts with "index", "first_page", "last_page" and "text"
+    """
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 2)
+
+    chunks = []
+    current = []
+    current_len = 0
+    first_page = None
+
+    def flush(last_page):
+        if current:
+            chunks.append({"first_page": first_page, "last_page": last_page, "text": "".join(current)})
+
+    last_page = None
+    for page_num, page_text in split_pages(text):
+        for piece in _split_long_text(page_text, max_chars):
+            if current and current_len + len(piece) > max_chars:
+                flush(last_page)
+                current, current_len, first_page = [], 0, None
+            if first_page is None:
+                first_page = page_num
+            current.append(piece)
+            current_len += len(piece)
+            last_page = page_num
+    flush(last_page)
+
+    for i, chunk in enumerate(chunks):
+        chunk["index"] = i
+        if i > 0 and overlap_chars:
+            chunk["text"] = chunks[i - 1]["text"][-overlap_chars:] + chunk["text"]
+    return chunks
+
+
+def map_reduce(chunks, map_fn, reduce_fn, fanout=REDUCE_FANOUT, max_workers=CHUNK_MAX_WORKERS,
+               on_progress=None):
+    """
+    Summarise chunks in parallel, then reduce the summaries hierarchically.
+
+    Args:
+        chunks (list): Chunks from chunk_text
+        map_fn (callable): map_fn(chunk) -> partial summary
+        reduce_fn (callable): reduce_fn(list_of_summaries) -> combined summary
+        fanout (int): Number of summaries combined by each reduce call
+        max_workers (int): Concurrent requests to the model
+        on_progress (callable, optional): Called as on_progress(stage, done, total)
+
+    Returns:
+        list: The remaining summaries, at most fanout of them, in document order
+    """
+    fanout = max(fanout, 2)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        summaries = _run_ordered(executor, map_fn, chunks, "map", on_progress)
+
+        level = 0
+        while len(summaries) > fanout:
+            level += 1
+            groups = [summaries[i:i + fanout] for i in range(0, len(summaries), fanout)]
+            summaries = _run_ordered(executor, reduce_fn, groups, f"reduce_{level}", on_progress)
+
+    return summaries
+
+
+def _run_ordered(executor, fn, items, stage, on_progress):
+    futures = [executor.submit(fn, item) for item in items]
+    results = []
+    for done, future in enumerate(futures, start=1):
+        results.append(future.result())
+        if on_progress:
+            on_progress(stage, done, len(futures))
+    return results
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import (AdmissionController, ClientRateLimiter, ModelSlots, Overloaded, PRIORITY_BACKGROUND,
+                       PRIORITY_INTERACTIVE, RateLimited, TokenBucket)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_reserved_slot_is_kept_for_interactive_requests():
+    slots = ModelSlots("m", capacity=2, reserved=1, slo_seconds=0)
+    slots.acquire(PRIORITY_BACKGROUND)
+
+    waiter = threading.Thread(target=slots.acquire, args=(PRIORITY_BACKGROUND,), daemon=True)
+    waiter.start()
+    wait_for(lambda: slots.waiting()[PRIORITY_BACKGROUND] == 1)
+
+    # The background request queues, the interactive one takes the reserved slot
+    assert slots.acquire(PRIORITY_INTERACTIVE) < 1
+    assert slots.in_use == {PRIORITY_INTERACTIVE: 1, PRIORITY_BACKGROUND: 1}
+
+    slots.release(PRIORITY_BACKGROUND)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert slots.outstanding() == 2
+
+
+def test_released_slot_goes_to_interactive_waiters_first():
+    slots = ModelSlots("m", capacity=1, reserved=0, slo_seconds=0)
+    slots.acquire(PRIORITY_INTERACTIVE)
+    granted = []
+
+    def acquire(priority):
+        slots.acquire(priority)
+        granted.append(priority)
+
+    threads = []
+    for priority in (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE):
+        threads.append(threading.Thread(target=acquire, args=(priority,), daemon=True))
+        threads[-1].start()
+        wait_for(lambda: slots.waiting()[priority] == 1)
+
+    slots.release(PRIORITY_INTERACTIVE)
+    wait_for(lambda: len(granted) == 1)
+    assert granted == [PRIORITY_INTERACTIVE]
+
+    slots.release(PRIORITY_INTERACTIVE)
+    wait_for(lambda: len(granted) == 2)
+    assert granted == [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]
+    for thread in threads:
+        thread.join(5)
+
+
+def test_interactive_request_is_rejected_past_the_queue_slo():
+    slots = ModelSlots("m", capacity=1, reserved=0, slo_seconds=1)
+    slots.acquire(PRIORITY_INTERACTIVE)
+    slots.release(PRIORITY_INTERACTIVE, held_seconds=5)
+    slots.acquire(PRIORITY_INTERACTIVE)
+
+    with pytest.raises(Overloaded) as rejected:
+        slots.acquire(PRIORITY_INTERACTIVE)
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after == 5
+    assert slots.outstanding() == 1
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    slots = ModelSlots("m", capacity=1, reserved=0, slo_seconds=0)
+
+    async def scenario():
+        await slots.acquire_async(PRIORITY_INTERACTIVE)
+        waiter = asyncio.create_task(slots.acquire_async(PRIORITY_BACKGROUND))
+        await asyncio.sleep(0.05)
+        assert slots.waiting()[PRIORITY_BACKGROUND] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+    assert slots.waiting()[PRIORITY_BACKGROUND] == 0
+    assert slots.outstanding() == 1
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=2)
+
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(0.5)
+
+    now[0] += 0.5
+    assert bucket.take() == 0
+    # An idle client gets its burst back, not more
+    now[0] += 60
+    assert [bucket.take() for _ in range(3)] == [0, 0, pytest.approx(0.5)]
+
+
+def test_client_is_rate_limited_when_its_bucket_is_empty():
+    limiter = ClientRateLimiter(rate=0.001, burst=2)
+    limiter.check("a")
+    limiter.check("a")
+    with pytest.raises(RateLimited) as rejected:
+        limiter.check("a")
+    assert rejected.value.status_code == 429
+    # Buckets are per client
+    limiter.check("b")
+
+
+def test_client_rate_limiting_is_off_by_default():
+    limiter = ClientRateLimiter()
+    for _ in range(100):
+        limiter.check("proxy")
+    assert limiter._buckets == {}
+
+
+def test_check_client_rate_uses_the_process_wide_limiter(monkeypatch):
+    monkeypatch.setattr(admission, "_client_limiter", ClientRateLimiter(rate=0.001, burst=1))
+    admission.check_client_rate("a")
+    with pytest.raises(RateLimited):
+        admission.check_client_rate("a")
@@ -0,0 +1,151 @@
+import pytest
+
+import app
+
+
+def test_summarize_document_uses_a_single_prompt_for_short_texts(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, "SUMMARY_MODE", "auto")
+    monkeypatch.setattr(app, "generate_summary_with_deepseek", lambda *args: calls.append(args) or "summary")
+    monkeypatch.setattr(app, "generate_chunked_summary_with_deepseek", lambda *args: pytest.fail("chunked"))
+
+    assert app.summarize_document("job", "short text", "figures") == "summary"
+    assert calls == [("short text", "figures", None, None)]
+
+
+def test_summarize_document_goes_through_map_reduce_past_the_context(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, "SUMMARY_MODE", "auto")
+    monkeypatch.setattr(app, "SUMMARY_CONTEXT_TOKENS", 10)
+    monkeypatch.setattr(app, "generate_summary_with_deepseek", lambda *args: pytest.fail("single prompt"))
+    monkeypatch.setattr(app, "generate_chunked_summary_with_deepseek", lambda text, *args: calls.append(text) or "summary")
+
+    assert app.summarize_document("job", "x" * 100, "figures") == "summary"
+    assert calls == ["x" * 100]
+
+
+def test_parse_labels_keeps_known_labels_in_answer_order():
+    raw = "<think>Maybe bug, maybe docs</think>\n**Performance**, `bug`, performance, frontend"
+    assert app.parse_labels(raw) == ["performance", "bug", "frontend"]
+
+
+def test_parse_labels_caps_the_count_and_matches_case_insensitively():
+    assert app.parse_labels("bug, Feature, ci/cd, testing") == ["bug", "feature", "CI/CD"]
+    assert app.parse_labels('["priority: high", "backend"]') == ["priority: high", "backend"]
+
+
+def test_parse_labels_reads_labels_out_of_prose():
+    assert app.parse_labels("This looks like a security issue in the backend.") == ["security", "backend"]
+    # Labels inside other words do not count
+    assert app.parse_labels("The frontend-bugfix branch") == ["triage"]
+
+
+def test_parse_labels_falls_back_to_triage():
+    assert app.parse_labels("") == ["triage"]
+    assert app.parse_labels("<think>bug</think>I cannot tell.") == ["triage"]
+
+
+@pytest.fixture
+def retrieval(monkeypatch):
+    """Stub the embedding and vector store of /ask, recording the top_k it retrieves"""
+    calls = []
+
+    class Client:
+        def embed(self, model, texts, priority=None):
+            return [[1.0, 0.0]]
+
+    monkeypatch.setattr(app, "get_client", lambda backend: Client())
+    monkeypatch.setattr(app, "connect_vector_store", lambda: None)
+    monkeypatch.setattr(app, "query_similar_text", lambda client, vector, top_k, **filters: calls.append(top_k) or [])
+    return calls
+
+
+@pytest.mark.parametrize("top_k, expected", [(0, 1), (-5, 1), (3, 3), (2.0, 2), (10 ** 9, app.ASK_MAX_TOP_K)])
+def test_ask_clamps_top_k(retrieval, top_k, expected):
+    response = app.app.test_client().post("/ask", json={"question": "why?", "top_k": top_k})
+    assert response.status_code == 404
+    assert retrieval == [expected]
+
+
+def test_ask_searches_only_the_question_embedding_model(retrieval, monkeypatch):
+    filters = []
+    monkeypatch.setattr(app, "query_similar_text", lambda client, vector, top_k, **kwargs: filters.append(kwargs) or [])
+    app.app.test_client().post("/ask", json={"question": "why?", "doc_hash": "abc"})
+    assert filters == [{"doc_hash": "abc", "embedding_model": app.EMBEDDING_MODEL_NAME}]
+
+
+def test_ask_about_a_job_without_an_ingested_document(retrieval, monkeypatch):
+    ingested = set()
+    monkeypatch.setattr(app, "has_document", lambda store, doc_hash, model: (doc_hash, model) in ingested)
+    app.job_store.create("text-job", {"status": app.STATUS_COMPLETED})
+    app.job_store.create("pdf-job", {"status": app.STATUS_PROCESSING_TEXT, "pdf_hash": "abc"})
+    client = app.app.test_client()
+
+    # Neither searches the whole corpus
+    assert client.post("/ask", json={"question": "why?", "job_id": "text-job"}).status_code == 404
+    response = client.post("/ask", json={"question": "why?", "job_id": "pdf-job"})
+    assert response.status_code == 409
+    assert response.get_json()["status"] == app.STATUS_PROCESSING_TEXT
+    assert retrieval == []
+
+    ingested.add(("abc", app.EMBEDDING_MODEL_NAME))
+    assert client.post("/ask", json={"question": "why?", "job_id": "pdf-job"}).status_code == 404
+    assert retrieval == [app.ASK_TOP_K]
+
+
+@pytest.mark.parametrize("top_k", ["many", None, True, 2.5, [3], float("nan"), float("inf")])
+def test_ask_rejects_invalid_top_k(retrieval, top_k):
+    response = app.app.test_client().post("/ask", json={"question": "why?", "top_k": top_k})
+    assert response.status_code == 400
+    assert retrieval == []
+
+
+def test_summary_payload_sends_pasted_text_as_is(monkeypatch):
+    monkeypatch.setattr(app, "token_budget", lambda model: 1000)
+    text = "Intro\n\nPage 1 header\n\nReferences\n[1] A paper, 2020.\n"
+    assert text in app.summary_payload(text, "m")["prompt"]
+    assert app.input_headers(app.ROUTE_SUMMARIZE, text, "m") == {}
+
+
+def test_summary_payload_trims_past_the_budget_and_says_so(monkeypatch):
+    monkeypatch.setattr(app, "token_budget", lambda model: 100)
+    text = " ".join(f"word{i}" for i in range(1000))
+    prompt = app.summary_payload(text, "m")["prompt"]
+
+    assert text not in prompt and "word0 " in prompt and "word999" in prompt
+    sent, received = app.input_headers(app.ROUTE_SUMMARIZE, text, "m")[app.TRIMMED_HEADER].split("/")
+    assert int(sent) <= 100 < int(received) == app.estimate_tokens(text)
+    assert app.input_headers(app.ROUTE_LABELS, text, "m") == {}
+
+
+def test_summarize_reports_a_trimmed_text(monkeypatch):
+    prompts = []
+
+    class Stream:
+        status_code = 200
+
+        def iter_chunks(self):
+            yield {"response": "A summary."}
+
+        def close(self):
+            pass
+
+    class Client:
+        def generate(self, payload, stream=False, priority=None):
+            prompts.append(payload["prompt"])
+            return Stream()
+
+    monkeypatch.setattr(app, "get_client", lambda backend: Client())
+    monkeypatch.setattr(app, "token_budget", lambda model: 50)
+    monkeypatch.setattr(app, "get_response_cache", lambda: None)
+    client = app.app.test_client()
+
+    response = client.post("/summarize", json={"text": "Short text.\nReferences\n[1] Kept."})
+    assert response.get_data(as_text=True) == "A summary."
+    assert app.TRIMMED_HEADER not in response.headers
+    assert "References\n[1] Kept." in prompts[-1]
+
+    response = client.post("/summarize", json={"text": "word " * 500})
+    sent, received = response.headers[app.TRIMMED_HEADER].split("/")
+    assert int(sent) <= 50 and received == "625"
+    assert "[...]" in prompts[-1]
@@ -0,0 +1,87 @@
+import asyncio
+import uuid
+
+import httpx
+
+import app
+import asgi_app
+from asgi_app import application
+from job_store import STATE_DONE
+
+
+def finished_job():
+    job_id = uuid.uuid4().hex
+    app.job_store.create(job_id, {"status": app.STATUS_PROCESSING_TEXT}, state=STATE_DONE)
+    app.job_store.add_event(job_id, "status", {"status": app.STATUS_PROCESSING_TEXT})
+    app.job_store.add_event(job_id, "token", {"text": "Sum"})
+    app.job_store.add_event(job_id, "status", {"status": app.STATUS_COMPLETED})
+    app.job_store.update(job_id, status=app.STATUS_COMPLETED)
+    return job_id
+
+
+def call(method, path, **kwargs):
+    async def request():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+
+    return asyncio.run(request())
+
+
+def get(path, headers=None):
+    return call("GET", path, headers=headers)
+
+
+def test_job_events_stream_until_the_job_ends():
+    job_id = finished_job()
+    response = get(f"/job/events/{job_id}")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert [block.split("\n")[1] for block in events] == ["event: status", "event: token", "event: status"]
+    assert '"completed"' in events[-1]
+
+
+def test_job_events_resume_after_last_event_id():
+    job_id = finished_job()
+    first_seq = app.job_store.events_since(job_id)[0][0]
+    response = get(f"/job/events/{job_id}", headers={"Last-Event-ID": str(first_seq)})
+
+    assert f"id: {first_seq}\n" not in response.text
+    assert response.text.count("event: ") == 2
+
+
+def test_job_events_of_an_unknown_job():
+    assert get("/job/events/missing").status_code == 404
+
+
+def test_flask_answers_501_without_sse_max_streams():
+    job_id = finished_job()
+    response = app.app.test_client().get(f"/job/events/{job_id}")
+    assert response.status_code == 501
+    assert f"/job/status/{job_id}" in response.get_json()["error"]
+
+
+def test_summarize_reports_a_trimmed_text(monkeypatch):
+    class Stream:
+        status_code = 200
+
+        async def aiter_chunks(self):
+            yield {"response": "A summary."}
+
+        async def aclose(self):
+            pass
+
+    class Client:
+        async def generate(self, payload, stream=False, priority=None):
+            return Stream()
+
+    monkeypatch.setattr(asgi_app, "get_async_client", lambda backend: Client())
+    monkeypatch.setattr(app, "token_budget", lambda model: 50)
+    monkeypatch.setattr(app, "get_response_cache", lambda: None)
+
+    response = call("POST", "/summarize", json={"text": "word " * 500})
+    assert response.text == "A summary."
+    assert response.headers[app.TRIMMED_HEADER].endswith("/625")
+    assert app.TRIMMED_HEADER not in call("POST", "/summarize", json={"text": "Short."}).headers
@@ -0,0 +1,58 @@
+import os
+
+import pymupdf
+import pytest
+
+import controller
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    """A 12-page PDF with a text layer on every page and a figure on every third"""
+    doc = pymupdf.open()
+    figure = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 16, 16), 0)
+    figure.clear_with(128)
+    for page_num in range(12):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {page_num + 1} of the test document, long enough to skip OCR.")
+        if page_num % 3 == 0:
+            page.insert_image(pymupdf.Rect(72, 100, 172, 200), pixmap=figure)
+    path = str(tmp_path / "document.pdf")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def pages(pdf_path, output_dir, workers):
+    return [
+        (page_number, text, [(os.path.basename(image["path"]), image["page"]) for image in images], source)
+        for page_number, text, images, source in controller.iter_pdf_pages(pdf_path, output_dir, workers=workers)
+    ]
+
+
+def test_page_ranges_cover_every_page_once():
+    assert controller._page_ranges(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert controller._page_ranges(2, 8) == [(0, 1), (1, 2)]
+
+
+def test_iter_pdf_pages_parses_large_documents_in_parallel(pdf_path, tmp_path, monkeypatch):
+    serial = pages(pdf_path, str(tmp_path / "serial"), workers=1)
+    monkeypatch.setattr(controller, "PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(controller, "PARALLEL_RANGE_PAGES", 3)
+    parallel = pages(pdf_path, str(tmp_path / "parallel"), workers=2)
+
+    assert controller._pool is not None
+    assert parallel == serial
+    assert [page[0] for page in serial] == list(range(1, 13))
+    assert serial[3][1].startswith("Page 4 of the test document")
+    assert [page[2] for page in serial if page[2]] == [[(f"page_{n}-image_1.png", n)] for n in (1, 4, 7, 10)]
+    assert {page[3] for page in serial} == {controller.PAGE_SOURCE_TEXT}
+
+
+def test_extract_document_matches_in_parallel(pdf_path, tmp_path, monkeypatch):
+    serial = controller.extract_document(pdf_path, workers=1)
+    monkeypatch.setattr(controller, "PARALLEL_MIN_PAGES", 4)
+    parallel = controller.extract_document(pdf_path, workers=2)
+
+    assert parallel == serial
+    assert serial["text"].count("----- Page ") == 12
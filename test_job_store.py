@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from job_store import JobStore, QueueFull, STATE_QUEUED, STATE_RUNNING
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def age_heartbeats(store, seconds):
+    with store._transaction() as conn:
+        conn.execute("UPDATE jobs SET heartbeat = heartbeat - ?", (seconds,))
+
+
+def test_claim_takes_the_oldest_job_up_to_max_running(store):
+    store.create("a", {"status": "queued"}, {"n": 1})
+    store.create("b", {"status": "queued"}, {"n": 2})
+
+    assert store.claim("w1", max_running=1) == ("a", {"n": 1})
+    assert store.claim("w2", max_running=1) is None
+    assert store.counts() == {STATE_QUEUED: 1, STATE_RUNNING: 1}
+
+    store.finish("a", "w1")
+    assert store.claim("w2", max_running=1) == ("b", {"n": 2})
+
+
+def test_create_rejects_jobs_past_the_queue_bound(store):
+    store.create("a", {}, max_queue=1)
+    with pytest.raises(QueueFull):
+        store.create("b", {}, max_queue=1)
+    assert store.get("b") is None
+
+
+def test_requeue_stale_returns_jobs_whose_owner_stopped(store):
+    store.create("a", {"stage": "extracted"})
+    store.create("b", {})
+    store.claim("dead", max_running=2)
+    store.claim("alive", max_running=2)
+    age_heartbeats(store, 120)
+    store.heartbeat("alive")
+
+    assert store.requeue_stale(stale_seconds=60) == 1
+    assert store.counts() == {STATE_QUEUED: 1, STATE_RUNNING: 1}
+    # The requeued job keeps its record, so the handler can resume from its stage
+    assert store.claim("next", max_running=2) == ("a", {})
+    assert store.get("a") == {"stage": "extracted"}
+
+
+def test_heartbeat_keeps_running_jobs_claimed(store):
+    store.create("a", {})
+    store.claim("w1", max_running=1)
+    age_heartbeats(store, 120)
+    store.heartbeat("w1")
+
+    assert store.requeue_stale(stale_seconds=60) == 0
+    assert store.counts()[STATE_RUNNING] == 1
+
+
+def test_finished_jobs_are_not_requeued(store):
+    store.create("a", {})
+    store.claim("w1", max_running=1)
+    store.finish("a", "w1")
+    age_heartbeats(store, time.time())
+
+    assert store.requeue_stale(stale_seconds=60) == 0
+    assert store.counts() == {STATE_QUEUED: 0, STATE_RUNNING: 0}
+
+
+def test_only_the_current_owner_finishes_a_job(store):
+    store.create("a", {})
+    store.claim("stalled", max_running=1)
+    age_heartbeats(store, 120)
+    store.requeue_stale(stale_seconds=60)
+    store.claim("next", max_running=1)
+
+    assert not store.finish("a", "stalled")
+    assert store.counts() == {STATE_QUEUED: 0, STATE_RUNNING: 1}
+    assert store.finish("a", "next")
+    assert store.counts() == {STATE_QUEUED: 0, STATE_RUNNING: 0}
+
+
+def test_prune_finished_drops_old_jobs_and_their_events(store):
+    for job_id in ("old", "recent", "running"):
+        store.create(job_id, {})
+        store.claim("w1", max_running=3)
+        store.add_event(job_id, "progress", {})
+    store.finish("old", "w1")
+    store.finish("recent", "w1")
+    with store._transaction() as conn:
+        conn.execute("UPDATE jobs SET updated_at = updated_at - 120")
+    store.update("recent", status="done")
+
+    assert store.prune_finished(max_age=60) == 1
+    assert store.get("old") is None and store.events_since("old") == []
+    assert store.get("recent") == {"status": "done"}
+    assert store.get("running") == {} and len(store.events_since("running")) == 1
+
+
+def test_update_merges_fields_and_events_resume_after_a_seq(store):
+    store.create("a", {"status": "queued", "filename": "x.pdf"})
+    store.update("a", status="running")
+    assert store.get("a") == {"status": "running", "filename": "x.pdf"}
+
+    store.add_event("a", "progress", {"page": 1})
+    store.add_event("a", "progress", {"page": 2})
+    first, second = store.events_since("a")
+    assert first[1:] == ("progress", {"page": 1})
+    assert store.events_since("a", first[0]) == [second]
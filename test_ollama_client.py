@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+import urllib3
+
+from ollama_client import AsyncOllamaClient, OllamaClient, OllamaError
+
+
+BASE_URL = "http://ollama.test"
+
+
+def sync_client(monkeypatch, errors):
+    """An OllamaClient whose requests raise `errors` in turn, then answer 200"""
+    client = OllamaClient(BASE_URL, max_retries=3, backoff_factor=0)
+    calls = []
+
+    def post(url, **kwargs):
+        calls.append(url)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"{}"
+        return response
+
+    monkeypatch.setattr(client.session, "post", post)
+    return client, calls
+
+
+def test_connection_errors_are_retried(monkeypatch):
+    client, calls = sync_client(monkeypatch, [requests.ConnectionError("reset"), requests.ConnectTimeout("slow")])
+    response = client.generate({"model": "m"})
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("error", [
+    requests.ReadTimeout("read timed out"),
+    requests.ConnectionError(urllib3.exceptions.ReadTimeoutError(None, "/api/generate", "read timed out")),
+])
+def test_read_timeouts_are_not_retried(monkeypatch, error):
+    client, calls = sync_client(monkeypatch, [error])
+    with pytest.raises(OllamaError, match="timed out"):
+        client.generate({"model": "m"})
+    assert len(calls) == 1
+
+
+def async_calls(errors):
+    """Run a generate call against a transport raising `errors` in turn; return the attempts and the outcome"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return httpx.Response(200, json={})
+
+    async def run():
+        client = AsyncOllamaClient(BASE_URL, max_retries=3, backoff_factor=0)
+        await client.http.aclose()
+        client.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            response = await client.generate({"model": "m"})
+            await response.aclose()
+            return response.status_code
+        except OllamaError as e:
+            return e
+        finally:
+            await client.aclose()
+
+    return calls, asyncio.run(run())
+
+
+def test_async_connection_errors_are_retried():
+    calls, outcome = async_calls([httpx.ConnectError("reset"), httpx.ConnectTimeout("slow")])
+    assert outcome == 200
+    assert len(calls) == 3
+
+
+def test_async_read_timeouts_are_not_retried():
+    calls, outcome = async_calls([httpx.ReadTimeout("read timed out")])
+    assert isinstance(outcome, OllamaError)
+    assert len(calls) == 1
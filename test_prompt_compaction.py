@@ -0,0 +1,41 @@
+from controller import PAGE_BANNER
+from prompt_compaction import TRIM_MARKER, compact_prompt_text, compact_text, fit_to_budget
+from summarizer import estimate_tokens
+
+
+def document(*pages):
+    return "".join(PAGE_BANNER.format(page_number=n) + text for n, text in enumerate(pages, start=1))
+
+
+def test_compact_text_keeps_the_banners_extraction_writes():
+    text = document("text of page 1", "text of page 2")
+    assert compact_text(text)[0] == text
+    assert compact_text(text, keep_page_markers=False)[0] == "text of page 1\n\ntext of page 2"
+
+
+def test_compact_text_drops_running_headers_and_references():
+    bodies = ["Alpha findings", "Beta method", "Gamma results", "Delta discussion"]
+    pages = [f"Journal of Tests\n{body}\nPage {n}" for n, body in enumerate(bodies, start=1)]
+    pages[-1] += "\nReferences\n[1] A paper, 2020.\n[2] Another, 2021."
+    compacted, stats = compact_text(document(*pages), keep_page_markers=False)
+
+    assert "Journal of Tests" not in compacted and "A paper" not in compacted
+    assert compacted == "\n\n".join(bodies)
+    assert stats["header_footer_lines"] == 8 and stats["reference_lines"] == 3
+
+
+def test_fit_to_budget_keeps_the_head_and_tail():
+    text = " ".join(f"word{i}" for i in range(1000))
+    trimmed = fit_to_budget(text, 100)
+
+    assert estimate_tokens(trimmed) <= 100
+    head, tail = trimmed.split(TRIM_MARKER)
+    assert text.startswith(head) and text.endswith(tail)
+    assert fit_to_budget("short", 100) == "short"
+
+
+def test_compact_prompt_text_reports_the_savings():
+    text = document(*[f"Header\nBody {n}" for n in range(1, 5)])
+    compacted, stats = compact_prompt_text(text, "m", budget=False)
+    assert stats["tokens_before"] == estimate_tokens(text)
+    assert stats["saved_tokens"] == stats["tokens_before"] - estimate_tokens(compacted) > 0
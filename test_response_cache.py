@@ -0,0 +1,90 @@
+import pytest
+
+import response_cache
+from response_cache import LOOKUP_EXACT, LOOKUP_MISS, LOOKUP_SEMANTIC, ResponseCache, response_key
+
+
+def key(text, model="m", prompt_key="p"):
+    return response_key("labels", model, prompt_key, text)
+
+
+def test_exact_key_ignores_case_and_whitespace_only():
+    assert key("  The Build\n is  failing ").key == key("the build is failing").key
+
+    # preprocess_text would drop all of these differences
+    assert key("The build is not failing on CI").key != key("The build is failing on CI").key
+    assert key("Error 404 on login").key != key("Error 500 on login").key
+    assert key("Does it work?").key != key("It does work.").key
+
+
+def test_key_changes_with_the_model_and_prompt():
+    assert key("text", model="a").key != key("text", model="b").key
+    assert key("text", prompt_key="v1").key != key("text", prompt_key="v2").key
+    assert key("text", model="a").scope != key("text", model="b").scope
+
+
+@pytest.mark.parametrize("path", [None, "responses.db"])
+def test_stored_response_is_replayed_on_an_exact_hit(tmp_path, path):
+    cache = ResponseCache(path=str(tmp_path / path) if path else None, semantic=False)
+    miss = cache.lookup(key("The build is failing"))
+    assert miss.result == LOOKUP_MISS
+    cache.store(key("The build is failing"), "bug, devops", "m", miss)
+
+    hit = cache.lookup(key("the build  is FAILING"))
+    assert (hit.result, hit.response, hit.model) == (LOOKUP_EXACT, "bug, devops", "m")
+    assert cache.lookup(key("The build is not failing")).result == LOOKUP_MISS
+
+
+@pytest.mark.parametrize("path", [None, "responses.db"])
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch, path):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(path=str(tmp_path / path) if path else None, ttl=60, semantic=False)
+    cache.store(key("text"), "answer", "m")
+
+    now[0] += 59
+    assert cache.lookup(key("text")).result == LOOKUP_EXACT
+    now[0] += 2
+    assert cache.lookup(key("text")).result == LOOKUP_MISS
+
+
+def test_shared_backend_serves_other_instances(tmp_path):
+    path = str(tmp_path / "responses.db")
+    ResponseCache(path=path, semantic=False).store(key("text"), "answer", "m")
+    assert ResponseCache(path=path, semantic=False).lookup(key("text")).response == "answer"
+
+
+@pytest.fixture
+def embeddings():
+    """Vectors handed out by a stubbed embedding route, keyed by the preprocessed text"""
+    return {}
+
+
+def semantic_cache(embeddings, path=None):
+    cache = ResponseCache(path=path, semantic=True, similarity=0.97)
+    cache.embed = lambda text: ("embed", embeddings[text])
+    return cache
+
+
+@pytest.mark.parametrize("path", [None, "responses.db"])
+def test_semantic_tier_needs_a_close_match_in_the_same_scope(tmp_path, embeddings, path):
+    embeddings.update({
+        "app crashes start": [1.0, 0.0, 0.0],
+        "application crashes startup": [0.99, 0.1, 0.0],
+        "app slow start": [0.8, 0.6, 0.0],
+    })
+    cache = semantic_cache(embeddings, str(tmp_path / path) if path else None)
+    miss = cache.lookup(key("The app crashes on start!"))
+    cache.store(key("The app crashes on start!"), "bug", "m", miss)
+
+    hit = cache.lookup(key("Application crashes at startup"))
+    assert (hit.result, hit.response) == (LOOKUP_SEMANTIC, "bug")
+    # Below the threshold, or under another model, is a miss
+    assert cache.lookup(key("The app is slow on start")).result == LOOKUP_MISS
+    assert cache.lookup(key("Application crashes at startup", model="other")).result == LOOKUP_MISS
+
+
+def test_semantic_tier_is_not_consulted_when_disabled():
+    cache = ResponseCache(path=None, semantic=False)
+    cache.embed = lambda text: pytest.fail("embedded with the semantic tier disabled")
+    assert cache.lookup(key("anything")).result == LOOKUP_MISS
@@ -0,0 +1,43 @@
+import os
+
+from result_cache import ResultCache, make_key
+
+
+def entry(size):
+    # json.dumps adds 12 bytes around the payload
+    return {"data": "x" * (size - 12)}
+
+
+def test_get_returns_what_put_stored(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = make_key("document", 1)
+    assert cache.get("text", key) is None
+    cache.put("text", key, {"text": "hello"})
+    assert cache.get("text", key) == {"text": "hello"}
+    assert make_key("document", 2) != key
+
+
+def test_put_tracks_the_size_without_walking_the_tree(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), max_bytes=10000)
+    cache.put("text", "aa1", entry(100))
+    scans = []
+    monkeypatch.setattr(cache, "_scan", lambda: scans.append(1) or ([], 0))
+
+    cache.put("text", "aa2", entry(100))
+    cache.put("text", "aa1", entry(300))
+    assert scans == []
+    assert cache._size == 400
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=350)
+    for i, key in enumerate(["aa1", "aa2", "aa3"]):
+        cache.put("text", key, entry(100))
+        path = cache._path("text", key)
+        os.utime(path, (1000 + i, 1000 + i))
+    os.utime(cache._path("text", "aa1"), (2000, 2000))  # read most recently
+
+    cache.put("text", "aa4", entry(100))
+    assert cache.get("text", "aa2") is None
+    assert all(cache.get("text", key) is not None for key in ["aa1", "aa3", "aa4"])
+    assert cache._size == 300
@@ -0,0 +1,66 @@
+import threading
+
+from summarizer import CHARS_PER_TOKEN, chunk_text, map_reduce, split_pages
+
+
+def document(*pages):
+    return "".join(f"\n\n----- Page {number} -----\n\n{text}" for number, text in enumerate(pages, start=1))
+
+
+def test_split_pages_reads_the_banners():
+    assert split_pages(document("one", "two")) == [(1, "one"), (2, "two")]
+    assert split_pages("no banners") == [(1, "no banners")]
+
+
+def test_chunk_text_packs_whole_pages_within_the_budget():
+    page = "x" * (10 * CHARS_PER_TOKEN)
+    chunks = chunk_text(document(page, page, page), chunk_tokens=25, overlap_tokens=0)
+
+    assert [(c["index"], c["first_page"], c["last_page"]) for c in chunks] == [(0, 1, 2), (1, 3, 3)]
+    assert all(len(c["text"]) <= 25 * CHARS_PER_TOKEN for c in chunks)
+
+
+def test_chunk_text_splits_long_pages_on_whitespace():
+    words = " ".join(f"w{i:03d}" for i in range(200))
+    chunks = chunk_text(words, chunk_tokens=50, overlap_tokens=0)
+
+    assert len(chunks) > 1
+    assert "".join(c["text"] for c in chunks) == words
+    assert all(c["text"].startswith(" ") or c["index"] == 0 for c in chunks)
+    assert all((c["first_page"], c["last_page"]) == (1, 1) for c in chunks)
+
+
+def test_chunk_text_repeats_the_overlap_at_the_seams():
+    page = "abcdefghij" * 8
+    chunks = chunk_text(document(page, page.upper()), chunk_tokens=20, overlap_tokens=5)
+
+    assert len(chunks) == 2
+    assert chunks[1]["text"].startswith(chunks[0]["text"][-5 * CHARS_PER_TOKEN:])
+    assert chunks[1]["text"].endswith(page.upper())
+
+
+def test_map_reduce_reduces_in_fanout_groups_and_keeps_order():
+    chunks = [{"index": i, "text": str(i)} for i in range(10)]
+    groups = []
+    lock = threading.Lock()
+    progress = []
+
+    def reduce_fn(summaries):
+        with lock:
+            groups.append(summaries)
+        return "(" + "+".join(summaries) + ")"
+
+    result = map_reduce(chunks, lambda chunk: chunk["text"], reduce_fn, fanout=3, max_workers=4,
+                        on_progress=lambda stage, done, total: progress.append((stage, done, total)))
+
+    # 10 summaries -> 4 groups of at most 3 -> 2 groups -> at most fanout remain
+    assert result == ["((0+1+2)+(3+4+5)+(6+7+8))", "((9))"]
+    assert sorted(len(group) for group in groups) == [1, 1, 3, 3, 3, 3]
+    assert progress[-1] == ("reduce_2", 2, 2)
+    assert ("map", 10, 10) in progress
+
+
+def test_map_reduce_skips_the_reduce_when_few_chunks():
+    chunks = [{"text": "a"}, {"text": "b"}]
+    result = map_reduce(chunks, lambda chunk: chunk["text"], lambda summaries: 1 / 0, fanout=4)
+    assert result == ["a", "b"]
@@ -1,10 +1,51 @@
+import multiprocessing
+import os
 import re
 import string
-import nltk
-from nltk.corpus import stopwords
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Stopword list: STOPWORDS_PATH (one word per line) or the bundled copy of NLTK's English list
+STOPWORDS_PATH = os.environ.get(
+    "STOPWORDS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "stopwords_english.txt")
+)
+
+# Batch preprocessing moves to a process pool once a batch holds this many characters
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", os.cpu_count() or 1))
+PREPROCESS_PARALLEL_MIN_CHARS = int(os.environ.get("PREPROCESS_PARALLEL_MIN_CHARS", 4 * 1024 * 1024))
+
+# Punctuation and numbers are deleted in one pass: str.translate is fastest on
+# ASCII text, one regex beats a translate table plus a regex on anything else
+PUNCTUATION_AND_DIGITS_TABLE = str.maketrans('', '', string.punctuation + string.digits)
+PUNCTUATION_AND_DIGITS_PATTERN = re.compile(r'[\d%s]+' % re.escape(string.punctuation))
+
+_stopwords = None
+_stopwords_lock = threading.Lock()
+
+
+def load_stopwords(path=None):
+    """Read a stopword file, one word per line"""
+    with open(path or STOPWORDS_PATH, "r", encoding="utf-8") as f:
+        return frozenset(line.strip() for line in f if line.strip())
+
+
+def get_stopwords():
+    """Return the stopword set, loading it on first use"""
+    global _stopwords
+    if _stopwords is None:
+        with _stopwords_lock:
+            if _stopwords is None:
+                _stopwords = load_stopwords()
+    return _stopwords
+
+
+def __getattr__(name):
+    # STOPWORDS used to be built at import time; keep it available, but lazily
+    if name == "STOPWORDS":
+        return get_stopwords()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-nltk.download('stopwords')
-STOPWORDS = set(stopwords.words('english'))
 
 def preprocess_text(text):
     """
@@ -15,20 +56,36 @@ def preprocess_text(text):
     - Removing stopwords
     - Removing numerical values
     """
-    
-    # Convert to lowercase
+    stopwords = get_stopwords()
+
+    # Lowercase, then drop punctuation and numbers
     text = text.lower()
-    
-    # Remove punctuation
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    
-    # Remove numerical values
-    text = re.sub(r'\d+', '', text)
-    
-    # Remove extra whitespace
-    text = " ".join(text.split())
-    
-    # Remove stopwords
-    text = " ".join([word for word in text.split() if word not in STOPWORDS])
-    
-    return text
+    if text.isascii():
+        text = text.translate(PUNCTUATION_AND_DIGITS_TABLE)
+    else:
+        text = PUNCTUATION_AND_DIGITS_PATTERN.sub('', text)
+
+    # Split on whitespace once and drop stopwords in the same pass
+    return " ".join([word for word in text.split() if word not in stopwords])
+
+
+def preprocess_texts(texts, workers=None):
+    """
+    Preprocess many documents, in a process pool for large batches.
+
+    Args:
+        texts (list): Documents to preprocess
+        workers (int, optional): Pool size; defaults to PREPROCESS_WORKERS. Batches
+            under PREPROCESS_PARALLEL_MIN_CHARS characters run in-process
+
+    Returns:
+        list: preprocess_text output for each document, in order
+    """
+    texts = list(texts)
+    workers = workers or PREPROCESS_WORKERS
+    if workers <= 1 or len(texts) < 2 or sum(len(text) for text in texts) < PREPROCESS_PARALLEL_MIN_CHARS:
+        return [preprocess_text(text) for text in texts]
+
+    chunksize = max(1, len(texts) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(preprocess_text, texts, chunksize=chunksize))
@@ -0,0 +1,88 @@
+import os
+import re
+
+from ollama_client import get_client
+from summarizer import chunk_text, split_pages
+from vector_embedding.service import connect_vector_store, create_schema, has_document, store_embeddings
+
+# Ingestion settings (override through the environment)
+EMBED_CHUNK_TOKENS = int(os.environ.get("EMBED_CHUNK_TOKENS", 256))
+EMBED_CHUNK_OVERLAP_TOKENS = int(os.environ.get("EMBED_CHUNK_OVERLAP_TOKENS", 32))
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 32))
+
+# Section heading written by app.analyze_figure_with_gemma, e.g.
+# "### Analysis of Figure 2 (page_3-image_1.png)"; failed figures use "### Figure 2 (...)"
+FIGURE_SECTION_PATTERN = re.compile(r"^### (Analysis of )?Figure \d+ \(page_(\d+)-image_\d+\.\w+\)", re.MULTILINE)
+
+
+def build_chunks(text_content, image_analysis):
+    """
+    Split a document into embeddable chunks with page metadata.
+
+    Page text is chunked page by page; every figure analysis becomes one chunk
+    attached to the page of its figure.
+
+    Returns:
+        list: Dicts with "text", "page" and "source" ("text" or "figure")
+    """
+    chunks = []
+    for page_num, page_text in split_pages(text_content):
+        if not page_text.strip():
+            continue
+        for chunk in chunk_text(page_text, EMBED_CHUNK_TOKENS, EMBED_CHUNK_OVERLAP_TOKENS):
+            if chunk["text"].strip():
+                chunks.append({"text": chunk["text"].strip(), "page": page_num, "source": "text"})
+
+    matches = list(FIGURE_SECTION_PATTERN.finditer(image_analysis or ""))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(image_analysis)
+        if not match.group(1):
+            continue  # analysis failed, nothing worth retrieving
+        section = image_analysis[match.start():end].strip()
+        chunks.append({"text": section, "page": int(match.group(2)), "source": "figure"})
+
+    return chunks
+
+
+def embed_texts(texts, server_url, model, batch_size=EMBED_BATCH_SIZE):
+    """Embed texts through Ollama's embeddings endpoint, batch_size texts per request"""
+    client = get_client(server_url)
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        embeddings.extend(client.embed(model, texts[start:start + batch_size]))
+    return embeddings
+
+
+def ingest_document(doc_hash, filename, text_content, image_analysis, server_url, model):
+    """
+    Chunk, embed and bulk-load a processed document into the vector store.
+
+    Documents already ingested with the same embedding model (same content
+    hash) are skipped.
+
+    Returns:
+        dict: "status" ("ingested" or "skipped"), "chunks" and "failed" counts
+    """
+    client = connect_vector_store()
+    create_schema(client)
+
+    if has_document(client, doc_hash, model):
+        return {"status": "skipped", "chunks": 0, "failed": 0}
+
+    chunks = build_chunks(text_content, image_analysis)
+    embeddings = embed_texts([chunk["text"] for chunk in chunks], server_url, model)
+
+    items = [
+        (chunk["text"], embedding, {
+            "doc_hash": doc_hash,
+            "filename": filename,
+            "page": chunk["page"],
+            "chunk_index": index,
+            "source": chunk["source"],
+            "embedding_model": model
+        })
+        for index, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+    ]
+    failed = store_embeddings(client, items)
+
+    return {"status": "ingested", "chunks": len(items), "failed": len(failed)}
@@ -0,0 +1,393 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Location and index settings of the in-process vector store (override through the environment)
+LOCAL_VECTOR_STORE_DIR = os.environ.get("LOCAL_VECTOR_STORE_DIR", "vector_store")
+LOCAL_IVF_MIN_VECTORS = int(os.environ.get("LOCAL_IVF_MIN_VECTORS", 50000))
+LOCAL_IVF_NPROBE = int(os.environ.get("LOCAL_IVF_NPROBE", 16))
+
+# Rows scored per matrix product in brute-force search, bounds the temporary score matrix
+SEARCH_BLOCK_ROWS = 65536
+# Training sample per IVF list for k-means
+IVF_TRAIN_PER_LIST = 64
+IVF_TRAIN_ITERATIONS = 10
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, ids, k):
+    """Best k (ids, scores) of one score row, highest first"""
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[part], ids[part]
+    order = np.argsort(-scores, kind="stable")
+    return ids[order], scores[order]
+
+
+class IVFIndex:
+    """
+    Inverted-file index over unit vectors.
+
+    Spherical k-means splits the vectors into nlist clusters; a query only
+    scores the rows of its nprobe closest clusters.
+    """
+
+    def __init__(self, matrix, nlist=None, seed=0):
+        count = len(matrix)
+        self.nlist = nlist or max(1, int(np.sqrt(count)))
+        self.count = count
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, self.nlist * IVF_TRAIN_PER_LIST)
+        sample = np.asarray(matrix[np.sort(rng.choice(count, sample_size, replace=False))])
+        centroids = sample[rng.choice(sample_size, self.nlist, replace=False)]
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        self.centroids = centroids
+
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS])
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def candidates(self, query, nprobe):
+        """Row ids in the nprobe clusters closest to a unit query vector"""
+        nprobe = min(nprobe, self.nlist)
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[i] for i in closest])
+
+
+class LocalVectorStore:
+    """
+    In-process vector store for deployments without Weaviate.
+
+    Vectors are L2-normalised float32 rows appended to <path>/vectors.f32 and
+    memory-mapped for search; texts and properties are appended to
+    <path>/records.jsonl. Queries score all rows with batched matrix products
+    (exact cosine top-k); once the store holds ivf_min_vectors rows an IVF
+    index is built and queries only score the nprobe closest clusters, plus
+    the rows added since the index was built.
+
+    Every gunicorn worker may open the same directory: appends hold an
+    exclusive flock on <path>/store.lock and number their rows from the
+    files, and searches and has_document() first read the rows other
+    processes appended (the records file has grown) under a shared lock.
+    """
+
+    def __init__(self, path=LOCAL_VECTOR_STORE_DIR, ivf_min_vectors=LOCAL_IVF_MIN_VECTORS,
+                 nprobe=LOCAL_IVF_NPROBE):
+        self.path = path
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._records_path = os.path.join(path, "records.jsonl")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock_path = os.path.join(path, "store.lock")
+        os.makedirs(path, exist_ok=True)
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive=True):
+        """
+        Lock the store's files against other processes. flock conflicts
+        between descriptors of one process too, so callers take it once,
+        while holding self._lock.
+        """
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    def _vector_rows(self):
+        """Complete rows in the vectors file"""
+        if not self.dim or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self.dim)
+
+    def _load(self):
+        """Read the store, dropping rows torn by an interrupted append (exclusive file lock held)"""
+        self.dim = None
+        self._read_meta()
+
+        self.records = []
+        if os.path.exists(self._records_path):
+            with open(self._records_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.records.append(json.loads(line))
+                    except ValueError:
+                        break  # torn last line of an interrupted write
+
+        # Vectors and records are appended separately; keep only complete pairs
+        rows = self._vector_rows()
+        count = min(rows, len(self.records))
+        del self.records[count:]
+        if self.dim and rows != count:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(count * 4 * self.dim)
+        self._rewrite_records_if_needed()
+        self._records_offset = os.path.getsize(self._records_path) if os.path.exists(self._records_path) else 0
+
+        self._docs = {}
+        self._models = {}
+        self._ingested = set()
+        for row, record in enumerate(self.records):
+            self._track(row, record)
+        self._map()
+        self._index = None
+
+    def _rewrite_records_if_needed(self):
+        if not os.path.exists(self._records_path):
+            return
+        with open(self._records_path, "r", encoding="utf-8") as f:
+            lines = sum(1 for _ in f)
+        if lines != len(self.records):
+            with open(self._records_path, "w", encoding="utf-8") as f:
+                for record in self.records:
+                    f.write(json.dumps(record) + "\n")
+
+    def _track(self, row, record):
+        model = record.get("embedding_model")
+        if model:
+            self._models.setdefault(model, []).append(row)
+        doc_hash = record.get("doc_hash")
+        if doc_hash:
+            self._docs.setdefault(doc_hash, []).append(row)
+            self._ingested.add((doc_hash, record.get("embedding_model")))
+
+    def _map(self):
+        count = len(self.records)
+        if count:
+            self.matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+        else:
+            self.matrix = np.empty((0, self.dim or 0), dtype=np.float32)
+
+    def _read_new_rows(self):
+        """Append the rows other processes added since the last read (file lock held)"""
+        if self.dim is None:
+            self._read_meta()
+            if self.dim is None:
+                return
+        try:
+            with open(self._records_path, "rb") as f:
+                f.seek(self._records_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        rows = self._vector_rows()
+        added = False
+        for line in data.splitlines(keepends=True):
+            if len(self.records) >= rows or not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self._track(len(self.records), record)
+            self.records.append(record)
+            self._records_offset += len(line)
+            added = True
+        if added:
+            self._map()
+
+    def _refresh(self):
+        """Pick up the rows other processes appended, if the records file has grown"""
+        try:
+            size = os.path.getsize(self._records_path)
+        except OSError:
+            return
+        if size != self._records_offset:
+            with self._lock, self._file_lock(exclusive=False):
+                self._read_new_rows()
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, items):
+        """
+        Append vectors to the store.
+
+        Args:
+            items: Iterable of (text, embedding) or (text, embedding, properties) tuples
+
+        Returns:
+            int: Number of rows added
+        """
+        items = list(items)
+        if not items:
+            return 0
+        vectors = _normalize([item[1] for item in items])
+        records = [{"text": item[0], **(item[2] if len(item) > 2 and item[2] else {})} for item in items]
+
+        with self._lock, self._file_lock():
+            self._read_new_rows()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, the store holds {self.dim}")
+
+            # Every row in the files has been read: anything past them is
+            # left by an append that was interrupted, and is cut off
+            first = len(self.records)
+            if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) != first * 4 * self.dim:
+                with open(self._vectors_path, "r+b") as f:
+                    f.truncate(first * 4 * self.dim)
+            if os.path.exists(self._records_path) and os.path.getsize(self._records_path) != self._records_offset:
+                with open(self._records_path, "r+b") as f:
+                    f.truncate(self._records_offset)
+
+            lines = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._records_path, "ab") as f:
+                f.write(lines)
+            self._records_offset += len(lines)
+
+            for offset, record in enumerate(records):
+                self.records.append(record)
+                self._track(first + offset, record)
+            self._map()
+        return len(items)
+
+    def has_document(self, doc_hash, embedding_model):
+        self._refresh()
+        return (doc_hash, embedding_model) in self._ingested
+
+    def build_index(self, nlist=None):
+        """(Re)build the IVF index over all current rows"""
+        with self._lock:
+            self._index = IVFIndex(self.matrix, nlist) if len(self.records) else None
+            return self._index
+
+    def _current_index(self):
+        if len(self.records) < self.ivf_min_vectors:
+            return None
+        # Rebuild once a quarter of the rows are newer than the index
+        if self._index is None or len(self.records) - self._index.count > self._index.count // 4:
+            self.build_index()
+        return self._index
+
+    def _brute_force(self, queries, top_k, rows=None):
+        """Exact top-k for a (q, dim) block of unit queries over all rows or the given row ids"""
+        results = []
+        matrix = self.matrix
+        if rows is not None:
+            block_scores = np.asarray(matrix[rows]) @ queries.T
+            for q in range(len(queries)):
+                results.append(_top_k(block_scores[:, q], rows, top_k))
+            return results
+
+        best = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))] * len(queries)
+        for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+            block_scores = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS]) @ queries.T
+            ids = np.arange(start, start + len(block_scores))
+            for q in range(len(queries)):
+                merged_ids = np.concatenate([best[q][0], ids])
+                merged_scores = np.concatenate([best[q][1], block_scores[:, q]])
+                best[q] = _top_k(merged_scores, merged_ids, top_k)
+        return best
+
+    def _filtered_rows(self, doc_hash, embedding_model):
+        """Row ids matching the filters, or None when every row does"""
+        rows = None
+        if embedding_model is not None:
+            model_rows = self._models.get(embedding_model, [])
+            if len(model_rows) < len(self.records):
+                rows = np.asarray(model_rows, dtype=np.int64)
+        if doc_hash is not None:
+            doc_rows = np.asarray(self._docs.get(doc_hash, []), dtype=np.int64)
+            rows = doc_rows if rows is None else np.intersect1d(rows, doc_rows, assume_unique=True)
+        return rows
+
+    def search(self, queries, top_k=5, doc_hash=None, embedding_model=None):
+        """
+        Cosine top-k for a batch of query vectors.
+
+        Args:
+            queries: (q, dim) query vectors
+            top_k (int): Results per query
+            doc_hash (str, optional): Only rows of this document
+            embedding_model (str, optional): Only rows embedded by this model
+                (other models' vectors live in another space)
+
+        Returns:
+            list: One (row ids, cosine similarities) pair per query, best first
+        """
+        queries = _normalize(queries)
+        self._refresh()
+        with self._lock:
+            if not len(self.records):
+                return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))] * len(queries)
+            rows = self._filtered_rows(doc_hash, embedding_model)
+            if rows is not None:
+                if not len(rows):
+                    return [(rows, np.empty(0, dtype=np.float32))] * len(queries)
+                return self._brute_force(queries, top_k, rows)
+
+            index = self._current_index()
+            if index is None:
+                return self._brute_force(queries, top_k)
+
+            tail = np.arange(index.count, len(self.records))
+            return [
+                self._brute_force(query[None, :], top_k, np.concatenate([index.candidates(query, self.nprobe), tail]))[0]
+                for query in queries
+            ]
+
+    def query(self, query_vector, top_k=5, doc_hash=None, embedding_model=None):
+        """
+        Most similar records to one vector (filters as in search).
+
+        Returns:
+            list: Records with their "distance" (cosine distance, as Weaviate reports it), closest first
+        """
+        ids, scores = self.search([query_vector], top_k, doc_hash, embedding_model)[0]
+        return [
+            {**self.records[row], "distance": float(1.0 - score)}
+            for row, score in zip(ids.tolist(), scores.tolist())
+        ]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_local_store():
+    """Return the process-wide local vector store, opening it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LocalVectorStore()
+        return _store
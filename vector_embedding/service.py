@@ -1,59 +1,226 @@
+import atexit
+import os
+import threading
+
 import weaviate
-import json
+from weaviate.classes.config import Configure, DataType, Property, Tokenization
+from weaviate.classes.query import Filter, MetadataQuery
+from weaviate.exceptions import UnexpectedStatusCodeError
+
+from vector_embedding.local_store import LocalVectorStore, get_local_store
+
+# Connection settings (override through the environment)
+WEAVIATE_HOST = os.environ.get("WEAVIATE_HOST", "localhost")
+WEAVIATE_PORT = int(os.environ.get("WEAVIATE_PORT", 8080))
+WEAVIATE_GRPC_PORT = int(os.environ.get("WEAVIATE_GRPC_PORT", 50051))
+
+# Vector store backend: "weaviate", "local" (in-process, see local_store.py),
+# or "auto" (Weaviate when reachable, otherwise the local store)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "auto")
+
+COLLECTION_NAME = "TextEmbedding"
+
+# Per-chunk metadata returned alongside the text by query_similar_text
+CHUNK_METADATA_PROPERTIES = ("doc_hash", "filename", "page", "chunk_index", "source")
+
+# Batch ingestion settings: a fixed batch size, or Weaviate's dynamic batching when unset
+BATCH_SIZE = int(os.environ.get("WEAVIATE_BATCH_SIZE", 0)) or None
+BATCH_CONCURRENT_REQUESTS = int(os.environ.get("WEAVIATE_BATCH_CONCURRENT_REQUESTS", 2))
+
+_client = None
+_client_lock = threading.Lock()
+_backend = None
+
 
 def connect_weaviate():
     """
-    Establishes a connection to the Weaviate instance.
+    Returns the shared connection to the Weaviate instance.
+
+    The client is created on first use and reused afterwards, so its HTTP and
+    gRPC connections are pooled across calls. It is closed at interpreter exit.
+    """
+    global _client
+    with _client_lock:
+        if _client is None or not _client.is_connected():
+            _client = weaviate.connect_to_local(
+                host=WEAVIATE_HOST,
+                port=WEAVIATE_PORT,
+                grpc_port=WEAVIATE_GRPC_PORT
+            )
+            atexit.register(_client.close)
+        return _client
+
+
+def connect_vector_store():
+    """
+    Returns the vector store selected by VECTOR_BACKEND.
+
+    In "auto" mode the first call tries Weaviate and falls back to the local
+    store if it cannot be reached; the choice then holds for the process.
+    Every function below accepts either store as its `client`.
     """
-    client = weaviate.Client("http://localhost:8080")  
-    return client
+    global _backend
+    if _backend is None:
+        if VECTOR_BACKEND == "local":
+            _backend = "local"
+        elif VECTOR_BACKEND == "weaviate":
+            _backend = "weaviate"
+        else:
+            try:
+                connect_weaviate()
+                _backend = "weaviate"
+            except Exception as e:
+                print(f"Weaviate unavailable ({str(e)}), using the local vector store")
+                _backend = "local"
+    return get_local_store() if _backend == "local" else connect_weaviate()
+
 
 def create_schema(client):
     """
-    Defines and creates a schema in Weaviate.
-    """
-    schema = {
-        "classes": [
-            {
-                "class": "TextEmbedding",
-                "description": "Store vector embeddings of texts",
-                "vectorizer": "text2vec-openai",
-                "properties": [
-                    {
-                        "name": "text",
-                        "dataType": ["string"],
-                        "description": "Original text data"
-                    },
-                    {
-                        "name": "embedding",
-                        "dataType": ["number[]"],
-                        "description": "Vector representation of text"
-                    }
-                ]
-            }
-        ]
-    }
-    client.schema.create(schema)
+    Creates the TextEmbedding collection if it does not exist yet.
+
+    Vectors are supplied by the caller and stored as each object's native
+    vector (no server-side vectorizer, no duplicate vector property).
+    Safe to call on every start-up.
+    """
+    if isinstance(client, LocalVectorStore):
+        return client
+
+    if client.collections.exists(COLLECTION_NAME):
+        return client.collections.get(COLLECTION_NAME)
+
+    try:
+        return client.collections.create(
+            name=COLLECTION_NAME,
+            description="Store vector embeddings of texts",
+            vectorizer_config=Configure.Vectorizer.none(),
+            properties=[
+                Property(name="text", data_type=DataType.TEXT, description="Original text data"),
+                Property(name="doc_hash", data_type=DataType.TEXT, tokenization=Tokenization.FIELD,
+                         description="SHA-256 of the source document"),
+                Property(name="filename", data_type=DataType.TEXT, tokenization=Tokenization.FIELD,
+                         description="Name of the source document"),
+                Property(name="page", data_type=DataType.INT, description="Page the text comes from"),
+                Property(name="chunk_index", data_type=DataType.INT, description="Position of the chunk in the document"),
+                Property(name="source", data_type=DataType.TEXT, tokenization=Tokenization.FIELD,
+                         description="'text' for page text, 'figure' for figure analyses"),
+                Property(name="embedding_model", data_type=DataType.TEXT, tokenization=Tokenization.FIELD,
+                         description="Model that produced the vector")
+            ]
+        )
+    except UnexpectedStatusCodeError:
+        # Another worker created it between the check and the create
+        if client.collections.exists(COLLECTION_NAME):
+            return client.collections.get(COLLECTION_NAME)
+        raise
+
 
-def store_embedding(client, text, embedding):
+def store_embedding(client, text, embedding, properties=None):
     """
     Stores a text and its vector embedding in Weaviate.
     """
-    data_object = {
-        "text": text,
-        "embedding": embedding
-    }
-    client.data_object.create(data_object, "TextEmbedding")
+    if isinstance(client, LocalVectorStore):
+        return client.add([(text, embedding, properties)])
 
-def query_similar_text(client, query_vector, top_k=5):
+    collection = client.collections.get(COLLECTION_NAME)
+    return collection.data.insert(
+        properties={"text": text, **(properties or {})},
+        vector=embedding
+    )
+
+
+def store_embeddings(client, items, batch_size=BATCH_SIZE, concurrent_requests=BATCH_CONCURRENT_REQUESTS):
+    """
+    Stores many texts and their vector embeddings with the batch API.
+
+    Args:
+        client: Weaviate client
+        items: Iterable of (text, embedding) or (text, embedding, properties) tuples
+        batch_size (int, optional): Fixed batch size; dynamic batching if None
+        concurrent_requests (int): Batches in flight with a fixed batch size
+
+    Returns:
+        list: Objects that failed to import (empty on success)
+    """
+    if isinstance(client, LocalVectorStore):
+        client.add(items)
+        return []
+
+    collection = client.collections.get(COLLECTION_NAME)
+    if batch_size:
+        batcher = collection.batch.fixed_size(batch_size=batch_size, concurrent_requests=concurrent_requests)
+    else:
+        batcher = collection.batch.dynamic()
+
+    with batcher as batch:
+        for item in items:
+            text, embedding = item[0], item[1]
+            properties = item[2] if len(item) > 2 else None
+            batch.add_object(
+                properties={"text": text, **(properties or {})},
+                vector=embedding
+            )
+
+    return collection.batch.failed_objects
+
+
+def has_document(client, doc_hash, embedding_model):
+    """
+    Checks whether a document was already ingested with a given embedding model.
+    """
+    if isinstance(client, LocalVectorStore):
+        return client.has_document(doc_hash, embedding_model)
+
+    collection = client.collections.get(COLLECTION_NAME)
+    result = collection.query.fetch_objects(
+        filters=(Filter.by_property("doc_hash").equal(doc_hash)
+                 & Filter.by_property("embedding_model").equal(embedding_model)),
+        limit=1
+    )
+    return len(result.objects) > 0
+
+
+def query_similar_text(client, query_vector, top_k=5, doc_hash=None, embedding_model=None):
     """
     Queries Weaviate for the most similar texts based on a given vector.
+
+    Args:
+        client: Weaviate client
+        query_vector (list): Query embedding
+        top_k (int): Number of results
+        doc_hash (str, optional): Only search chunks of this document
+        embedding_model (str, optional): Only search chunks embedded by this model,
+            the one that embedded query_vector (other models' vectors are not comparable)
+
+    Returns:
+        list: Dicts with "text", "distance" and the chunk metadata
+            (doc_hash, filename, page, chunk_index, source), closest first
     """
-    result = client.query.get("TextEmbedding", ["text"])\
-        .with_near_vector({"vector": query_vector})\
-        .with_limit(top_k)\
-        .do()
-    return result
+    if isinstance(client, LocalVectorStore):
+        return [
+            {"text": hit.get("text"), "distance": hit["distance"],
+             **{name: hit.get(name) for name in CHUNK_METADATA_PROPERTIES}}
+            for hit in client.query(query_vector, top_k, doc_hash, embedding_model)
+        ]
+
+    filters = [Filter.by_property(name).equal(value)
+               for name, value in (("doc_hash", doc_hash), ("embedding_model", embedding_model)) if value]
+    collection = client.collections.get(COLLECTION_NAME)
+    result = collection.query.near_vector(
+        near_vector=query_vector,
+        limit=top_k,
+        filters=Filter.all_of(filters) if filters else None,
+        return_metadata=MetadataQuery(distance=True)
+    )
+    return [
+        {
+            "text": obj.properties.get("text"),
+            "distance": obj.metadata.distance,
+            **{name: obj.properties.get(name) for name in CHUNK_METADATA_PROPERTIES}
+        }
+        for obj in result.objects
+    ]
+
 
 if __name__ == "__main__":
     client = connect_weaviate()
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from vector_embedding.local_store import LocalVectorStore
+
+
+def vector(*values):
+    return np.asarray(values, dtype=np.float32)
+
+
+def rows(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_query_returns_the_closest_records(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.add([
+        ("x", vector(1, 0, 0), {"doc_hash": "a", "embedding_model": "e"}),
+        ("y", vector(0, 1, 0), {"doc_hash": "a", "embedding_model": "e"}),
+        ("xy", vector(1, 1, 0), {"doc_hash": "b", "embedding_model": "e"}),
+    ])
+
+    hits = store.query(vector(2, 0.1, 0), top_k=2)
+    assert [hit["text"] for hit in hits] == ["x", "xy"]
+    assert hits[0]["distance"] == pytest.approx(1 - 2 / np.sqrt(4.01), abs=1e-6)
+    assert [hit["text"] for hit in store.query(vector(1, 0, 0), doc_hash="b")] == ["xy"]
+    assert store.has_document("a", "e") and not store.has_document("a", "other")
+
+
+def test_query_only_compares_vectors_of_one_embedding_model(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.add([
+        ("old", vector(1, 0), {"doc_hash": "a", "embedding_model": "old"}),
+        ("new", vector(0, 1), {"doc_hash": "a", "embedding_model": "new"}),
+        ("other", vector(1, 1), {"doc_hash": "b", "embedding_model": "new"}),
+    ])
+
+    assert [hit["text"] for hit in store.query(vector(1, 0), top_k=3, embedding_model="new")] == ["other", "new"]
+    assert [hit["text"] for hit in store.query(vector(1, 0), doc_hash="a", embedding_model="new")] == ["new"]
+    assert store.query(vector(1, 0), doc_hash="b", embedding_model="old") == []
+    assert store.query(vector(1, 0), embedding_model="unknown") == []
+
+
+def test_add_rejects_another_dimension(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.add([("x", vector(1, 0, 0))])
+    with pytest.raises(ValueError):
+        store.add([("y", vector(1, 0))])
+    assert len(store) == 1
+
+
+def test_ivf_search_finds_exact_matches(tmp_path):
+    data = rows(400)
+    store = LocalVectorStore(str(tmp_path), ivf_min_vectors=100, nprobe=20)
+    store.add((str(i), v) for i, v in enumerate(data))
+
+    for i, (found, _) in enumerate(store.search(data[:20], top_k=1)):
+        assert found.tolist() == [i]
+    assert store._index is not None
+
+
+def test_reopened_store_drops_a_torn_append(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.add([("a", vector(1, 0)), ("b", vector(0, 1))])
+    # An append interrupted between the vectors and records files
+    with open(os.path.join(tmp_path, "vectors.f32"), "ab") as f:
+        f.write(vector(1, 1).tobytes())
+    with open(os.path.join(tmp_path, "records.jsonl"), "a") as f:
+        f.write('{"text": "c"')
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert [record["text"] for record in reopened.records] == ["a", "b"]
+    reopened.add([("d", vector(-1, 0))])
+    assert reopened.query(vector(-1, 0), top_k=1)[0]["text"] == "d"
+    assert [record["text"] for record in LocalVectorStore(str(tmp_path)).records] == ["a", "b", "d"]
+
+
+def test_instances_on_one_directory_see_each_others_rows(tmp_path):
+    first = LocalVectorStore(str(tmp_path))
+    second = LocalVectorStore(str(tmp_path))
+    first.add([("a", vector(1, 0), {"doc_hash": "a", "embedding_model": "e"})])
+    second.add([("b", vector(0, 1), {"doc_hash": "b", "embedding_model": "e"})])
+
+    # Each instance numbers its rows after the ones the other appended
+    for store in (first, second):
+        assert store.has_document("a", "e") and store.has_document("b", "e")
+        assert store.query(vector(0, 1), top_k=1)[0]["text"] == "b"
+        assert store.query(vector(1, 0), top_k=1)[0]["text"] == "a"
+    assert [record["text"] for record in LocalVectorStore(str(tmp_path)).records] == ["a", "b"]
+
+
+def direction(value):
+    """A unit vector of its own for every value, so a row can be matched to its record"""
+    return vector(np.cos(value / 100), np.sin(value / 100))
+
+
+def append_rows(path, worker, count):
+    store = LocalVectorStore(path)
+    for i in range(count):
+        value = worker * count + i
+        store.add([(str(value), direction(value))])
+
+
+def test_processes_appending_concurrently_keep_vectors_and_records_aligned(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=append_rows, args=(str(tmp_path), worker, 25)) for worker in range(3)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+
+    store = LocalVectorStore(str(tmp_path))
+    assert len(store) == 75
+    assert sorted(int(record["text"]) for record in store.records) == list(range(75))
+    for row, record in enumerate(store.records):
+        assert np.allclose(store.matrix[row], direction(int(record["text"])), atol=1e-6)